@@ -1,12 +1,68 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
-from .routes import router as main_router
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
 
-app = FastAPI(
-    title="api",
-    version="0.1.0",
-    description="API",
-)
+def create_app() -> FastAPI:
+    """Builds the application, importing the routers and everything they
+    depend on. Database engines are still only created by the first
+    request that needs one."""
+    from .config import settings
+    from .routes import router as main_router
+    from .services.carts import stop_cart_flusher
+    from .services.password import PasswordHasherBusy
+    from .services.search import TooManyMatches
+    from .utils.timing import RequestTimingMiddleware
 
-app.include_router(main_router)
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        # Workers leave through os._exit, so this is the last chance to
+        # write back cart changes
+        stop_cart_flusher()
+
+    app = FastAPI(
+        title="api",
+        version="0.1.0",
+        description="API",
+        lifespan=lifespan,
+    )
+
+    app.include_router(main_router)
+
+    timing = settings.get("timing", {})
+    if timing.get("enabled", True):
+        app.add_middleware(
+            RequestTimingMiddleware,
+            server_timing=timing.get("server_timing_header", True),
+        )
+
+    @app.exception_handler(PasswordHasherBusy)
+    async def password_hasher_busy_handler(
+        request: Request, exc: PasswordHasherBusy
+    ):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Too many authentication requests, try again"},
+            headers={"Retry-After": "1"},
+        )
+
+    @app.exception_handler(TooManyMatches)
+    async def too_many_matches_handler(request: Request, exc: TooManyMatches):
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": f"{exc}, add terms to narrow it"},
+        )
+
+    return app
+
+
+def __getattr__(name: str):
+    # `api.app:app` (uvicorn) and `from api.app import app` build the app
+    # on first access, importing this module alone stays cheap
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
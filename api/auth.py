@@ -1,19 +1,34 @@
 """Token based auth"""
 
+import hashlib
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Callable, Optional, Union, Annotated
 from functools import partial
+from uuid import UUID
 
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from api.config import settings
-from api.db import engine
+from api.db import get_engines
+from api.metrics import register_collector
 from api.models.user import User
-from api.security import verify_password
+from api.services.password import password_hasher
+from api.utils.cache import TTLCache
+from api.utils.shared_cache import make_cache
+
+try:
+    import jwt as pyjwt
+except ImportError:  # pragma: no cover
+    pyjwt = None
 
 SECRET_KEY = settings.security.secret_key  # pyright: ignore
 ALGORITHM = settings.security.algorithm  # pyright: ignore
@@ -21,6 +36,22 @@ ALGORITHM = settings.security.algorithm  # pyright: ignore
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# Shared between workers with the redis cache backend, so a change made
+# through one worker invalidates the user everywhere
+user_cache = make_cache(
+    "users",
+    maxsize=settings.security.user_cache_maxsize,  # pyright: ignore
+    ttl=settings.security.user_cache_ttl_seconds,  # pyright: ignore
+)
+register_collector("user_cache", user_cache.stats)
+
+# Verified claims by token hash, each entry lives until its token expires
+token_cache = TTLCache(
+    maxsize=settings.security.token_cache_maxsize,  # pyright: ignore
+    ttl=0,
+)
+register_collector("token_cache", token_cache.stats)
+
 
 # Models
 
@@ -62,6 +93,58 @@ def create_jwt_token(
     return encoded_jwt
 
 
+def _jose_decode(token: str) -> dict:
+    return jwt.decode(
+        token,
+        SECRET_KEY,
+        algorithms=[ALGORITHM],  # pyright: ignore
+    )
+
+
+def _pyjwt_decode(token: str) -> dict:
+    try:
+        return pyjwt.decode(
+            token,
+            SECRET_KEY,
+            algorithms=[ALGORITHM],  # pyright: ignore
+        )
+    except pyjwt.PyJWTError as e:
+        raise JWTError(str(e))
+
+
+def _select_jwt_decoder() -> Callable[[str], dict]:
+    backend = settings.security.jwt_backend  # pyright: ignore
+    if backend == "pyjwt":
+        if pyjwt is None:
+            raise RuntimeError(
+                "JWT_BACKEND is pyjwt but PyJWT isn't installed"
+            )
+        return _pyjwt_decode
+    return _jose_decode
+
+
+_decode_jwt = _select_jwt_decoder()
+
+
+def decode_token(token: str) -> dict:
+    """Verified claims of the token, raises JWTError when it is invalid.
+
+    Claims are cached until the token's `exp`, so a token presented again
+    skips the signature check.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        return claims
+
+    claims = _decode_jwt(token)
+    if isinstance(claims.get("exp"), (int, float)):
+        ttl = claims["exp"] - time.time()
+        if ttl > 0:
+            token_cache.set(key, claims, ttl=ttl)
+    return claims
+
+
 create_refresh_token = partial(create_jwt_token, scope="refresh_token")
 create_reset_password_token = partial(create_jwt_token, scope="reset_password")
 create_confirm_account_token = partial(
@@ -69,27 +152,101 @@ create_confirm_account_token = partial(
 )
 
 
-def authenticate_user(
+async def authenticate_user(
     get_user: Callable, username: str, password: str
 ) -> Union[User, bool]:
     """Authenticate the user"""
-    user = get_user(username)
+    user = await get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await password_hasher.verify(password, user.password):
         return False
     return user
 
 
-def get_user(username) -> Optional[User]:
-    """Get user from database"""
+async def _cache_user(user: User):
+    # The password hash never leaves the database, login reads it there
+    snapshot = user.model_dump(exclude={"password"})
+    tags = (f"user:{user.id}",)
+    await user_cache.aset(("username", user.username), snapshot, tags=tags)
+    await user_cache.aset(("id", user.id), snapshot, tags=tags)
+
+
+def _user_from_snapshot(snapshot: dict) -> User:
+    # Every hit gets its own detached instance so a route mutating and
+    # committing it never touches the copy other requests are reading.
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return user
+
+
+async def _get_user_by(key: str, value, query) -> Optional[User]:
+    snapshot = await user_cache.aget((key, value))
+    if snapshot is not None:
+        return _user_from_snapshot(snapshot)
+
+    # A burst of requests for an uncached user runs a single query
+    async with user_cache.alock((key, value)):
+        snapshot = await user_cache.aget((key, value))
+        if snapshot is not None:
+            return _user_from_snapshot(snapshot)
+
+        async with AsyncSession(get_engines().async_engine) as session:
+            user = (await session.exec(query)).first()
+
+        if user is not None:
+            await _cache_user(user)
+    return user
+
+
+async def get_user(username) -> Optional[User]:
+    """Get user from cache or database"""
+    query = select(User).where(User.username == username)
+    return await _get_user_by("username", username, query)
+
+
+async def get_user_for_login(username) -> Optional[User]:
+    """Get user with its password hash from the database"""
     query = select(User).where(User.username == username)
+    async with AsyncSession(get_engines().async_engine) as session:
+        user = (await session.exec(query)).first()
+    if user is not None:
+        await _cache_user(user)
+    return user
+
 
-    with Session(engine) as session:
-        return session.exec(query).first()
+async def get_user_by_id(user_id: UUID) -> Optional[User]:
+    """Get user from cache or database"""
+    query = select(User).where(User.id == user_id)
+    return await _get_user_by("id", user_id, query)
 
 
-def get_current_user_or_raise(
+def invalidate_user(*user_ids: UUID):
+    """Drops every cached entry for the users"""
+    user_cache.invalidate_tags(*(f"user:{user_id}" for user_id in user_ids))
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target: User):
+    # Dropped after commit, a request re-caching the user before that would
+    # still read the old row
+    if (session := object_session(target)) is not None:
+        session.info.setdefault("invalidated_users", set()).add(target.id)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_users_after_commit(session):
+    if user_ids := session.info.pop("invalidated_users", None):
+        user_cache.defer(invalidate_user, *user_ids)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _forget_user_changes(session):
+    session.info.pop("invalidated_users", None)
+
+
+async def get_current_user_or_raise(
     token: str = Depends(oauth2_scheme),
     request: Request = None,
     fresh=False,  # pyright: ignore
@@ -110,11 +267,7 @@ def get_current_user_or_raise(
                 raise credentials_exception
 
     try:
-        payload = jwt.decode(
-            token,
-            SECRET_KEY,
-            algorithms=[ALGORITHM],  # pyright: ignore
-        )
+        payload = decode_token(token)
         username: str = payload.get("sub")  # pyright: ignore
         scope: str = payload.get("scope")  # pyright: ignore
 
@@ -123,7 +276,7 @@ def get_current_user_or_raise(
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(username=token_data.username)
+    user = await get_user(username=token_data.username)
     if user is None:
         raise credentials_exception
     if fresh and (not payload["fresh"] and not user.is_admin):
@@ -132,13 +285,13 @@ def get_current_user_or_raise(
     return user
 
 
-def _try_get_current_user(
+async def _try_get_current_user(
     token: str = Depends(oauth2_scheme), request: Request = None
 ) -> User | None:
     if token is None:
         return None
     try:
-        user = get_current_user_or_raise(token, request)
+        user = await get_current_user_or_raise(token, request)
         return user
     except HTTPException:
         return None
@@ -176,5 +329,7 @@ async def validate_token(
     token: str = Depends(oauth2_scheme), token_scope="access_token"
 ) -> User:
     """Validates user token"""
-    user = get_current_user_or_raise(token=token, token_scope=token_scope)
+    user = await get_current_user_or_raise(
+        token=token, token_scope=token_scope
+    )
     return user
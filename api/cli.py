@@ -1,11 +1,14 @@
+import asyncio
+import sys
+from contextlib import nullcontext
+from typing import Optional
+
 import typer
-import uvicorn
-from sqlmodel import Session
 
 from .config import settings
-from .db import engine
-from .models import User
 
+# Commands import what they need when they run, so `--help` and the
+# commands that don't touch the database start quickly
 cli = typer.Typer(name="API")
 
 
@@ -15,14 +18,52 @@ def run(
     host: str = settings.server.host,
     log_level: str = settings.server.log_level,
     reload: bool = settings.server.reload,
+    workers: int = typer.Option(
+        settings.server.workers,
+        help="Worker processes, 0 for one per CPU. More than one needs the "
+        "redis cache backend and the postgres search backend",
+    ),
+    loop: str = typer.Option(
+        settings.server.loop, help="auto, asyncio or uvloop"
+    ),
+    http: str = typer.Option(
+        settings.server.http, help="auto, h11 or httptools"
+    ),
+    backlog: int = settings.server.backlog,
+    keep_alive: int = typer.Option(
+        settings.server.keep_alive_seconds,
+        help="Seconds an idle connection is kept open",
+    ),
+    graceful_timeout: int = typer.Option(
+        settings.server.graceful_shutdown_seconds,
+        help="Seconds in-flight requests get to finish on shutdown",
+    ),
+    preload: bool = typer.Option(
+        settings.server.preload,
+        help="Import the app once and fork the workers from it",
+    ),
 ):  # pragma: no cover
     """Run the API server."""
-    uvicorn.run(
-        "api.app:app",
+    from .server import check_workers, default_workers, serve
+
+    if not reload:
+        try:
+            check_workers(workers or default_workers())
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="--workers")
+
+    serve(
+        workers=workers,
+        reload=reload,
+        preload=preload,
         host=host,
         port=port,
         log_level=log_level,
-        reload=reload,
+        loop=loop,
+        http=http,
+        backlog=backlog,
+        timeout_keep_alive=keep_alive,
+        timeout_graceful_shutdown=graceful_timeout,
     )
 
 
@@ -31,11 +72,17 @@ def create_user(
     email: str, username: str, password: str, is_admin: bool = False
 ):
     """Create user"""
-    with Session(engine) as session:
+    from sqlmodel import Session
+
+    from .db import get_engines
+    from .models import User
+    from .services.password import password_hasher
+
+    with Session(get_engines().engine) as session:
         user = User(
             email=email,
             username=username,
-            password=password,
+            password=asyncio.run(password_hasher.hash(password)),
             is_admin=is_admin,
         )
         session.add(user)
@@ -43,3 +90,148 @@ def create_user(
         session.refresh(user)
         typer.echo(f"created {username} user")
         return user
+
+
+@cli.command()
+def explain():
+    """EXPLAIN the hot queries, failing on any sequential scan."""
+    from sqlmodel import Session
+
+    from .db import get_engines
+    from .utils.explain import HOT_QUERIES, explain as explain_query
+
+    failed = False
+    with Session(get_engines().engine) as session:
+        for name, query in HOT_QUERIES.items():
+            seq_scans = explain_query(session, query())
+            if seq_scans:
+                failed = True
+                tables = ", ".join(seq_scans)
+                typer.echo(f"SEQ SCAN {name}: {tables}")
+            else:
+                typer.echo(f"ok       {name}")
+    if failed:
+        raise typer.Exit(code=1)
+
+
+@cli.command()
+def email_worker(
+    poll_interval: float = settings.email.poll_interval_seconds,
+    once: bool = False,
+):  # pragma: no cover
+    """Deliver queued emails."""
+    from .db import get_engines
+    from .services.email import build_worker
+
+    worker = build_worker(get_engines().engine)
+    if once:
+        typer.echo(f"processed {worker.run_once()} emails")
+        return
+    worker.run(poll_interval)
+
+
+@cli.command()
+def import_products(
+    path: str = typer.Argument(..., help="CSV or JSONL file, - for stdin"),
+    format: Optional[str] = typer.Option(
+        None, help="csv or jsonl, guessed from the extension by default"
+    ),
+    chunk_size: int = typer.Option(1000, help="Rows upserted per commit"),
+):
+    """Create or update products from a CSV or JSONL file.
+
+    A running API on the memory cache or search backend has to be
+    restarted to see the changes."""
+    from .db import get_engines
+    from .services.catalog import (
+        detect_format,
+        import_products as run,
+        stale_in_running_api,
+    )
+
+    format = detect_format(path, format or ("jsonl" if path == "-" else None))
+
+    def reject(number: int, reason: str):
+        typer.echo(f"row {number}: {reason}", err=True)
+
+    def progress(report):
+        typer.echo(
+            f"{report.rows} rows, {report.rows_per_second:,.0f} rows/s",
+            err=True,
+        )
+
+    with (
+        nullcontext(sys.stdin)
+        if path == "-"
+        else open(path, newline="", encoding="utf-8")
+    ) as file:
+        report = run(
+            get_engines().engine,
+            file,
+            format,
+            chunk_size=chunk_size,
+            on_reject=reject,
+            on_progress=progress,
+        )
+
+    typer.echo(
+        f"imported {report.imported} of {report.rows} rows "
+        f"({report.rejected} rejected) in {report.seconds:.2f}s, "
+        f"{report.rows_per_second:,.0f} rows/s"
+    )
+    if report.imported and (stale := stale_in_running_api()):
+        typer.echo(
+            f"restart the API to refresh its {' and '.join(stale)}",
+            err=True,
+        )
+    if report.rejected:
+        raise typer.Exit(code=1)
+
+
+@cli.command()
+def export_products(
+    path: str = typer.Argument(..., help="CSV or JSONL file, - for stdout"),
+    format: Optional[str] = typer.Option(
+        None, help="csv or jsonl, guessed from the extension by default"
+    ),
+    chunk_size: int = typer.Option(1000, help="Rows fetched at a time"),
+):
+    """Write every product to a CSV or JSONL file."""
+    import time
+
+    from .db import get_engines
+    from .services.catalog import detect_format, export_products as run
+
+    format = detect_format(path, format or ("jsonl" if path == "-" else None))
+    started_at = time.perf_counter()
+    with (
+        nullcontext(sys.stdout)
+        if path == "-"
+        else open(path, "w", newline="", encoding="utf-8")
+    ) as file:
+        exported = run(get_engines().engine, file, format, chunk_size)
+
+    seconds = time.perf_counter() - started_at
+    typer.echo(
+        f"exported {exported} rows in {seconds:.2f}s, "
+        f"{exported / seconds if seconds else 0:,.0f} rows/s",
+        err=True,
+    )
+
+
+@cli.command()
+def importtime(
+    statement: str = "from api.app import app",
+    top: int = typer.Option(15, help="How many modules to list"),
+):
+    """Profile the imports of a statement (python -X importtime)."""
+    from .utils.importtime import profile_import, total_seconds
+
+    timings = profile_import(statement)
+    typer.echo(f"total {total_seconds(timings):.3f}s for: {statement}")
+    typer.echo(f"{'self ms':>9} {'cumul. ms':>10}  module")
+    for timing in sorted(timings, key=lambda t: -t.self_us)[:top]:
+        typer.echo(
+            f"{timing.self_us / 1000:9.1f} {timing.cumulative_us / 1000:10.1f}"
+            f"  {timing.module}"
+        )
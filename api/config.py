@@ -13,10 +13,8 @@ settings = Dynaconf(
     environments=["development", "production", "testing"],
     env_switcher="server_env",
     load_dotenv=False,
+    # Checked when the settings are first read rather than on import
+    validators=[
+        Validator("security.SECRET_KEY", must_exist=True, is_type_of=str),
+    ],
 )
-
-settings.validators.register(
-    Validator("security.SECRET_KEY", must_exist=True, is_type_of=str),
-)
-
-settings.validators.validate()
@@ -1,18 +1,204 @@
-from typing import Annotated
-from fastapi import Depends
+import os
+from threading import Lock
+from types import SimpleNamespace
+from typing import Annotated, Optional
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session as OrmSession
 from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from .config import settings
+from .metrics import register_collector
+from .utils.pool import instrument_pool, pool_options
+from .utils.replicas import ReplicaRouter, read_your_writes_key
+from .utils.timing import instrument_engine
 
-engine = create_engine(
-    settings.db.uri,  # pyright: ignore
-    echo=settings.db.echo,  # pyright: ignore
-    connect_args=settings.db.connect_args,  # pyright: ignore
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def get_async_uri(uri: str) -> str:
+    """Swaps the driver of a sync database uri for its asyncio counterpart"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(
+        hide_password=False
+    )
+
+
+def _async_uri() -> str:
+    return settings.db.get("async_uri") or get_async_uri(
+        settings.db.uri  # pyright: ignore
+    )
+
+
+def _create_engines() -> SimpleNamespace:
+    # Read here rather than at import, so settings changed before the first
+    # use (environment, tests) apply
+    pool_settings = settings.db.get("pool") or {}  # pyright: ignore
+    async_uri = _async_uri()
+
+    engine = create_engine(
+        settings.db.uri,  # pyright: ignore
+        echo=settings.db.echo,  # pyright: ignore
+        connect_args=settings.db.connect_args,  # pyright: ignore
+        **pool_options(settings.db.uri, pool_settings),  # pyright: ignore
+    )
+
+    async_engine = create_async_engine(
+        async_uri,
+        echo=settings.db.echo,  # pyright: ignore
+        connect_args=settings.db.connect_args,  # pyright: ignore
+        **pool_options(async_uri, pool_settings),
+    )
+
+    replica_engines = []
+    for index, replica_uri in enumerate(
+        settings.db.get("replica_uris") or []  # pyright: ignore
+    ):
+        replica_uri = get_async_uri(replica_uri)
+        replica_engine = create_async_engine(
+            replica_uri,
+            echo=settings.db.echo,  # pyright: ignore
+            connect_args=settings.db.connect_args,  # pyright: ignore
+            **pool_options(replica_uri, pool_settings),
+        )
+        replica_engines.append(replica_engine)
+        register_collector(
+            f"db_replica_{index}_pool",
+            instrument_pool(replica_engine.pool).stats,
+        )
+
+    replica_router = ReplicaRouter(
+        async_engine,
+        replica_engines,
+        health_check_interval=settings.db.get(  # pyright: ignore
+            "replica_health_check_seconds", 10
+        ),
+        read_your_writes_seconds=settings.db.get(  # pyright: ignore
+            "read_your_writes_seconds", 5
+        ),
+    )
+
+    instrument_engine(engine)
+    for timed in (async_engine, *replica_engines):
+        instrument_engine(timed.sync_engine)
+
+    register_collector("db_pool", instrument_pool(engine.pool).stats)
+    register_collector(
+        "db_async_pool", instrument_pool(async_engine.pool).stats
+    )
+    register_collector("db_replicas", replica_router.stats)
+
+    return SimpleNamespace(
+        engine=engine,
+        async_engine=async_engine,
+        replica_engines=replica_engines,
+        replica_router=replica_router,
+        async_uri=async_uri,
+    )
+
+
+ENGINE_ATTRIBUTES = (
+    "engine",
+    "async_engine",
+    "replica_engines",
+    "replica_router",
+    "async_uri",
 )
+_engines: Optional[SimpleNamespace] = None
+_engines_lock = Lock()
+
+
+def get_engines() -> SimpleNamespace:
+    """Engines and replica router, created on first use so importing the
+    app doesn't load database drivers or touch the pool settings"""
+    global _engines
+    if _engines is None:
+        with _engines_lock:
+            if _engines is None:
+                _engines = _create_engines()
+    return _engines
+
+
+def __getattr__(name: str):
+    # `from api.db import engine` keeps working, it just creates the
+    # engines at that point
+    if name in ENGINE_ATTRIBUTES:
+        return getattr(get_engines(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _forget_inherited_connections():
+    # Pooled connections opened before a fork belong to the parent, sharing
+    # the sockets would interleave both processes' traffic
+    if _engines is None:
+        return
+    _engines.engine.dispose(close=False)
+    for inherited in (_engines.async_engine, *_engines.replica_engines):
+        inherited.sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_connections)
+
+
+def _track_writer(session: Session, request: Request):
+    if get_engines().replica_router.replicas:
+        session.info["writer"] = read_your_writes_key(request)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _mark_session_wrote(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _pin_writer_to_primary(session):
+    if session.info.pop("wrote", False) and _engines is not None:
+        _engines.replica_router.record_write(session.info.get("writer"))
+
+
+def get_session(request: Request):
+    with Session(get_engines().engine) as session:
+        _track_writer(session, request)
+        yield session
+
+
+async def get_async_session(request: Request):
+    # Objects stay loaded after commit, an expired attribute can't be
+    # lazily refreshed without an explicit await
+    async with AsyncSession(
+        get_engines().async_engine, expire_on_commit=False
+    ) as session:
+        _track_writer(session.sync_session, request)
+        yield session
+
+
+async def get_read_engine(request: Request):
+    """The primary, or a healthy replica unless the client just wrote or
+    the request asked for the primary (`request.state.read_primary`)"""
+    replica_router = get_engines().replica_router
+    if replica_router.replicas and not getattr(
+        request.state, "read_primary", False
+    ):
+        return await replica_router.get_engine(read_your_writes_key(request))
+    return replica_router.primary
 
 
-def get_session():
-    with Session(engine) as session:
+async def get_async_read_session(request: Request):
+    """Session on a read replica, for dependencies that never write"""
+    engine = await get_read_engine(request)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
 
 
 ActiveSession = Annotated[Session, Depends(get_session)]
+AsyncActiveSession = Annotated[AsyncSession, Depends(get_async_session)]
+AsyncReadSession = Annotated[AsyncSession, Depends(get_async_read_session)]
@@ -2,3 +2,9 @@ class ORDER_STATUS:
     WAITING_PAYMENT = "waiting_payment"
     COMPLETED = "completed"
     CANCELLED = "cancelled"
+
+
+class EMAIL_STATUS:
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
@@ -0,0 +1,167 @@
+"""Process-local metrics registry.
+
+Modules owning a counter register a collector returning a flat dict; the
+internal metrics route gathers every collector on each scrape. Labelled
+counters and histograms (request latency, DB time) are kept here too and,
+together with the numeric collector values, rendered in the Prometheus
+text format.
+"""
+
+import math
+import re
+from threading import Lock
+from typing import Callable, Dict, List, Sequence, Tuple
+
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register_collector(name: str, collector: Callable[[], dict]):
+    """Registers `collector` under `name`, replacing any previous one"""
+    _collectors[name] = collector
+
+
+def collect() -> Dict[str, dict]:
+    """Runs every registered collector"""
+    return {name: collector() for name, collector in _collectors.items()}
+
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics: List["_Metric"] = []
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], **extra) -> str:
+        pairs = [*zip(self.labels, key), *extra.items()]
+        if not pairs:
+            return ""
+        escaped = (f'{name}="{_escape(str(value))}"' for name, value in pairs)
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+            *self._samples(),
+        ]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{self._format_labels(key)} {_number(value)}"
+            for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: count in each bucket (not cumulative), sum, count
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self._series.items()
+            ]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = self._format_labels(key, le=_number(bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = self._format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _metric_name(*parts: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(parts))
+
+
+def render_prometheus() -> str:
+    """Every counter and histogram, plus the numeric values of the
+    collectors as `api_<collector>_<key>` gauges"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector, values in collect().items():
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = _metric_name("api", collector, key)
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
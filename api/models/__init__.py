@@ -3,6 +3,7 @@ from .user import User, Address
 from .product import Product, Category
 from .cart import Cart, CartItem
 from .order import Orders, OrderItem, Coupon
+from .email import EmailOutbox
 
 
 __all__ = [
@@ -16,4 +17,5 @@ __all__ = [
     "Orders",
     "OrderItem",
     "Coupon",
+    "EmailOutbox",
 ]
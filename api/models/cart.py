@@ -11,8 +11,9 @@ if TYPE_CHECKING:
 
 class Cart(TimestamppedModel, table=True):
     id: Optional[UUID] = Field(primary_key=True, default_factory=uuid4)
-    user_id: Optional[UUID] = Field(foreign_key="user.id")
-    origin_ip: Optional[str]
+    user_id: Optional[UUID] = Field(foreign_key="user.id", index=True)
+    # Set only on carts created before cart tokens, see routes/v1/cart.py
+    origin_ip: Optional[str] = Field(index=True, default=None)
     order_id: Optional[UUID] = Field(
         foreign_key="orders.id", unique=True, default=None
     )
@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Optional
+from uuid import UUID, uuid4
+
+from sqlalchemy import Index
+from sqlmodel import Field
+
+from api.enums import EMAIL_STATUS
+from api.utils.models import TimestamppedModel
+
+
+class EmailOutbox(TimestamppedModel, table=True):
+    # Pending emails that are due, oldest first
+    __table_args__ = (
+        Index(
+            "ix_emailoutbox_status_next_attempt_at",
+            "status",
+            "next_attempt_at",
+        ),
+    )
+
+    id: Optional[UUID] = Field(primary_key=True, default_factory=uuid4)
+    to: str
+    subject: str
+    html_body: str
+    status: str = Field(default=EMAIL_STATUS.PENDING)
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    last_error: Optional[str] = None
@@ -0,0 +1,35 @@
+"""Eager-loading presets.
+
+Each endpoint that serializes relationships loads them up front with one of
+these option tuples instead of letting every row lazy-load its own:
+
+    session.exec(select(Cart).options(*CART_CHECKOUT))
+
+Many-to-one links use joinedload (one wider row), collections use
+selectinload (one extra `IN (...)` query for the whole page).
+"""
+
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+
+from .cart import Cart, CartItem
+from .order import Orders
+from .product import Product
+
+# Single product, category joined in the same SELECT
+PRODUCT_DETAIL = (joinedload(Product.category),)
+
+# Product listings already `.join(Category)` to filter, so reuse that join
+PRODUCT_LISTING = (contains_eager(Product.category),)
+
+# Cart as rendered by CartResponse
+CART_DETAIL = (selectinload(Cart.items),)
+
+# Cart with everything needed to snapshot it into an order
+CART_CHECKOUT = (
+    selectinload(Cart.items)
+    .joinedload(CartItem.product)
+    .joinedload(Product.category),
+)
+
+# Order as rendered by OrderResponse
+ORDER_DETAIL = (selectinload(Orders.items),)
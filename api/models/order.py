@@ -1,6 +1,7 @@
 from datetime import datetime
 from uuid import UUID, uuid4
 from typing import Optional, List
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 
 from api.utils.models import TimestamppedModel
@@ -8,6 +9,11 @@ from api.enums import ORDER_STATUS
 
 
 class Orders(TimestamppedModel, table=True):
+    # A user's orders, newest first
+    __table_args__ = (
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+    )
+
     id: Optional[UUID] = Field(primary_key=True, default_factory=uuid4)
     order_status: str = Field(default=ORDER_STATUS.WAITING_PAYMENT)
     total_amount: int
@@ -21,7 +27,9 @@ class Orders(TimestamppedModel, table=True):
 
 class OrderItem(SQLModel, table=True):
     sku: str = Field(primary_key=True)
-    order_id: UUID = Field(primary_key=True, foreign_key="orders.id")
+    order_id: UUID = Field(
+        primary_key=True, foreign_key="orders.id", index=True
+    )
 
     name: str
     header: str
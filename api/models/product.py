@@ -1,13 +1,44 @@
 import re
+from decimal import ROUND_HALF_UP, Decimal
 
+from sqlalchemy import Column, Computed, Index, Integer
 from sqlmodel import Field, SQLModel, Relationship
 from pydantic import model_validator
 from typing import Optional
 
 from api.utils.models import TimestamppedModel
 
+SKU_PATTERN = re.compile(r"^[A-Z0-9]{3,24}$")
+
+# Price after the discount in cents, rounded half away from zero. NUMERIC
+# keeps the arithmetic exact on PostgreSQL.
+DISCOUNTED_PRICE_SQL = (
+    "CAST(ROUND(CAST(unit_price AS NUMERIC)"
+    " * (100 - CAST(discount_percentage AS NUMERIC)) / 100) AS INTEGER)"
+)
+
+
+def discounted_price(unit_price: int, discount_percentage: float) -> int:
+    """DISCOUNTED_PRICE_SQL for rows that never reach the database"""
+    price = Decimal(unit_price) * (100 - Decimal(str(discount_percentage)))
+    return int((price / 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def validate_sku(sku: str) -> str:
+    """Upper-cases `sku`, raising ValueError unless it is 3 to 24 letters
+    and digits"""
+    sku = sku.upper()
+    if not SKU_PATTERN.fullmatch(sku):
+        raise ValueError("Invalid SKU")
+    return sku
+
 
 class Product(TimestamppedModel, table=True):
+    # Price range filters and price ordering, sku breaks ties for cursors
+    __table_args__ = (
+        Index("ix_product_discounted_price_sku", "discounted_price", "sku"),
+    )
+
     sku: str = Field(primary_key=True)
     name: str
     header: str
@@ -15,31 +46,24 @@ class Product(TimestamppedModel, table=True):
     cover_image_key: Optional[str] = None
     unit_price: int
     discount_percentage: float = Field(ge=0.0, lt=100.0, default=0.0)
-    category_id: int = Field(foreign_key="category.id")
+    category_id: int = Field(foreign_key="category.id", index=True)
+    # Kept up to date by the database, None until the product is flushed
+    discounted_price: Optional[int] = Field(
+        default=None,
+        sa_column=Column(
+            Integer, Computed(DISCOUNTED_PRICE_SQL, persisted=True)
+        ),
+    )
 
     category: Optional["Category"] = Relationship()
     images: Optional["ProductImage"] = Relationship(back_populates="product")
 
     @model_validator(mode="before")
     def format_and_validate_sku(self):
-        self.sku = self.sku.upper()
-
-        sku_len = len(self.sku)
-        if (
-            not re.fullmatch(r"^[A-Z0-9]+$", self.sku)
-            or sku_len < 3
-            or sku_len > 24
-        ):
-            raise ValueError("Invalid SKU")
+        self.sku = validate_sku(self.sku)
 
         return self
 
-    @property
-    def discounted_price(self) -> int:
-        if self.discount_percentage > 0:
-            return (self.unit_price / 100) * (100 - self.discount_percentage)
-        return self.unit_price
-
     @property
     def category_name(self) -> str:
         return self.category.name
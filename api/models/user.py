@@ -53,6 +53,6 @@ class Address(TimestamppedModel, table=True):
     state: str
     country: str
     zip_code: str
-    user_id: UUID = Field(foreign_key="user.id")
+    user_id: UUID = Field(foreign_key="user.id", index=True)
 
     user: Optional[User] = Relationship(back_populates="addresses")
@@ -3,10 +3,10 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from api.config import settings
-from api.db import ActiveSession
+from api.db import AsyncActiveSession
 from api.models import User
-from api.security import get_password_hash
-from api.services.email import EmailService
+from api.services.email import reset_password_email
+from api.services.password import password_hasher
 from api.serializers.auth import ForgotPassword, ChangePassword
 from api.auth import (
     Token,
@@ -17,6 +17,7 @@ from api.auth import (
     create_reset_password_token,
     validate_token,
     get_user,
+    get_user_for_login,
 )
 
 
@@ -33,7 +34,9 @@ router = APIRouter()
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
 ):
-    user = authenticate_user(get_user, form_data.username, form_data.password)
+    user = await authenticate_user(
+        get_user_for_login, form_data.username, form_data.password
+    )
     if not user or not isinstance(user, User):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -90,8 +93,8 @@ async def refresh_token(form_data: RefreshToken):
 
 
 @router.post("/forgot-password", status_code=204)
-async def forgot_password(data: ForgotPassword):
-    user = get_user(data.username)
+async def forgot_password(data: ForgotPassword, session: AsyncActiveSession):
+    user = await get_user(data.username)
     if user is None:
         return
 
@@ -100,12 +103,13 @@ async def forgot_password(data: ForgotPassword):
         data={"sub": user.username, "fresh": False},
         expires_delta=token_expires,
     )
-    EmailService().send_reset_password_email(token, user.email)
+    session.add(reset_password_email(token, user.email))
+    await session.commit()
 
 
 @router.post("/change-password", status_code=204)
-async def change_password(data: ChangePassword, session: ActiveSession):
+async def change_password(data: ChangePassword, session: AsyncActiveSession):
     user = await validate_token(token=data.token, token_scope="reset_password")
-    user.password = get_password_hash(data.password)
+    user.password = await password_hasher.hash(data.password)
     session.add(user)
-    session.commit()
+    await session.commit()
@@ -0,0 +1,43 @@
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+
+from api.config import settings
+from api.metrics import collect, render_prometheus
+
+METRICS_TOKEN = settings.metrics.token  # pyright: ignore
+
+
+def require_metrics_token(request: Request):
+    """Internal routes answer only to `Authorization: Bearer <token>` with
+    the configured metrics token, and don't exist while it is unset"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.encode(), METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+router = APIRouter(
+    include_in_schema=False, dependencies=[Depends(require_metrics_token)]
+)
+
+
+@router.get("/metrics")
+def get_metrics():
+    return collect()
+
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    return PlainTextResponse(
+        render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
@@ -1,23 +1,119 @@
-from fastapi import APIRouter, HTTPException, status, Request
-from sqlmodel import select, update
+from typing import Optional
 
+from fastapi import APIRouter, HTTPException, status, Request, Response
+from sqlmodel import col, select, update
+
+from api.config import settings
 from api.db import ActiveSession
 from api.auth import OAuthenticatedUser, AuthenticatedUser
-from api.models import Cart, CartItem
+from api.models import Cart, Product, User
 from api.serializers.cart import (
     CartResponse,
     CartData,
     CartItemRequest,
+    CartItemsBatch,
     CartItemResponse,
 )
+from api.services.carts import (
+    CartStoreDep,
+    create_cart_token,
+    read_cart_token,
+)
 
 
 router = APIRouter()
 
+TOKEN_COOKIE = settings.carts.token_cookie  # pyright: ignore
+TOKEN_HEADER = settings.carts.token_header  # pyright: ignore
+TOKEN_MAX_AGE = settings.carts.token_max_age_seconds  # pyright: ignore
+IP_FALLBACK = settings.carts.ip_fallback  # pyright: ignore
+
+
+def _set_cart_token(response: Response, cart_id):
+    token = create_cart_token(cart_id)
+    response.set_cookie(
+        TOKEN_COOKIE,
+        token,
+        max_age=TOKEN_MAX_AGE,
+        httponly=True,
+        samesite="lax",
+    )
+    response.headers[TOKEN_HEADER] = token
+
+
+def _anonymous_cart(
+    session, request: Request, response: Response
+) -> Optional[Cart]:
+    """The cart of the token sent in the header or cookie. Clients without
+    one may claim an anonymous cart of their IP created before cart tokens,
+    and are handed its token."""
+    token = request.headers.get(TOKEN_HEADER) or request.cookies.get(
+        TOKEN_COOKIE
+    )
+    cart_id = read_cart_token(token) if token else None
+    if cart_id is not None:
+        return session.get(Cart, cart_id)
+    if not IP_FALLBACK:
+        return None
+
+    # Only carts from before cart tokens have an origin_ip. Claiming one
+    # clears it, so other clients behind the same IP can't take it too.
+    cart = session.exec(
+        select(Cart).where(
+            Cart.origin_ip == request.client.host, col(Cart.user_id).is_(None)
+        )
+    ).first()
+    if cart is None:
+        return None
+    claimed = session.exec(
+        update(Cart)
+        .where(Cart.id == cart.id, Cart.origin_ip == request.client.host)
+        .values(origin_ip=None)
+    ).rowcount
+    session.commit()
+    if not claimed:
+        return None
+
+    _set_cart_token(response, cart.id)
+    return cart
+
+
+def _get_cart(
+    current_user: Optional[User], session, request: Request, response
+) -> Cart:
+    """The user's cart, or the cart of the cart token for anonymous users"""
+    if current_user is not None:
+        cart = session.exec(
+            select(Cart).where(Cart.user_id == current_user.id)
+        ).first()
+    else:
+        cart = _anonymous_cart(session, request, response)
+        # Once synced, a cart is only reachable by its user
+        if cart is not None and cart.user_id is not None:
+            cart = None
+
+    if cart is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="No cart found"
+        )
+    return cart
+
+
+def _cart_data(cart_id, items: dict) -> dict:
+    return {
+        "id": cart_id,
+        "items": [
+            {"product_id": sku, "quantity": quantity}
+            for sku, quantity in items.items()
+        ],
+    }
+
 
 @router.post("/", response_model=CartResponse, status_code=201)
 def create_cart(
-    current_user: OAuthenticatedUser, session: ActiveSession, request: Request
+    current_user: OAuthenticatedUser,
+    session: ActiveSession,
+    response: Response,
 ):
     if current_user is not None:
         user_cart = session.exec(
@@ -30,8 +126,7 @@ def create_cart(
             )
 
     data = CartData(
-        user_id=current_user.id if current_user is not None else None,
-        origin_ip=request.client.host,
+        user_id=current_user.id if current_user is not None else None
     )
     cart = Cart.model_validate(data)
 
@@ -39,44 +134,36 @@ def create_cart(
     session.commit()
     session.refresh(cart)
 
-    return {"data": cart}
+    if current_user is None:
+        _set_cart_token(response, cart.id)
+
+    return {"data": _cart_data(cart.id, {})}
 
 
 @router.get("/current", response_model=CartResponse)
 def get_current_cart(
-    current_user: OAuthenticatedUser, session: ActiveSession, request: Request
+    current_user: OAuthenticatedUser,
+    session: ActiveSession,
+    request: Request,
+    response: Response,
+    cart_store: CartStoreDep,
 ):
-    user_cart = None
-    if current_user is not None:
-        user_cart = session.exec(
-            select(Cart).where(Cart.user_id == current_user.id)
-        ).first()
+    cart_id = _get_cart(current_user, session, request, response).id
 
-        if user_cart is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="No cart found"
-            )
-        return {"data": user_cart}
+    items = cart_store.get_items(session, cart_id)
 
-    ip_cart = session.exec(
-        select(Cart).where(Cart.origin_ip == request.client.host)
-    ).first()
-
-    if ip_cart is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="No cart found"
-        )
-
-    return {"data": ip_cart}
+    return {"data": _cart_data(cart_id, items)}
 
 
 @router.post("/sync_ip_to_user", status_code=204)
 def sync_ip_cart_to_user(
-    current_user: AuthenticatedUser, session: ActiveSession, request: Request
+    current_user: AuthenticatedUser,
+    session: ActiveSession,
+    request: Request,
+    response: Response,
+    cart_store: CartStoreDep,
 ):
-    ip_cart = session.exec(
-        select(Cart).where(Cart.origin_ip == request.client.host)
-    ).first()
+    ip_cart = _anonymous_cart(session, request, response)
 
     if ip_cart is None:
         raise HTTPException(
@@ -92,21 +179,55 @@ def sync_ip_cart_to_user(
         select(Cart).where(Cart.user_id == current_user.id)
     ).first()
 
+    # The anonymous cart is gone or owned by the user from here on
+    response.delete_cookie(TOKEN_COOKIE)
+
     if user_cart is None:
         ip_cart.user_id = current_user.id
         session.commit()
         return
 
-    session.exec(
-        update(CartItem)
-        .where(CartItem.cart_id == ip_cart.id)
-        .values(cart_id=user_cart.id)
-    )
+    cart_store.move_items(session, ip_cart.id, user_cart.id)
 
     session.delete(ip_cart)
     session.commit()
 
 
+@router.put("/items", response_model=CartResponse)
+def update_cart_items(
+    data: CartItemsBatch,
+    current_user: OAuthenticatedUser,
+    session: ActiveSession,
+    request: Request,
+    response: Response,
+    cart_store: CartStoreDep,
+):
+    """Sets the quantity of many items at once, in one transaction.
+    A quantity of 0 removes the item, the last entry wins for repeated
+    SKUs."""
+    cart_id = _get_cart(current_user, session, request, response).id
+    quantities = {item.sku: item.quantity for item in data}
+
+    found = set(
+        session.exec(
+            select(Product.sku).where(col(Product.sku).in_(quantities))
+        ).all()
+    )
+    missing = sorted(set(quantities) - found)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Products not found: {', '.join(missing)}",
+        )
+
+    cart_store.set_quantities(session, cart_id, quantities)
+    session.commit()
+
+    items = cart_store.get_items(session, cart_id)
+
+    return {"data": _cart_data(cart_id, items)}
+
+
 @router.put("/items/{sku}", response_model=CartItemResponse)
 def update_cart_item(
     sku: str,
@@ -114,38 +235,18 @@ def update_cart_item(
     current_user: OAuthenticatedUser,
     session: ActiveSession,
     request: Request,
+    response: Response,
+    cart_store: CartStoreDep,
 ):
-    if current_user is not None:
-        cart = session.exec(
-            select(Cart).where(Cart.user_id == current_user.id)
-        ).first()
-
-        if cart is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="No cart found"
-            )
-    cart = session.exec(
-        select(Cart).where(Cart.origin_ip == request.client.host)
-    ).first()
-
-    if cart is None:
+    # Stored upper-cased by validate_sku, anything else can't match
+    sku = sku.upper()
+    if session.get(Product, sku) is None:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="No cart found"
-        )
-
-    item = session.exec(
-        select(CartItem).where(
-            CartItem.product_id == sku, CartItem.cart_id == cart.id
-        )
-    ).first()
-    if item is None:
-        item = CartItem.model_validate(
-            {**data.model_dump(), **{"product_id": sku, "cart_id": cart.id}}
+            status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
         )
-        session.add(item)
+    cart_id = _get_cart(current_user, session, request, response).id
 
-    item.quantity = data.quantity
+    cart_store.set_quantities(session, cart_id, {sku: data.quantity})
     session.commit()
-    session.refresh(item)
 
-    return item
+    return {"product_id": sku, "quantity": data.quantity}
@@ -1,26 +1,165 @@
-import datetime
-from fastapi import APIRouter, HTTPException, status
-from sqlmodel import select
+from datetime import datetime
+from typing import Annotated, Optional
+from uuid import UUID
 
-from api.db import ActiveSession
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, literal
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from api.db import (
+    ActiveSession,
+    AsyncReadSession,
+    get_engines,
+    get_read_engine,
+)
 from api.auth import AuthenticatedUser
 from api.serializers.order import (
+    MultipleOrderResponse,
     OrderResponse,
     OrderRequest,
-    OrderItemRequest,
     OrderData,
 )
-from api.models import Cart, Orders, Coupon, OrderItem
+from api.models import (
+    Cart,
+    CartItem,
+    Category,
+    Coupon,
+    OrderItem,
+    Orders,
+    Product,
+)
+from api.models.loaders import ORDER_DETAIL
+from api.services.carts import CartStoreDep
+from api.utils.query import paginate_by_cursor
 
 router = APIRouter()
 
+# Cart total in cents, summed over the prices the database keeps
+LINE_TOTAL = func.coalesce(
+    func.sum(Product.discounted_price * CartItem.quantity), 0
+)
+
+# Columns of OrderItem and the cart values each one is snapshotted from
+ORDER_ITEM_SNAPSHOT = {
+    "sku": Product.sku,
+    "name": Product.name,
+    "header": Product.header,
+    "description": Product.description,
+    "cover_image_key": Product.cover_image_key,
+    "unit_price": Product.unit_price,
+    "quantity": CartItem.quantity,
+    "discount_percentage": Product.discount_percentage,
+    "category_name": Category.name,
+}
+
+# Orders are listed newest first, id breaks ties between equal timestamps
+ORDER_SORT_KEY = (Orders.created_at, Orders.id)
+EXPORT_BATCH_SIZE = 500
+
+
+def _user_orders(user_id: UUID):
+    # Items of a whole page come in one extra `IN (...)` query
+    return (
+        select(Orders).where(Orders.user_id == user_id).options(*ORDER_DETAIL)
+    )
+
+
+@router.get("/", response_model=MultipleOrderResponse)
+async def list_orders(
+    current_user: AuthenticatedUser,
+    session: AsyncReadSession,
+    cursor: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 30,
+    count: bool = False,
+):
+    """The user's orders, newest first. Pages are keyset pages, follow
+    `next_cursor`; the row count is skipped unless `count` is set."""
+    return await session.run_sync(
+        paginate_by_cursor,
+        _user_orders(current_user.id),
+        ORDER_SORT_KEY,
+        cursor,
+        limit,
+        count,
+        True,
+    )
+
+
+async def _stream_orders(engine, user_id: UUID):
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        cursor = ""
+        while cursor is not None:
+            page = await session.run_sync(
+                paginate_by_cursor,
+                _user_orders(user_id),
+                ORDER_SORT_KEY,
+                cursor,
+                EXPORT_BATCH_SIZE,
+                False,
+                True,
+            )
+            for order in page["objects"]:
+                line = OrderResponse.model_validate(
+                    {"data": order}, from_attributes=True
+                ).model_dump_json()
+                yield f"{line}\n"
+            cursor = page["next_cursor"]
+            # Only the batch being written is kept in memory
+            session.expunge_all()
+
+
+@router.get("/export")
+async def export_orders(current_user: AuthenticatedUser, request: Request):
+    """Every order of the user as NDJSON, newest first, one OrderResponse
+    per line. Orders are read and sent `EXPORT_BATCH_SIZE` at a time."""
+    engine = await get_read_engine(request)
+    return StreamingResponse(
+        _stream_orders(engine, current_user.id),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/{order_id}", response_model=OrderResponse)
+async def get_order(
+    order_id: UUID, current_user: AuthenticatedUser, session: AsyncReadSession
+):
+    query = _user_orders(current_user.id).where(Orders.id == order_id)
+    order = (await session.exec(query)).first()
+    primary = get_engines().async_engine
+    if order is None and session.bind is not primary:
+        # A replica may not have an order created moments ago yet, e.g.
+        # one linked from the response of POST /v1/orders
+        async with AsyncSession(
+            primary, expire_on_commit=False
+        ) as primary_session:
+            order = (await primary_session.exec(query)).first()
+    if order is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Order not found"
+        )
+
+    return {"data": order}
+
 
 @router.post("/", status_code=201, response_model=OrderResponse)
 def create_order(
-    data: OrderRequest, current_user: AuthenticatedUser, session: ActiveSession
+    data: OrderRequest,
+    current_user: AuthenticatedUser,
+    session: ActiveSession,
+    cart_store: CartStoreDep,
 ):
+    # Items still only in a write-behind cart store go to the database first
+    cart_store.flush_user(session, current_user.id)
+
+    # Cart and its total in one round trip
     cart = session.exec(
-        select(Cart).where(Cart.user_id == current_user.id)
+        select(Cart.id, LINE_TOTAL.label("total_amount"))
+        .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+        .outerjoin(Product, Product.sku == CartItem.product_id)
+        .where(Cart.user_id == current_user.id)
+        .group_by(Cart.id)
     ).first()
 
     if cart is None:
@@ -46,31 +185,38 @@ def create_order(
                 order_data["coupon_code"] = data.coupon_code
                 order_data["discount_percentage"] = coupon.discount_percentage
 
-    total_amount = sum(
-        [i.product.discounted_price * i.quantity for i in cart.items]
-    )
-    order_data["total_amount"] = total_amount
+    total_amount = cart.total_amount
+    order_data["total_amount"] = int(total_amount)
     order_data["total_discounted_amount"] = int(
         (total_amount / 100) * (100 - order_data["discount_percentage"])
     )
 
     order = Orders.model_validate(OrderData(**order_data))
+    order_id = order.id
     session.add(order)
-    session.commit()
-    session.refresh(order)
-
-    for item in cart.items:
-        item_data = {
-            **item.model_dump(),
-            **item.product.model_dump(),
-            "category_name": item.product.category_name,
-            "order_id": order.id,
-        }
-        order_item_data = OrderItemRequest(**item_data)
-        order_item = OrderItem.model_validate(order_item_data)
-        session.add(order_item)
+    session.flush()
 
+    # Snapshot every cart line into the order without loading it in Python
+    session.exec(
+        insert(OrderItem).from_select(
+            ["order_id", *ORDER_ITEM_SNAPSHOT],
+            select(
+                literal(order_id, Orders.__table__.c.id.type),
+                *ORDER_ITEM_SNAPSHOT.values(),
+            )
+            .select_from(CartItem)
+            .join(Product, Product.sku == CartItem.product_id)
+            .join(Category, Category.id == Product.category_id)
+            .where(CartItem.cart_id == cart.id),
+        )
+    )
     session.commit()
-    session.refresh(order)
+
+    order = session.exec(
+        select(Orders)
+        .where(Orders.id == order_id)
+        .options(*ORDER_DETAIL)
+        .execution_options(populate_existing=True)
+    ).one()
 
     return {"data": order}
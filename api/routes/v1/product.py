@@ -1,22 +1,39 @@
-from typing import Optional, List
-from fastapi import APIRouter, HTTPException, status
-from sqlmodel import select, column, col
+from typing import Literal, Optional, List
+from fastapi import APIRouter, HTTPException, Response, status
+from sqlmodel import select
 
-from api.db import ActiveSession
-from api.utils.query import paginate
+from api.config import settings
+from api.db import AsyncReadSession
+from api.utils.query import paginate, paginate_by_cursor
 from api.models import Product, Category
+from api.models.loaders import PRODUCT_DETAIL, PRODUCT_LISTING
+from api.services.search import search_backend
+from api.utils.response_cache import CachedRoute
 from api.serializers.product import (
     BaseMultipleProductsResponse,
     BaseProductResponse,
     CategoryResponse,
+    dump_products_page,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=CachedRoute)
+
+PRODUCT_SORT_KEYS = {
+    "sku": (Product.sku,),
+    "name": (Product.name, Product.sku),
+    "price": (Product.discounted_price, Product.sku),
+}
+
+
+@router.get("/categories", response_model=List[CategoryResponse])
+async def get_categories(session: AsyncReadSession):
+    categories = await session.exec(select(Category).order_by(Category.name))
+    return categories.all()
 
 
 @router.get("/{sku}", response_model=BaseProductResponse)
-async def get_product(sku: str, session: ActiveSession):
-    product = session.get(Product, sku)
+async def get_product(sku: str, session: AsyncReadSession):
+    product = await session.get(Product, sku, options=PRODUCT_DETAIL)
 
     if not product:
         raise HTTPException(
@@ -31,22 +48,60 @@ async def get_products(
     *,
     page: Optional[int] = 1,
     limit: Optional[int] = 30,
+    cursor: Optional[str] = None,
+    count: Optional[bool] = None,
+    sort: Optional[Literal["sku", "name", "price"]] = None,
     name: Optional[str] = None,
-    session: ActiveSession
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    session: AsyncReadSession
 ):
+    """Lists products. Passing `cursor` (empty for the first page) switches
+    to keyset pagination, which skips the row count unless `count` is set.
+
+    `name` is a full-text search over name, header and description. Offset
+    pages of a search are ranked by relevance unless `sort` is given.
+
+    `min_price`, `max_price` and `sort=price` use the discounted price, in
+    cents."""
     filters = {}
-    query = select(Product).join(Category)
+    query = select(Product).join(Category).options(*PRODUCT_LISTING)
 
+    relevance = None
     if name:
-        query = query.where(col(Product.name).icontains(name))
+        query, relevance = await session.run_sync(
+            search_backend.apply, query, name
+        )
         filters["name"] = name
+    if min_price is not None:
+        query = query.where(Product.discounted_price >= min_price)
+        filters["min_price"] = min_price
+    if max_price is not None:
+        query = query.where(Product.discounted_price <= max_price)
+        filters["max_price"] = max_price
+    if sort is not None:
+        filters["sort"] = sort
 
-    paginated_result = paginate(session, query, page, limit)
-
-    return {**paginated_result, "filters": filters}
+    order_by = PRODUCT_SORT_KEYS[sort or "sku"]
+    if relevance is not None and sort is None and cursor is None:
+        order_by = (relevance.desc(), *order_by)
 
+    if cursor is not None:
+        paginated_result = await session.run_sync(
+            paginate_by_cursor, query, order_by, cursor, limit, bool(count)
+        )
+    else:
+        paginated_result = await session.run_sync(
+            paginate,
+            query.order_by(*order_by),
+            page,
+            limit,
+            count is not False,
+        )
 
-@router.get("/categories", response_model=List[CategoryResponse])
-def get_categories(session: ActiveSession):
-    categories = session.exec(select(Category).order_by(Category.name))
-    return categories
+    if settings.get("serializers", {}).get("fast_mode", False):
+        return Response(
+            content=dump_products_page(**paginated_result, filters=filters),
+            media_type="application/json",
+        )
+    return {**paginated_result, "filters": filters}
@@ -20,9 +20,10 @@ from api.serializers.user import (
     UserRequest,
     ConfirmAccountRequest,
 )
-from api.db import ActiveSession
+from api.db import AsyncActiveSession, AsyncReadSession
 from api.models import Address, User
-from api.services.email import EmailService
+from api.services.email import confirmation_email
+from api.services.password import password_hasher
 from api.config import settings
 
 
@@ -32,12 +33,13 @@ router = APIRouter()
 @router.post(
     "/", response_model=UserResponse, status_code=status.HTTP_201_CREATED
 )
-async def create_user(data: UserRequest, session: ActiveSession):
-    user = User.model_validate(data)
+async def create_user(data: UserRequest, session: AsyncActiveSession):
+    hashed_password = await password_hasher.hash(data.password)
+    user = User.model_validate(
+        data.model_copy(update={"password": hashed_password})
+    )
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
 
     if settings.email.enabled is True:
         token_expires = timedelta(minutes=15)
@@ -46,25 +48,31 @@ async def create_user(data: UserRequest, session: ActiveSession):
             expires_delta=token_expires,
         )
 
-        EmailService().send_email_confirmation(token, user.email)
+        # Queued in the signup transaction, the email worker delivers it
+        session.add(confirmation_email(token, user.email))
+
+    await session.commit()
+    await session.refresh(user)
 
     return user
 
 
 @router.post("/confirm_account", status_code=204)
-async def confirm_account(data: ConfirmAccountRequest, session: ActiveSession):
+async def confirm_account(
+    data: ConfirmAccountRequest, session: AsyncActiveSession
+):
     user = await validate_token(data.token, token_scope="confirm_account")
     user.confirmed = True
 
     session.add(user)
-    session.commit()
+    await session.commit()
 
 
 @router.get("/addresses/{id}", response_model=AddressResponse)
 async def get_address(
-    id: UUID, current_user: AuthenticatedUser, session: ActiveSession
+    id: UUID, current_user: AuthenticatedUser, session: AsyncReadSession
 ):
-    address = session.get(Address, id)
+    address = await session.get(Address, id)
     if not address:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Address not found"
@@ -80,10 +88,12 @@ async def get_address(
 
 @router.get("/addresses", response_model=MultipleAddressResponse)
 async def list_user_addresses(
-    current_user: AuthenticatedUser, session: ActiveSession
+    current_user: AuthenticatedUser, session: AsyncReadSession
 ):
-    addresses = session.exec(
-        select(Address).where(Address.user_id == current_user.id)
+    addresses = (
+        await session.exec(
+            select(Address).where(Address.user_id == current_user.id)
+        )
     ).all()
     return {"objects": addresses}
 
@@ -96,15 +106,15 @@ async def list_user_addresses(
 async def create_address(
     data: AddressRequest,
     current_user: AuthenticatedUser,
-    session: ActiveSession,
+    session: AsyncActiveSession,
 ):
     address = Address.model_validate(
         {**data.model_dump(), "user_id": current_user.id}
     )
 
     session.add(address)
-    session.commit()
-    session.refresh(address)
+    await session.commit()
+    await session.refresh(address)
 
     return {"id": address.id, "data": address}
 
@@ -113,10 +123,10 @@ async def create_address(
 async def partial_update_address(
     id: UUID,
     data: PartialUpdateAddress,
-    session: ActiveSession,
+    session: AsyncActiveSession,
     current_user: AuthenticatedUser,
 ):
-    address = session.get(Address, id)
+    address = await session.get(Address, id)
     if not address:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Address not found"
@@ -131,7 +141,7 @@ async def partial_update_address(
     for key, value in patch_data.items():
         setattr(address, key, value)
 
-    session.commit()
-    session.refresh(address)
+    await session.commit()
+    await session.refresh(address)
 
     return {"id": address.id, "data": address}
@@ -27,13 +27,20 @@ class HashedPassword(str):
     class User(SQLModel, table=True):
         username: str
         password: HashedPassword
+
+    Values that already are HashedPassword instances (e.g. hashed by
+    api.services.password) are kept as they are.
     """
 
     @classmethod
     def __get_pydantic_core_schema__(
         cls, _, handler
     ) -> core_schema.CoreSchema:
-        def validate(v):
+        def validate(v, next_validator):
+            if isinstance(v, cls):
+                return v
+
+            v = next_validator(v)
             if not isinstance(v, str):
                 raise TypeError("string required")
 
@@ -44,6 +51,6 @@ class HashedPassword(str):
             # exactly
             return cls(hashed_password)
 
-        return core_schema.no_info_after_validator_function(
+        return core_schema.no_info_wrap_validator_function(
             validate, handler(str)
         )
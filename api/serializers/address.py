@@ -3,6 +3,13 @@ from uuid import UUID
 
 from pydantic import BaseModel, computed_field, Field
 from api.models import Address
+from api.serializers.links import LinkTemplates
+
+ADDRESS_LINKS = LinkTemplates(
+    self=("/address/{id}", "GET"),
+    delete=("/address/{id}", "DELETE"),
+    update=("/address/{id}", "PATCH"),
+)
 
 
 class _AddressResponse(BaseModel):
@@ -22,11 +29,7 @@ class AddressResponse(BaseModel):
     @computed_field
     @property
     def _meta(self) -> Any:
-        links = {
-            "self": {"href": f"/address/{self.id}", "method": "GET"},
-            "delete": {"href": f"/address/{self.id}", "method": "DELETE"},
-            "update": {"href": f"/address/{self.id}", "method": "PATCH"},
-        }
+        links = ADDRESS_LINKS.render(id=self.id)
 
         return {"_links": links}
 
@@ -1,10 +1,46 @@
-from pydantic import BaseModel, Field, computed_field
-from typing import List, Any
+from pydantic import BaseModel, Field, computed_field, field_validator
+from typing import Annotated, List, Any
 from uuid import UUID
 
+from api.models.product import validate_sku
+from api.serializers.links import LinkTemplates
+
+CART_ITEM_LINKS = LinkTemplates(
+    update=("/v1/carts/items/{product_id}", "PUT"),
+    delete=("/v1/carts/items/{product_id}", "DELETE"),
+    product=("/v1/products/{product_id}", "GET"),
+)
+
+CART_LINKS = LinkTemplates(
+    self=("/v1/carts/current", "GET"),
+    add_item=("/v1/carts/items/:product_sku", "PUT"),
+).render()
+
+
+# Items one bulk update may carry, it is one multi-row statement and the
+# bound parameters of every database have a limit
+MAX_CART_ITEMS_PER_UPDATE = 100
+
 
 class CartItemRequest(BaseModel):
-    quantity: int
+    # 0 removes the item from the cart
+    quantity: int = Field(ge=0)
+
+
+class CartItemsRequest(BaseModel):
+    sku: str
+    # 0 removes the item from the cart
+    quantity: int = Field(ge=0)
+
+    @field_validator("sku")
+    @classmethod
+    def format_and_validate_sku(cls, sku: str) -> str:
+        return validate_sku(sku)
+
+
+CartItemsBatch = Annotated[
+    List[CartItemsRequest], Field(max_length=MAX_CART_ITEMS_PER_UPDATE)
+]
 
 
 class CartItemResponse(BaseModel):
@@ -14,20 +50,7 @@ class CartItemResponse(BaseModel):
     @computed_field
     @property
     def _meta(self) -> Any:
-        links = {
-            "update": {
-                "href": f"/v1/carts/items/{self.product_id}",
-                "method": "PUT",
-            },
-            "delete": {
-                "href": f"/v1/carts/items/{self.product_id}",
-                "method": "DELETE",
-            },
-            "product": {
-                "href": f"/v1/products/{self.product_id}",
-                "method": "GET",
-            },
-        }
+        links = CART_ITEM_LINKS.render(product_id=self.product_id)
 
         return {"_links": links}
 
@@ -43,17 +66,8 @@ class CartResponse(BaseModel):
     @computed_field
     @property
     def _meta(self) -> Any:
-        return {
-            "_links": {
-                "self": {"href": f"/v1/carts/current", "method": "GET"},
-                "add_item": {
-                    "href": f"/v1/carts/items/:product_sku",
-                    "method": "PUT",
-                },
-            }
-        }
+        return {"_links": CART_LINKS}
 
 
 class CartData(BaseModel):
     user_id: None | UUID
-    origin_ip: str
@@ -0,0 +1,22 @@
+from typing import Any, Dict, Tuple
+
+
+class LinkTemplates:
+    """HATEOAS links compiled once per response type.
+
+    PRODUCT_LINKS = LinkTemplates(self=("/v1/products/{sku}", "GET"))
+    PRODUCT_LINKS.render(sku="ABC")
+    # {"self": {"href": "/v1/products/ABC", "method": "GET"}}
+    """
+
+    def __init__(self, /, **links: Tuple[str, str]):
+        self._links = [
+            (rel, href.format_map, method)
+            for rel, (href, method) in links.items()
+        ]
+
+    def render(self, /, **values: Any) -> Dict[str, Dict[str, str]]:
+        return {
+            rel: {"href": format_href(values), "method": method}
+            for rel, format_href, method in self._links
+        }
@@ -1,7 +1,22 @@
+from urllib.parse import urlencode
 from uuid import UUID
 from pydantic import BaseModel, computed_field, Field
 from typing import Optional, List, Any
 
+from api.serializers.links import LinkTemplates
+
+ORDER_ITEM_LINKS = LinkTemplates(
+    update=("/v1/orders/{order_id}/items/{sku}", "PUT"),
+    delete=("/v1/orders/{order_id}/items/{sku}", "DELETE"),
+)
+
+ORDER_LINKS = LinkTemplates(
+    self=("/v1/orders/{id}", "GET"),
+    delete=("/v1/orders/{id}", "DELETE"),
+    cancel=("/v1/orders/{id}/cancel", "POST"),
+    add_item=("/v1/orders/{id}/items/:product_sku", "PUT"),
+)
+
 
 class OrderRequest(BaseModel):
     coupon_code: Optional[str] = None
@@ -43,16 +58,7 @@ class OrderItemResponse(BaseModel):
     @computed_field
     @property
     def _meta(self) -> Any:
-        links = {
-            "update": {
-                "href": f"/v1/orders/{self.order_id}/items/{self.sku}",
-                "method": "PUT",
-            },
-            "delete": {
-                "href": f"/v1/orders/{self.order_id}/items/{self.sku}",
-                "method": "DELETE",
-            },
-        }
+        links = ORDER_ITEM_LINKS.render(order_id=self.order_id, sku=self.sku)
 
         return {"_links": links}
 
@@ -74,61 +80,51 @@ class OrderResponse(BaseModel):
     @computed_field
     @property
     def _meta(self) -> Any:
-        links = {
-            "self": {"href": f"/v1/orders/{self.data.id}", "method": "GET"},
-            "delete": {
-                "href": f"/v1/orders/{self.data.id}",
-                "method": "DELETE",
-            },
-            "cancel": {
-                "href": f"/v1/orders/{self.data.id}/cancel",
-                "method": "POST",
-            },
-            "add_item": {
-                "href": f"/v1/orders/{self.data.id}/items/:product_sku",
-                "method": "PUT",
-            },
-        }
+        links = ORDER_LINKS.render(id=self.data.id)
 
         return {"_links": links}
 
 
 class MultipleOrderResponse(BaseModel):
     objects: List[_OrderResponse] = Field(exclude=True)
-    page: int = Field(exclude=True)
     limit: int = Field(exclude=True)
-    total_rows: int = Field(exclude=True)
+    total_rows: Optional[int] = Field(default=None, exclude=True)
+    cursor: Optional[str] = Field(default=None, exclude=True)
+    next_cursor: Optional[str] = Field(default=None, exclude=True)
+    previous_cursor: Optional[str] = Field(default=None, exclude=True)
 
     @computed_field
     @property
     def data(self) -> List[OrderResponse]:
         return [OrderResponse(data=obj) for obj in self.objects]
 
+    def _href(self, cursor: Optional[str]) -> str:
+        params = urlencode({"cursor": cursor or "", "limit": self.limit})
+        return f"/v1/orders?{params}"
+
     @computed_field
     @property
     def _meta(self) -> Any:
         pagination_data = {
-            "page": self.page,
             "limit": self.limit,
             "total_rows": self.total_rows,
+            "next_cursor": self.next_cursor,
+            "previous_cursor": self.previous_cursor,
         }
 
         links = {
-            "self": {
-                "href": f"/v1/orders?page={self.page}&limit={self.limit}",
-                "method": "GET",
-            },
+            "self": {"href": self._href(self.cursor), "method": "GET"},
         }
 
-        if self.page > 1:
+        if self.previous_cursor is not None:
             links["previous"] = {
-                "href": f"/v1/orders?page={self.page-1}&limit={self.limit}",
+                "href": self._href(self.previous_cursor),
                 "method": "GET",
             }
 
-        if self.page * self.limit < self.total_rows:
+        if self.next_cursor is not None:
             links["next"] = {
-                "href": f"/v1/orders?page={self.page+1}&limit={self.limit}",
+                "href": self._href(self.next_cursor),
                 "method": "GET",
             }
 
@@ -1,7 +1,29 @@
 from typing import Optional, Any, List, Dict
-from pydantic import BaseModel, Field, computed_field
+from urllib.parse import urlencode
+from pydantic import (
+    BaseModel,
+    Field,
+    TypeAdapter,
+    computed_field,
+    field_validator,
+)
+from typing_extensions import TypedDict
 
 from api.models import Category, Product
+from api.models.product import validate_sku
+from api.serializers.links import LinkTemplates
+
+PRODUCT_LINKS = LinkTemplates(
+    self=("/v1/products/{sku}", "GET"),
+    category=("/v1/categories/{category_id}", "GET"),
+)
+
+ADMIN_PRODUCT_LINKS = LinkTemplates(
+    self=("/v1/products/{sku}", "GET"),
+    delete=("/v1/products/{sku}", "DELETE"),
+    update=("/v1/products/{sku}", "PATCH"),
+    category=("/v1/categories/{category_id}", "GET"),
+)
 
 
 class CategoryResponse(BaseModel):
@@ -19,6 +41,21 @@ class ProductRequest(BaseModel):
     category_id: int
 
 
+class ProductImportRow(ProductRequest):
+    discount_percentage: float = Field(default=0.0, ge=0.0, lt=100.0)
+
+    @field_validator("sku")
+    @classmethod
+    def format_and_validate_sku(cls, sku: str) -> str:
+        return validate_sku(sku)
+
+    @field_validator("cover_image_key", mode="before")
+    @classmethod
+    def empty_as_none(cls, value):
+        # CSV has no null, an empty cell means no cover image
+        return value or None
+
+
 class PartialProductRequest(BaseModel):
     sku: Optional[str] = None
     name: Optional[str] = None
@@ -38,6 +75,7 @@ class _BaseProductResponse(BaseModel):
     cover_image_key: Optional[str] = None
     unit_price: int
     discount_percentage: float
+    discounted_price: int
 
     category_id: int = Field(exclude=True)
     category: Category = Field(exclude=True)
@@ -54,16 +92,9 @@ class BaseProductResponse(BaseModel):
     @computed_field
     @property
     def _meta(self) -> Any:
-        links = {
-            "self": {
-                "href": f"/v1/products/{self.data.sku}",
-                "method": "GET",
-            },
-            "category": {
-                "href": f"/v1/categories/{self.data.category_id}",
-                "method": "GET",
-            },
-        }
+        links = PRODUCT_LINKS.render(
+            sku=self.data.sku, category_id=self.data.category_id
+        )
 
         return {"_links": links}
 
@@ -72,30 +103,22 @@ class AdminProductResponse(BaseProductResponse):
     @computed_field
     @property
     def _meta(self) -> Any:
-        links = {
-            "self": {"href": f"/v1/products/{self.sku}", "method": "GET"},
-            "delete": {
-                "href": f"/v1/products/{self.sku}",
-                "method": "DELETE",
-            },
-            "update": {
-                "href": f"/v1/products/{self.sku}",
-                "method": "PATCH",
-            },
-            "category": {
-                "href": f"/v1/categories/{self.category_id}",
-                "method": "GET",
-            },
-        }
+        links = ADMIN_PRODUCT_LINKS.render(
+            sku=self.data.sku, category_id=self.data.category_id
+        )
 
         return {"_links": links}
 
 
 class BaseMultipleProductsResponse(BaseModel):
     objects: List[Product] = Field(exclude=True)
-    page: int = Field(exclude=True)
+    page: Optional[int] = Field(default=None, exclude=True)
     limit: int = Field(exclude=True)
-    total_rows: int = Field(exclude=True)
+    total_rows: Optional[int] = Field(default=None, exclude=True)
+    has_next: bool = Field(default=False, exclude=True)
+    cursor: Optional[str] = Field(default=None, exclude=True)
+    next_cursor: Optional[str] = Field(default=None, exclude=True)
+    previous_cursor: Optional[str] = Field(default=None, exclude=True)
     filters: Dict[str, Any] = Field(exclude=True)
 
     @computed_field
@@ -109,38 +132,73 @@ class BaseMultipleProductsResponse(BaseModel):
         ]
         return _data
 
+    def _href(self, **params) -> str:
+        return f"/v1/products?{urlencode({**params, **self.filters})}"
+
     @computed_field
     @property
     def _meta(self) -> Any:
+        if self.page is None:
+            return self._cursor_meta()
+
         pagination_data = {
             "page": self.page,
             "limit": self.limit,
             "total_rows": self.total_rows,
         }
 
-        filter_params = "&".join([f"{k}={v}" for k, v in self.filters.items()])
         links = [
             {
                 "self": {
-                    "href": f"/v1/products?page={self.page}&limit={self.limit}&{filter_params}",
+                    "href": self._href(page=self.page, limit=self.limit),
                     "method": "GET",
                 },
             }
         ]
         if self.page > 1:
             links.append(
-                {
-                    "previous": f"/v1/products?page={self.page-1}&limit={self.limit}&{filter_params}"
-                }
+                {"previous": self._href(page=self.page - 1, limit=self.limit)}
             )
 
-        if self.page * self.limit < self.total_rows:
+        if self.has_next:
+            links.append(
+                {"next": self._href(page=self.page + 1, limit=self.limit)}
+            )
+
+        return {**pagination_data, "_links": links}
+
+    def _cursor_meta(self) -> Any:
+        pagination_data = {
+            "limit": self.limit,
+            "total_rows": self.total_rows,
+            "next_cursor": self.next_cursor,
+            "previous_cursor": self.previous_cursor,
+        }
+
+        links = [
+            {
+                "self": {
+                    "href": self._href(
+                        cursor=self.cursor or "", limit=self.limit
+                    ),
+                    "method": "GET",
+                },
+            }
+        ]
+        if self.previous_cursor is not None:
             links.append(
                 {
-                    "next": f"/v1/products?page={self.page+1}&limit={self.limit}&{filter_params}"
+                    "previous": self._href(
+                        cursor=self.previous_cursor, limit=self.limit
+                    )
                 }
             )
 
+        if self.next_cursor is not None:
+            links.append(
+                {"next": self._href(cursor=self.next_cursor, limit=self.limit)}
+            )
+
         return {**pagination_data, "_links": links}
 
 
@@ -150,3 +208,62 @@ class AdminMultipleProductsResponse(BaseMultipleProductsResponse):
     def data(self) -> List[AdminProductResponse]:
         _data = [AdminProductResponse({"data": obj}) for obj in self.objects]
         return _data
+
+
+# Fast path for product listings: rows go straight to plain dicts and are
+# dumped by pydantic-core in one pass, skipping a BaseProductResponse
+# construction and model_dump per row. Output is identical to
+# BaseMultipleProductsResponse.
+
+
+class _ProductData(TypedDict):
+    sku: str
+    name: str
+    header: str
+    description: str
+    cover_image_key: Optional[str]
+    unit_price: int
+    discount_percentage: float
+    discounted_price: int
+    category_name: str
+
+
+_ProductItem = TypedDict(
+    "_ProductItem", {"data": _ProductData, "_meta": Dict[str, Any]}
+)
+_ProductsPage = TypedDict(
+    "_ProductsPage", {"data": List[_ProductItem], "_meta": Dict[str, Any]}
+)
+_products_page_adapter = TypeAdapter(_ProductsPage)
+
+
+def _product_item(product: Product) -> dict:
+    return {
+        "data": {
+            "sku": product.sku,
+            "name": product.name,
+            "header": product.header,
+            "description": product.description,
+            "cover_image_key": product.cover_image_key,
+            "unit_price": product.unit_price,
+            "discount_percentage": product.discount_percentage,
+            "discounted_price": product.discounted_price,
+            "category_name": product.category.name,
+        },
+        "_meta": {
+            "_links": PRODUCT_LINKS.render(
+                sku=product.sku, category_id=product.category_id
+            )
+        },
+    }
+
+
+def dump_products_page(**paginated_result) -> bytes:
+    """JSON body of BaseMultipleProductsResponse(**paginated_result)"""
+    page = BaseMultipleProductsResponse(**paginated_result)
+    return _products_page_adapter.dump_json(
+        {
+            "data": [_product_item(product) for product in page.objects],
+            "_meta": page._meta,
+        }
+    )
@@ -0,0 +1,155 @@
+"""Multi-process server.
+
+With several workers the parent imports the app and binds the socket once,
+then forks. Everything built at import time (settings, routes, pydantic
+validators, link templates) is shared copy-on-write by the workers instead
+of rebuilt in each one. Every worker runs its own uvicorn Server on the
+inherited socket; the parent replaces workers that die and, on SIGINT or
+SIGTERM, lets them finish in-flight requests before exiting.
+
+Several workers are refused while state that must be the same for every
+worker is kept in each process: the memory cache backend (user and
+response caches, read-your-writes markers), the memory search index and
+the memory cart store.
+"""
+
+import gc
+import logging
+import os
+import signal
+import time
+from typing import List, Set
+
+import uvicorn
+
+from api.config import settings
+
+APP = "api.app:app"
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def per_process_state() -> List[str]:
+    """Settings keeping state that each worker would hold its own copy of"""
+    from api.services.search import configured_backend
+
+    state = []
+    if settings.cache.backend != "redis":  # pyright: ignore
+        state.append('cache.backend = "memory"')
+    if configured_backend() == "memory":
+        state.append('search.backend = "memory"')
+    if settings.carts.store == "memory":  # pyright: ignore
+        state.append('carts.store = "memory"')
+    return state
+
+
+def check_workers(workers: int):
+    """Raises ValueError when `workers` processes would disagree"""
+    if workers > 1 and (state := per_process_state()):
+        raise ValueError(
+            f"{workers} workers would each keep their own copy of "
+            f"{', '.join(state)}, run a single worker or share that state"
+        )
+
+
+class PreforkServer:
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.children: Set[int] = set()
+        self.should_exit = False
+
+    def run(self):
+        self.config.load()
+        sock = self.config.bind_socket()
+        # Move everything allocated so far out of the collector's reach, a
+        # collection in a worker would otherwise write to (and so copy)
+        # every shared page it scans
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        logger.info(f"Started parent process [{os.getpid()}]")
+        try:
+            while not self.should_exit:
+                self._reap()
+                for _ in range(self.workers - len(self.children)):
+                    self._spawn(sock)
+                time.sleep(0.2)
+            self._shutdown()
+        finally:
+            sock.close()
+        logger.info(f"Stopped parent process [{os.getpid()}]")
+
+    def _handle_exit(self, sig, frame):
+        self.should_exit = True
+
+    def _spawn(self, sock):
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 0
+        try:
+            uvicorn.Server(self.config).run(sockets=[sock])
+        except BaseException:
+            logger.exception("Worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _reap(self):
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            self.children.discard(pid)
+            if not self.should_exit:
+                exit_code = os.waitstatus_to_exitcode(status)
+                logger.warning(f"Worker [{pid}] exited with {exit_code}")
+
+    def _shutdown(self):
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+
+        # uvicorn's own graceful timeout plus a margin for its shutdown
+        deadline = (
+            time.monotonic()
+            + (self.config.timeout_graceful_shutdown or 30)
+            + 5
+        )
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+
+        for pid in self.children:
+            logger.warning(f"Killing worker [{pid}]")
+            os.kill(pid, signal.SIGKILL)
+        for pid in list(self.children):
+            os.waitpid(pid, 0)
+        self.children.clear()
+
+
+def serve(
+    workers: int = 1, reload: bool = False, preload: bool = True, **options
+):
+    """Runs the API with `workers` processes (0 for one per CPU).
+    `options` are passed on to uvicorn.Config."""
+    workers = workers or default_workers()
+    if not reload:
+        check_workers(workers)
+    if reload or workers == 1:
+        uvicorn.run(APP, reload=reload, **options)
+    elif preload and hasattr(os, "fork"):
+        PreforkServer(uvicorn.Config(APP, **options), workers).run()
+    else:
+        # Each worker is a fresh interpreter importing the app on its own
+        uvicorn.run(APP, workers=workers, **options)
@@ -0,0 +1,496 @@
+"""Cart item storage.
+
+Cart routes read and change items through the `CartStore` chosen by
+`[default.carts] store`:
+
+* `database` reads and writes `cartitem` directly, every change is a
+  transaction on the primary.
+* `memory` and `redis` keep the items of active carts in a key-value store,
+  loaded from `cartitem` the first time a cart is used. A change only marks
+  the cart dirty; `CartFlusher` writes dirty carts back to `cartitem` in
+  the background and checkout flushes the cart it is about to read.
+  `memory` is the in-process stand-in, for a single worker and tests:
+  changes not yet flushed are lost if the process dies. The server
+  refuses to start several workers on it.
+
+The flusher is stopped, writing back what is left, by the app's lifespan
+shutdown (`stop_cart_flusher`). Workers end with `os._exit`, so atexit
+handlers never run in them.
+
+Cart rows themselves (creation, ownership) always live in the database.
+Anonymous clients find theirs again through a cart token, the cart id
+signed with the secret key (`create_cart_token` / `read_cart_token`).
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from typing import Annotated, Dict, Iterable, List, Optional, Protocol
+from uuid import UUID
+
+from fastapi import Depends
+from sqlalchemy import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, delete, select, update
+
+from api.config import settings
+from api.db import get_engines
+from api.metrics import register_collector
+from api.models import Cart, CartItem, Product
+from api.utils.query import upsert
+
+logger = logging.getLogger(__name__)
+
+
+class CartStore(Protocol):
+    def get_items(self, session: Session, cart_id: UUID) -> Dict[str, int]:
+        """Quantity by product sku"""
+
+    def set_quantities(
+        self, session: Session, cart_id: UUID, quantities: Dict[str, int]
+    ):
+        """Sets the quantity of each sku, 0 removes it. The caller
+        commits."""
+
+    def move_items(self, session: Session, from_cart_id: UUID, to_cart_id):
+        """Moves every item of a cart into another one before the first
+        is deleted. The caller commits."""
+
+    def flush_user(self, session: Session, user_id: UUID):
+        """Writes the user's cart to `cartitem` in `session`, before
+        something reads it there"""
+
+
+def _database_items(session: Session, cart_id: UUID) -> Dict[str, int]:
+    return dict(
+        session.exec(
+            select(CartItem.product_id, CartItem.quantity).where(
+                CartItem.cart_id == cart_id
+            )
+        ).all()
+    )
+
+
+class DatabaseCartStore:
+    def get_items(self, session: Session, cart_id: UUID) -> Dict[str, int]:
+        return _database_items(session, cart_id)
+
+    def set_quantities(
+        self, session: Session, cart_id: UUID, quantities: Dict[str, int]
+    ):
+        upsert(
+            session,
+            CartItem,
+            [
+                {"cart_id": cart_id, "product_id": sku, "quantity": quantity}
+                for sku, quantity in quantities.items()
+                if quantity > 0
+            ],
+            index_elements=["cart_id", "product_id"],
+            update_columns=["quantity"],
+        )
+        removed = [
+            sku for sku, quantity in quantities.items() if quantity == 0
+        ]
+        if removed:
+            session.exec(
+                delete(CartItem).where(
+                    CartItem.cart_id == cart_id,
+                    col(CartItem.product_id).in_(removed),
+                )
+            )
+
+    def move_items(self, session: Session, from_cart_id: UUID, to_cart_id):
+        session.exec(
+            update(CartItem)
+            .where(CartItem.cart_id == from_cart_id)
+            .values(cart_id=to_cart_id)
+        )
+
+    def flush_user(self, session: Session, user_id: UUID):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class WriteBehindCartStore:
+    """Cart logic shared by the key-value stores, which implement the
+    `_load`, `_hydrate`, `_apply`, `_drop` and dirty set primitives"""
+
+    def get_items(self, session: Session, cart_id: UUID) -> Dict[str, int]:
+        items = self._load(cart_id)
+        if items is None:
+            self._hydrate(cart_id, _database_items(session, cart_id))
+            # Another worker may have loaded and changed it meanwhile
+            items = self._load(cart_id) or {}
+        return items
+
+    def set_quantities(
+        self, session: Session, cart_id: UUID, quantities: Dict[str, int]
+    ):
+        if self._load(cart_id) is None:
+            self._hydrate(cart_id, _database_items(session, cart_id))
+        self._apply(cart_id, quantities)
+
+    def move_items(self, session: Session, from_cart_id: UUID, to_cart_id):
+        moved = self.get_items(session, from_cart_id)
+        target = self.get_items(session, to_cart_id)
+        self._apply(
+            to_cart_id,
+            {sku: target.get(sku, 0) + qty for sku, qty in moved.items()},
+        )
+        self._drop(from_cart_id)
+        # Rows flushed earlier would keep the deleted cart referenced
+        session.exec(delete(CartItem).where(CartItem.cart_id == from_cart_id))
+
+    def flush_user(self, session: Session, user_id: UUID):
+        cart_id = session.exec(
+            select(Cart.id).where(Cart.user_id == user_id)
+        ).first()
+        # Written in the caller's transaction. The cart stays dirty, so
+        # if that rolls back the flusher still writes it later.
+        if cart_id is not None and self._is_dirty(cart_id):
+            self._write(session, cart_id)
+
+    def _write(self, session: Session, cart_id: UUID):
+        items = self._load(cart_id)
+        if items is None:
+            return
+        existing = set(
+            session.exec(
+                select(Product.sku).where(col(Product.sku).in_(items))
+            ).all()
+        )
+        # Products deleted since they were added are left out
+        kept = {sku: qty for sku, qty in items.items() if sku in existing}
+        session.exec(
+            delete(CartItem).where(
+                CartItem.cart_id == cart_id,
+                col(CartItem.product_id).not_in(kept),
+            )
+        )
+        upsert(
+            session,
+            CartItem,
+            [
+                {"cart_id": cart_id, "product_id": sku, "quantity": qty}
+                for sku, qty in kept.items()
+            ],
+            index_elements=["cart_id", "product_id"],
+            update_columns=["quantity"],
+        )
+
+    def flush_dirty(self, engine: Engine, limit: int = 500) -> int:
+        """Writes up to `limit` dirty carts back, each in its own
+        transaction. Returns how many were written."""
+        flushed = 0
+        for cart_id in self._pop_dirty(limit):
+            with Session(engine) as session:
+                try:
+                    self._write(session, cart_id)
+                    session.commit()
+                    flushed += 1
+                except IntegrityError:
+                    # The cart was deleted (merged into a user's cart)
+                    logger.warning(
+                        f"Dropped changes of deleted cart {cart_id}"
+                    )
+                except Exception:
+                    self._mark_dirty(cart_id)
+                    logger.exception(f"Failed to flush cart {cart_id}")
+        return flushed
+
+    def _load(self, cart_id: UUID) -> Optional[Dict[str, int]]:
+        raise NotImplementedError()
+
+    def _hydrate(self, cart_id: UUID, items: Dict[str, int]):
+        """Stores `items` unless the cart is already loaded"""
+        raise NotImplementedError()
+
+    def _apply(self, cart_id: UUID, quantities: Dict[str, int]):
+        """Sets the quantities, 0 or less removes the sku, and marks the
+        cart dirty"""
+        raise NotImplementedError()
+
+    def _drop(self, cart_id: UUID):
+        raise NotImplementedError()
+
+    def _is_dirty(self, cart_id: UUID) -> bool:
+        raise NotImplementedError()
+
+    def _mark_dirty(self, cart_id: UUID):
+        raise NotImplementedError()
+
+    def _pop_dirty(self, limit: int) -> Iterable[UUID]:
+        raise NotImplementedError()
+
+
+class InMemoryCartStore(WriteBehindCartStore):
+    """Carts of this process. Beyond `maxsize` carts the least recently
+    used ones already written back are forgotten."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._carts: OrderedDict = OrderedDict()
+        self._dirty: Dict[UUID, None] = {}
+        self._lock = Lock()
+
+    def _load(self, cart_id: UUID) -> Optional[Dict[str, int]]:
+        with self._lock:
+            items = self._carts.get(cart_id)
+            if items is None:
+                return None
+            self._carts.move_to_end(cart_id)
+            return dict(items)
+
+    def _evict(self):
+        for cart_id in list(self._carts):
+            if len(self._carts) <= self.maxsize:
+                return
+            if cart_id not in self._dirty:
+                del self._carts[cart_id]
+
+    def _hydrate(self, cart_id: UUID, items: Dict[str, int]):
+        with self._lock:
+            self._carts.setdefault(cart_id, dict(items))
+            self._evict()
+
+    def _apply(self, cart_id: UUID, quantities: Dict[str, int]):
+        with self._lock:
+            items = self._carts.setdefault(cart_id, {})
+            for sku, quantity in quantities.items():
+                if quantity > 0:
+                    items[sku] = quantity
+                else:
+                    items.pop(sku, None)
+            self._carts.move_to_end(cart_id)
+            self._dirty[cart_id] = None
+
+    def _drop(self, cart_id: UUID):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+            self._dirty.pop(cart_id, None)
+
+    def _is_dirty(self, cart_id: UUID) -> bool:
+        return cart_id in self._dirty
+
+    def _mark_dirty(self, cart_id: UUID):
+        with self._lock:
+            if cart_id in self._carts:
+                self._dirty[cart_id] = None
+
+    def _pop_dirty(self, limit: int) -> List[UUID]:
+        with self._lock:
+            popped = list(self._dirty)[:limit]
+            for cart_id in popped:
+                del self._dirty[cart_id]
+            return popped
+
+    def stats(self) -> dict:
+        return {"carts": len(self._carts), "dirty": len(self._dirty)}
+
+
+# KEYS: the cart hash. ARGV: idle ttl in ms, then sku, quantity pairs.
+# The "~" field marks the cart as loaded, so an empty cart is still known.
+_HYDRATE_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 0 then
+    redis.call("hset", KEYS[1], "~", 1, unpack(ARGV, 2))
+end
+redis.call("pexpire", KEYS[1], ARGV[1])
+"""
+
+
+class RedisCartStore(WriteBehindCartStore):
+    """Cart items in a hash per cart, `<prefix>:cart:<id>`, and dirty cart
+    ids in the `<prefix>:carts:dirty` set, so every worker shares them and
+    any worker's flusher can write them back. Idle carts expire after
+    `idle_ttl` seconds."""
+
+    def __init__(self, client, prefix: str = "api", idle_ttl: float = 86400):
+        self.client = client
+        self.prefix = prefix
+        self.idle_ttl_ms = int(idle_ttl * 1000)
+        self._dirty_key = f"{prefix}:carts:dirty"
+        self._hydrate_script = client.register_script(_HYDRATE_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "api", idle_ttl=86400, **kw):
+        import redis  # Optional dependency, only needed for this store
+
+        return cls(redis.Redis.from_url(url, **kw), prefix, idle_ttl)
+
+    def _key(self, cart_id: UUID) -> str:
+        return f"{self.prefix}:cart:{cart_id}"
+
+    def _load(self, cart_id: UUID) -> Optional[Dict[str, int]]:
+        items = self.client.hgetall(self._key(cart_id))
+        if not items:
+            return None
+        return {
+            sku.decode(): int(quantity)
+            for sku, quantity in items.items()
+            if sku != b"~"
+        }
+
+    def _hydrate(self, cart_id: UUID, items: Dict[str, int]):
+        pairs = [value for item in items.items() for value in item]
+        self._hydrate_script(
+            keys=[self._key(cart_id)], args=[self.idle_ttl_ms, *pairs]
+        )
+
+    def _apply(self, cart_id: UUID, quantities: Dict[str, int]):
+        key = self._key(cart_id)
+        kept = {sku: qty for sku, qty in quantities.items() if qty > 0}
+        removed = [sku for sku, qty in quantities.items() if qty <= 0]
+        with self.client.pipeline() as pipe:
+            pipe.hset(key, mapping={"~": 1, **kept})
+            if removed:
+                pipe.hdel(key, *removed)
+            pipe.pexpire(key, self.idle_ttl_ms)
+            pipe.sadd(self._dirty_key, str(cart_id))
+            pipe.execute()
+
+    def _drop(self, cart_id: UUID):
+        with self.client.pipeline() as pipe:
+            pipe.delete(self._key(cart_id))
+            pipe.srem(self._dirty_key, str(cart_id))
+            pipe.execute()
+
+    def _is_dirty(self, cart_id: UUID) -> bool:
+        return bool(self.client.sismember(self._dirty_key, str(cart_id)))
+
+    def _mark_dirty(self, cart_id: UUID):
+        self.client.sadd(self._dirty_key, str(cart_id))
+
+    def _pop_dirty(self, limit: int) -> List[UUID]:
+        popped = self.client.spop(self._dirty_key, limit) or []
+        return [UUID(cart_id.decode()) for cart_id in popped]
+
+    def stats(self) -> dict:
+        return {"dirty": self.client.scard(self._dirty_key)}
+
+
+class CartFlusher:
+    """Thread writing a write-behind store's dirty carts back every
+    `interval` seconds, and once more when stopped"""
+
+    def __init__(
+        self,
+        store: WriteBehindCartStore,
+        engine: Engine,
+        interval: float,
+        batch_size: int = 500,
+    ):
+        self.store = store
+        self.engine = engine
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = Event()
+        self._thread = Thread(
+            target=self._run, name="cart-flusher", daemon=True
+        )
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        while self.store.flush_dirty(self.engine, self.batch_size):
+            pass
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+
+def build_cart_store() -> CartStore:
+    config = settings.carts  # pyright: ignore
+    if config.store == "memory":
+        return InMemoryCartStore(maxsize=config.maxsize)
+    if config.store == "redis":
+        return RedisCartStore.from_url(
+            settings.cache.url,  # pyright: ignore
+            prefix=settings.cache.prefix,  # pyright: ignore
+            idle_ttl=config.idle_ttl_seconds,
+            socket_timeout=settings.cache.socket_timeout_seconds,  # pyright: ignore
+        )
+    return DatabaseCartStore()
+
+
+_cart_store: Optional[CartStore] = None
+_cart_flusher: Optional[CartFlusher] = None
+_cart_store_lock = Lock()
+
+
+def get_cart_store() -> CartStore:
+    """The configured store, built (and its flusher started) on first use
+    so every forked worker runs its own flusher"""
+    global _cart_store, _cart_flusher
+    if _cart_store is None:
+        with _cart_store_lock:
+            if _cart_store is None:
+                store = build_cart_store()
+                if isinstance(store, WriteBehindCartStore):
+                    config = settings.carts  # pyright: ignore
+                    _cart_flusher = CartFlusher(
+                        store,
+                        get_engines().engine,
+                        interval=config.flush_interval_seconds,
+                        batch_size=config.flush_batch_size,
+                    )
+                    _cart_flusher.start()
+                register_collector("carts", store.stats)
+                _cart_store = store
+    return _cart_store
+
+
+def stop_cart_flusher():
+    """Stops the flusher, if one was started, once it wrote back every
+    dirty cart"""
+    global _cart_flusher
+    with _cart_store_lock:
+        flusher, _cart_flusher = _cart_flusher, None
+    if flusher is not None:
+        flusher.stop()
+
+
+async def _cart_store_dependency() -> CartStore:
+    # Async so resolving it doesn't cost a threadpool hop
+    return get_cart_store()
+
+
+CartStoreDep = Annotated[CartStore, Depends(_cart_store_dependency)]
+
+
+def _signature(value: str) -> str:
+    digest = hmac.new(
+        settings.security.secret_key.encode(),  # pyright: ignore
+        f"cart:{value}".encode(),
+        hashlib.sha256,
+    ).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def create_cart_token(cart_id: UUID) -> str:
+    """`cart_id` and its signature, what anonymous clients send back to
+    find their cart"""
+    return f"{cart_id.hex}.{_signature(cart_id.hex)}"
+
+
+def read_cart_token(token: str) -> Optional[UUID]:
+    """The cart id in `token`, None if it wasn't signed by us"""
+    value, _, signature = token.partition(".")
+    if not hmac.compare_digest(signature.encode(), _signature(value).encode()):
+        return None
+    try:
+        return UUID(hex=value)
+    except ValueError:
+        return None
@@ -0,0 +1,243 @@
+"""Bulk product import and export.
+
+`import_products` validates rows streamed from CSV or JSONL with
+`ProductImportRow` and upserts them chunk by chunk, so memory is bounded by
+the chunk size rather than the catalog. On Postgres a chunk is COPYed into a
+temporary table and merged with one INSERT ... SELECT ... ON CONFLICT,
+elsewhere it is an executemany INSERT ... ON CONFLICT. `export_products`
+streams the table back out in the same columns, so an export can be
+imported again.
+
+An import drops cached catalog responses and the search index of the
+process running it. With the redis cache backend the response cache is
+shared, so a running API drops them too. An API on the memory cache
+backend or the memory search index keeps its own copies and only sees
+the import once restarted (`stale_in_running_api` names them).
+"""
+
+import csv
+import io
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+)
+
+from pydantic import ValidationError
+from sqlalchemy import Connection, Engine, column, select, table
+from sqlalchemy.dialects import postgresql
+
+from api.config import settings
+from api.models import Category, Product
+from api.serializers.product import ProductImportRow
+from api.services.search import configured_backend, search_backend
+from api.utils.query import UPSERT_INSERTS
+from api.utils.response_cache import response_cache
+
+COLUMNS = list(ProductImportRow.model_fields)
+# Imported rows also stamp the timestamps, an update keeps created_at
+WRITE_COLUMNS = [*COLUMNS, "created_at", "updated_at"]
+UPDATE_COLUMNS = [
+    name for name in WRITE_COLUMNS if name not in ("sku", "created_at")
+]
+FORMATS = ("csv", "jsonl")
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def detect_format(path: str, format: Optional[str] = None) -> str:
+    """`format` if given, otherwise guessed from the extension of `path`"""
+    if format is None:
+        extension = path.rsplit(".", 1)[-1].lower()
+        format = "jsonl" if extension in ("jsonl", "ndjson") else extension
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}, use one of {FORMATS}")
+    return format
+
+
+def read_rows(file: IO[str], format: str) -> Iterator:
+    if format == "csv":
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Rejected by validation like any other malformed row
+            yield line
+
+
+def _error_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+def validate_rows(
+    rows: Iterable,
+    category_ids: Set[int],
+    on_reject: Callable[[int, str], None],
+) -> Iterator[dict]:
+    """Products from `rows` passing `ProductImportRow` and pointing to an
+    existing category, `on_reject` gets the row number and the reason of
+    the others"""
+    for number, row in enumerate(rows, start=1):
+        try:
+            product = ProductImportRow.model_validate(row)
+        except ValidationError as exc:
+            on_reject(number, _error_message(exc))
+            continue
+        if product.category_id not in category_ids:
+            on_reject(number, f"category_id: {product.category_id} not found")
+            continue
+        yield product.model_dump()
+
+
+def _copy_chunk(connection: Connection, rows: Iterable[dict]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    for row in rows:
+        writer.writerow([row[name] for name in WRITE_COLUMNS])
+    buffer.seek(0)
+
+    connection.exec_driver_sql(
+        "CREATE TEMP TABLE product_import "
+        "(LIKE product INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY product_import ({', '.join(WRITE_COLUMNS)}) FROM STDIN "
+            "WITH (FORMAT csv, FORCE_NULL (cover_image_key))",
+            buffer,
+        )
+
+    staged = table("product_import", *map(column, WRITE_COLUMNS))
+    statement = postgresql.insert(Product).from_select(
+        WRITE_COLUMNS, select(*staged.c)
+    )
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=["sku"],
+            set_={name: statement.excluded[name] for name in UPDATE_COLUMNS},
+        )
+    )
+
+
+def _upsert_chunk(connection: Connection, rows: Iterable[dict]):
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        return _copy_chunk(connection, rows)
+    if dialect not in UPSERT_INSERTS:
+        raise NotImplementedError(f"Upsert is not supported on {dialect}")
+
+    statement = UPSERT_INSERTS[dialect](Product)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=["sku"],
+            set_={name: statement.excluded[name] for name in UPDATE_COLUMNS},
+        ),
+        list(rows),
+    )
+
+
+def import_products(
+    engine: Engine,
+    file: IO[str],
+    format: str,
+    chunk_size: int = 1000,
+    on_reject: Callable[[int, str], None] = lambda number, reason: None,
+    on_progress: Callable[[ImportReport], None] = lambda report: None,
+) -> ImportReport:
+    """Upserts the products in `file`, committing every `chunk_size`
+    valid rows"""
+    report = ImportReport()
+    started_at = time.perf_counter()
+
+    def reject(number: int, reason: str):
+        report.rejected += 1
+        on_reject(number, reason)
+
+    with engine.connect() as connection:
+        category_ids = set(connection.scalars(select(Category.id)))
+
+    valid = validate_rows(read_rows(file, format), category_ids, reject)
+    while chunk := list(islice(valid, chunk_size)):
+        now = datetime.utcnow()
+        # A sku appearing twice in one statement can't be upserted, the
+        # last occurrence wins as it would across chunks
+        unique: Dict[str, dict] = {}
+        for row in chunk:
+            unique[row["sku"]] = {**row, "created_at": now, "updated_at": now}
+        with engine.begin() as connection:
+            _upsert_chunk(connection, unique.values())
+
+        report.imported += len(chunk)
+        report.rows = report.imported + report.rejected
+        report.seconds = time.perf_counter() - started_at
+        on_progress(report)
+
+    report.rows = report.imported + report.rejected
+    report.seconds = time.perf_counter() - started_at
+    if report.imported:
+        # Core inserts skip the ORM events keeping these up to date
+        search_backend.clear()
+        response_cache.invalidate()
+    return report
+
+
+def stale_in_running_api() -> List[str]:
+    """What a running API keeps in its own process, missing imports made
+    by another one until it is restarted"""
+    stale = []
+    if settings.cache.backend != "redis":  # pyright: ignore
+        stale.append("response cache")
+    if configured_backend() == "memory":
+        stale.append("search index")
+    return stale
+
+
+def export_products(
+    engine: Engine, file: IO[str], format: str, chunk_size: int = 1000
+) -> int:
+    """Writes every product to `file` in sku order, fetching `chunk_size`
+    rows at a time. Returns how many were written."""
+    query = select(*(Product.__table__.c[name] for name in COLUMNS))
+    exported = 0
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=chunk_size).execute(
+            query.order_by(Product.sku)
+        )
+        if format == "csv":
+            writer = csv.DictWriter(file, fieldnames=COLUMNS)
+            writer.writeheader()
+            for row in result:
+                writer.writerow(row._mapping)
+                exported += 1
+        else:
+            for row in result:
+                file.write(json.dumps(dict(row._mapping)) + "\n")
+                exported += 1
+    return exported
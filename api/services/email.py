@@ -1,24 +1,185 @@
-from postmarker.core import PostmarkClient
+"""Transactional email through an outbox table.
+
+Routes add an EmailOutbox row in the same transaction as the change that
+triggers it (see `confirmation_email` and `reset_password_email`), so a
+request never waits on the mail provider. `EmailWorker`, started with
+`python -m api email-worker`, sends due rows in batches through one
+shared transport and retries failures with exponential backoff. Bodies
+carry confirmation and reset tokens, so a row's body is blanked once it is
+sent or given up on.
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Protocol
+
+from sqlalchemy import Engine
+from sqlmodel import Session, col, select
+
 from api.config import settings
+from api.enums import EMAIL_STATUS
+from api.models import EmailOutbox
 
+logger = logging.getLogger(__name__)
+
+
+def confirmation_email(token: str, email: str) -> EmailOutbox:
+    return EmailOutbox(
+        to=email,
+        subject="Confirm your account",
+        html_body=f"<html><body><strong>Hello!</strong><p>Use this token: <strong>{token}</strong> to confirm your account.</p></body></html>",
+    )
 
-class EmailService:
-    def __init__(self):
-        self.client = PostmarkClient(server_token=settings.email.token)
-        self.from_email = settings.email.default_from
-
-    def send_email_confirmation(self, token: str, email: str):
-        self.client.emails.send(
-            From=self.from_email,
-            To=email,
-            Subject="Confirm your account",
-            HtmlBody=f"<html><body><strong>Hello!</strong><p>Use this token: <strong>{token}</strong> to confirm your account.</p></body></html>",
-        )
 
-    def send_reset_password_email(self, token: str, email: str):
-        self.client.emails.send(
-            From=self.from_email,
-            To=email,
-            Subject="Reset your Password",
-            HtmlBody=f"<html><body><strong>Hello!</strong><p>Use this token: <strong>{token}</strong> to recover your password.</p></body></html>",
+def reset_password_email(token: str, email: str) -> EmailOutbox:
+    return EmailOutbox(
+        to=email,
+        subject="Reset your Password",
+        html_body=f"<html><body><strong>Hello!</strong><p>Use this token: <strong>{token}</strong> to recover your password.</p></body></html>",
+    )
+
+
+class EmailTransport(Protocol):
+    def send_batch(self, emails: List[EmailOutbox]) -> List[Optional[str]]:
+        """Sends `emails`, returns the error of each one (None if sent).
+        Raising fails the whole batch."""
+        ...
+
+
+class PostmarkTransport:
+    def __init__(self, token: str, from_email: str, timeout: float = 10):
+        # Only the worker sends, the API process never imports the client
+        from postmarker.core import PostmarkClient
+
+        # One client for the worker's lifetime, it keeps a pooled
+        # requests.Session to the API
+        self.client = PostmarkClient(server_token=token, timeout=timeout)
+        self.from_email = from_email
+
+    def send_batch(self, emails: List[EmailOutbox]) -> List[Optional[str]]:
+        responses = self.client.emails.send_batch(
+            *[
+                {
+                    "From": self.from_email,
+                    "To": email.to,
+                    "Subject": email.subject,
+                    "HtmlBody": email.html_body,
+                }
+                for email in emails
+            ]
         )
+        return [
+            None if response.get("ErrorCode") == 0 else response["Message"]
+            for response in responses
+        ]
+
+
+class FakeTransport:
+    """Keeps emails in memory, for tests and local development"""
+
+    def __init__(self):
+        self.sent: List[dict] = []
+        self.failing: dict = {}
+
+    def send_batch(self, emails: List[EmailOutbox]) -> List[Optional[str]]:
+        errors = []
+        for email in emails:
+            error = self.failing.get(email.to)
+            if error is None:
+                self.sent.append(
+                    {
+                        "to": email.to,
+                        "subject": email.subject,
+                        "html_body": email.html_body,
+                    }
+                )
+            errors.append(error)
+        return errors
+
+
+class EmailWorker:
+    def __init__(
+        self,
+        engine: Engine,
+        transport: EmailTransport,
+        batch_size: int = 100,
+        max_attempts: int = 5,
+        backoff_seconds: float = 30,
+        max_backoff_seconds: float = 3600,
+    ):
+        self.engine = engine
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+    def _backoff(self, attempts: int) -> timedelta:
+        seconds = self.backoff_seconds * 2 ** (attempts - 1)
+        return timedelta(seconds=min(seconds, self.max_backoff_seconds))
+
+    def _record_failure(self, email: EmailOutbox, error: str):
+        email.last_error = error
+        if email.attempts >= self.max_attempts:
+            email.status = EMAIL_STATUS.FAILED
+            email.html_body = ""
+        else:
+            email.next_attempt_at = datetime.utcnow() + self._backoff(
+                email.attempts
+            )
+
+    def run_once(self) -> int:
+        """Sends one batch of due emails, returns how many were taken"""
+        with Session(self.engine) as session:
+            emails = session.exec(
+                select(EmailOutbox)
+                .where(
+                    EmailOutbox.status == EMAIL_STATUS.PENDING,
+                    col(EmailOutbox.next_attempt_at) <= datetime.utcnow(),
+                )
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(self.batch_size)
+                # Concurrent workers on PostgreSQL take disjoint batches
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not emails:
+                return 0
+
+            for email in emails:
+                email.attempts += 1
+            try:
+                errors = self.transport.send_batch(emails)
+            except Exception as e:
+                logger.exception("Email batch failed")
+                errors = [repr(e)] * len(emails)
+
+            for email, error in zip(emails, errors):
+                if error is None:
+                    email.status = EMAIL_STATUS.SENT
+                    email.last_error = None
+                    email.html_body = ""
+                else:
+                    self._record_failure(email, error)
+            session.commit()
+            return len(emails)
+
+    def run(self, poll_interval: float = 2):  # pragma: no cover
+        """Sends forever, sleeping only when the outbox is drained"""
+        while True:
+            if self.run_once() < self.batch_size:
+                time.sleep(poll_interval)
+
+
+def build_worker(engine: Engine) -> EmailWorker:
+    transport = PostmarkTransport(
+        token=settings.email.token, from_email=settings.email.default_from
+    )
+    return EmailWorker(
+        engine,
+        transport,
+        batch_size=settings.email.batch_size,
+        max_attempts=settings.email.max_attempts,
+        backoff_seconds=settings.email.retry_backoff_seconds,
+        max_backoff_seconds=settings.email.retry_backoff_max_seconds,
+    )
@@ -0,0 +1,95 @@
+"""Password hashing off the event loop.
+
+bcrypt releases the GIL while hashing, so a small thread pool gives real
+parallelism without the pickling overhead of a process pool. The pool is
+bounded twice: `workers` caps how many hashes run at once and `max_queue`
+caps how many may wait for a worker, past which callers are rejected
+instead of piling up behind a login storm.
+"""
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter
+from typing import Callable
+
+from api.config import settings
+from api.metrics import register_collector
+from api.security import HashedPassword, get_password_hash, verify_password
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hasher"
+        )
+        self._lock = Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _run(self, fn: Callable, submitted_at: float, *args):
+        waited = perf_counter() - submitted_at
+        with self._lock:
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queues `fn(*args)` on the pool or raises PasswordHasherBusy"""
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise PasswordHasherBusy()
+            self._in_flight += 1
+        try:
+            return self._executor.submit(self._run, fn, perf_counter(), *args)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+
+    async def hash(self, password: str) -> HashedPassword:
+        """Hashes a plain text password"""
+        hashed = await asyncio.wrap_future(
+            self.submit(get_password_hash, password)
+        )
+        return HashedPassword(hashed)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verifies a hash against a password"""
+        return await asyncio.wrap_future(
+            self.submit(verify_password, plain_password, hashed_password)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "queue_wait_seconds_total": self._wait_total,
+                "queue_wait_seconds_max": self._wait_max,
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=settings.security.password_hashing_workers,  # pyright: ignore
+    max_queue=settings.security.password_hashing_max_queue,  # pyright: ignore
+)
+register_collector("password_hasher", password_hasher.stats)
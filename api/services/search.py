@@ -0,0 +1,226 @@
+"""Product full-text search.
+
+Searches name, header and description (weighted in that order) with
+prefix matching on every term, all terms required. Two backends:
+
+* PostgresSearchBackend matches against a GIN-indexed tsvector expression
+  (see migration 5b2f0c4e9a1d) and ranks with ts_rank.
+* InMemorySearchBackend keeps an inverted index in the process, for SQLite
+  and tests. It is built from the table on first use and kept current by
+  mapper events on Product. Its matches become an `IN (...)` list, so a
+  search matching more than `max_results` products raises TooManyMatches
+  rather than dropping some before filters, sorting and paging apply.
+"""
+
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from threading import RLock
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, event, func, literal, literal_column
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, col, select
+
+from api.config import settings
+from api.models import Product
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+# Relevance weight of a term found in each searchable column
+FIELD_WEIGHTS = {"name": 3.0, "header": 2.0, "description": 1.0}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def _weighted_vector(column, weight: str):
+    return func.setweight(
+        func.to_tsvector(
+            literal_column("'simple'"),
+            func.coalesce(column, literal_column("''")),
+        ),
+        literal_column(f"'{weight}'"),
+    )
+
+
+class PostgresSearchBackend:
+    # Must stay identical to the expression indexed by ix_product_search,
+    # otherwise the planner can't use the index
+    document = (
+        _weighted_vector(Product.name, "A")
+        .op("||")(_weighted_vector(Product.header, "B"))
+        .op("||")(_weighted_vector(Product.description, "C"))
+    )
+
+    def apply(self, session: Session, query, text: str) -> Tuple:
+        """Filters `query` to the products matching `text`.
+        Returns the query and a relevance expression to order by."""
+        terms = tokenize(text)
+        if not terms:
+            return query, None
+
+        ts_query = func.to_tsquery(
+            literal_column("'simple'"),
+            literal(" & ".join(f"{term}:*" for term in terms)),
+        )
+        query = query.where(self.document.op("@@")(ts_query))
+        return query, func.ts_rank(self.document, ts_query)
+
+
+class TooManyMatches(Exception):
+    def __init__(self, limit: int):
+        self.limit = limit
+        super().__init__(f"Search matches more than {limit} products")
+
+
+class InMemorySearchBackend:
+    def __init__(self, max_results: int = 1000):
+        self.max_results = max_results
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._tokens: List[str] = []
+        self._documents: Dict[str, List[str]] = {}
+        self._loaded = False
+        self._lock = RLock()
+
+    def clear(self):
+        """Drops the index, it is rebuilt on the next search"""
+        with self._lock:
+            self._postings.clear()
+            self._tokens.clear()
+            self._documents.clear()
+            self._loaded = False
+
+    def _load(self, session: Session):
+        with self._lock:
+            if self._loaded:
+                return
+            columns = (
+                Product.sku,
+                *(getattr(Product, f) for f in FIELD_WEIGHTS),
+            )
+            for row in session.exec(select(*columns)):
+                self._index(row.sku, row._mapping)
+            self._loaded = True
+
+    def _index(self, sku: str, fields):
+        weights: Dict[str, float] = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields[field]):
+                weights[token] += weight
+
+        for token, weight in weights.items():
+            if token not in self._postings:
+                insort(self._tokens, token)
+            self._postings[token][sku] = weight
+        self._documents[sku] = list(weights)
+
+    def _remove(self, sku: str):
+        for token in self._documents.pop(sku, []):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(sku, None)
+
+    def update(self, sku: str, fields: Optional[dict]):
+        """Re-indexes one product, `fields` None removes it"""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._remove(sku)
+            if fields is not None:
+                self._index(sku, fields)
+
+    def _match_prefix(self, prefix: str) -> Dict[str, float]:
+        scores: Dict[str, float] = defaultdict(float)
+        position = bisect_left(self._tokens, prefix)
+        while position < len(self._tokens) and self._tokens[
+            position
+        ].startswith(prefix):
+            for sku, weight in self._postings[self._tokens[position]].items():
+                scores[sku] = max(scores[sku], weight)
+            position += 1
+        return scores
+
+    def search(self, session: Session, text: str) -> Dict[str, float]:
+        """Scores of the matching skus, raises TooManyMatches past
+        `max_results` of them"""
+        self._load(session)
+        with self._lock:
+            scores: Optional[Dict[str, float]] = None
+            for term in tokenize(text):
+                matches = self._match_prefix(term)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {
+                        sku: score + matches[sku]
+                        for sku, score in scores.items()
+                        if sku in matches
+                    }
+                if not scores:
+                    return {}
+
+        if len(scores or ()) > self.max_results:
+            raise TooManyMatches(self.max_results)
+        return scores or {}
+
+    def apply(self, session: Session, query, text: str) -> Tuple:
+        """Filters `query` to the products matching `text`.
+        Returns the query and a relevance expression to order by."""
+        if not tokenize(text):
+            return query, None
+
+        scores = self.search(session, text)
+        query = query.where(col(Product.sku).in_(list(scores)))
+        if not scores:
+            return query, None
+        return query, case(scores, value=Product.sku, else_=0.0)
+
+
+def configured_backend() -> str:
+    """The backend in use, "auto" resolved by database dialect"""
+    backend = settings.get("search", {}).get("backend", "auto")
+    if backend == "auto":
+        backend = (
+            "postgres"
+            if make_url(settings.db.uri).get_backend_name() == "postgresql"
+            else "memory"
+        )
+    return backend
+
+
+def _select_backend():
+    if configured_backend() == "postgres":
+        return PostgresSearchBackend()
+    return InMemorySearchBackend(
+        max_results=settings.get("search", {}).get("max_results", 1000)
+    )
+
+
+search_backend = _select_backend()
+
+
+if isinstance(search_backend, InMemorySearchBackend):
+
+    @event.listens_for(Product, "after_insert")
+    @event.listens_for(Product, "after_update")
+    def _queue_product_reindex(mapper, connection, target: Product):
+        fields = {field: getattr(target, field) for field in FIELD_WEIGHTS}
+        session = OrmSession.object_session(target)
+        session.info.setdefault("search_updates", {})[target.sku] = fields
+
+    @event.listens_for(Product, "after_delete")
+    def _queue_product_removal(mapper, connection, target: Product):
+        session = OrmSession.object_session(target)
+        session.info.setdefault("search_updates", {})[target.sku] = None
+
+    @event.listens_for(OrmSession, "after_commit")
+    def _apply_search_updates(session):
+        for sku, fields in session.info.pop("search_updates", {}).items():
+            search_backend.update(sku, fields)
+
+    @event.listens_for(OrmSession, "after_rollback")
+    def _discard_search_updates(session):
+        session.info.pop("search_updates", None)
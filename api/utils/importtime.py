@@ -0,0 +1,48 @@
+"""Import time profiling from `python -X importtime`."""
+
+import subprocess
+import sys
+from typing import List, NamedTuple
+
+
+class ImportTiming(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """Timings from the `import time: self | cumulative | module` lines"""
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        indent = len(name) - len(name.lstrip())
+        timings.append(
+            ImportTiming(
+                module=name.strip(),
+                self_us=int(self_us),
+                cumulative_us=int(cumulative_us),
+                depth=(indent - 1) // 2,
+            )
+        )
+    return timings
+
+
+def profile_import(statement: str) -> List[ImportTiming]:
+    """Runs `statement` in a fresh interpreter and returns its imports"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def total_seconds(timings: List[ImportTiming]) -> float:
+    return sum(t.cumulative_us for t in timings if t.depth == 0) / 1e6
@@ -0,0 +1,113 @@
+"""Connection pool tuning and instrumentation.
+
+Engines on a QueuePool get a subclass that times every checkout, the
+metrics object also reads the live size/overflow counters off the pool.
+"""
+
+from threading import Lock
+from time import perf_counter
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.pool: Optional[Pool] = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+        self._lock = Lock()
+
+    def record_checkout(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds_total += seconds
+            self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> dict:
+        stats = {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "checkout_seconds_total": self.checkout_seconds_total,
+            "checkout_seconds_max": self.checkout_seconds_max,
+        }
+        if isinstance(self.pool, QueuePool):
+            stats.update(
+                size=self.pool.size(),
+                checked_in=self.pool.checkedin(),
+                checked_out=self.pool.checkedout(),
+                overflow=self.pool.overflow(),
+            )
+        return stats
+
+
+class _TimedCheckoutMixin:
+    metrics: PoolMetrics
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        self.metrics.pool = pool
+        return pool
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(uri: str, pool_settings: dict) -> dict:
+    """create_engine keyword arguments for the configured pool.
+
+    Dialects that don't pool through a QueuePool (in-memory SQLite) keep
+    their default pool and only get pre-ping/recycle.
+    """
+    url = make_url(uri)
+    default_pool = url.get_dialect().get_pool_class(url)
+    options = {
+        "pool_pre_ping": pool_settings.get("pre_ping", False),
+        "pool_recycle": pool_settings.get("recycle", -1),
+    }
+    if not issubclass(default_pool, QueuePool):
+        return options
+
+    if issubclass(default_pool, AsyncAdaptedQueuePool):
+        options["poolclass"] = TimedAsyncAdaptedQueuePool
+    else:
+        options["poolclass"] = TimedQueuePool
+    options.update(
+        pool_size=pool_settings.get("size", 5),
+        max_overflow=pool_settings.get("max_overflow", 10),
+        pool_timeout=pool_settings.get("timeout", 30),
+        pool_use_lifo=pool_settings.get("use_lifo", False),
+    )
+    return options
+
+
+def instrument_pool(pool: Pool) -> PoolMetrics:
+    """Returns the metrics recorder of an engine's pool"""
+    metrics = getattr(pool, "metrics", None) or PoolMetrics()
+    metrics.pool = pool
+    pool.metrics = metrics
+    return metrics
@@ -1,27 +1,178 @@
-from sqlmodel import Session, select, func
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import List, Any, Optional, Sequence
+
+from fastapi import HTTPException, status
 from pydantic import BaseModel
-from typing import List, Any
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select, func
+
+# Dialects whose INSERT supports ON CONFLICT ... DO UPDATE
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
 
 
 class PaginatedResults(BaseModel):
     objects: List[Any]
     page: int
     limit: int
-    total_rows: int
+    total_rows: Optional[int] = None
+    has_next: bool
+
+
+class CursorPaginatedResults(BaseModel):
+    objects: List[Any]
+    limit: int
+    total_rows: Optional[int] = None
+    cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+
+def count_rows(session: Session, query) -> int:
+    return session.exec(
+        select(func.count()).select_from(query.subquery())
+    ).one()
 
 
 def paginate(
-    session: Session, query, page: int, limit: int
+    session: Session, query, page: int, limit: int, count: bool = True
 ) -> PaginatedResults:
+    """Offset pagination. Set `count` to False to skip the COUNT(*) query,
+    `has_next` is then found by fetching one extra row."""
     offset = (page - 1) * limit
-    total_rows = session.exec(
-        select(func.count()).select_from(query.subquery())
-    ).one()
-    objects = session.exec(query.offset(offset).limit(limit)).all()
+    total_rows = count_rows(session, query) if count else None
+    objects = session.exec(query.offset(offset).limit(limit + 1)).all()
 
     return {
-        "objects": objects,
+        "objects": objects[:limit],
         "page": page,
         "limit": limit,
         "total_rows": total_rows,
+        "has_next": len(objects) > limit,
+    }
+
+
+def encode_cursor(values: Sequence[Any], direction: str = "next") -> str:
+    """Builds an opaque cursor pointing after (or before) `values`"""
+    payload = json.dumps([direction, list(values)], default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _coerce_cursor_value(value: Any, column) -> Any:
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if value is None or isinstance(value, python_type):
+        return value
+    if python_type in (datetime, date):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def decode_cursor(cursor: str, order_by: Sequence[Any]):
+    """Returns the key values and direction stored in `cursor`"""
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(cursor))
+        if direction not in ("next", "previous") or len(values) != len(
+            order_by
+        ):
+            raise ValueError()
+        values = [
+            _coerce_cursor_value(value, column)
+            for value, column in zip(values, order_by)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+    return values, direction
+
+
+def paginate_by_cursor(
+    session: Session,
+    query,
+    order_by: Sequence[Any],
+    cursor: Optional[str],
+    limit: int,
+    count: bool = False,
+    descending: bool = False,
+) -> CursorPaginatedResults:
+    """Keyset pagination over `order_by`, which must end in a unique column.
+
+    Pages are found with a `(k1, k2) > (v1, v2)` seek on the sort key instead
+    of an OFFSET, so every page costs the same no matter how deep it is.
+    `descending` walks every column of the key from the highest value down.
+    """
+    values, direction = None, "next"
+    if cursor:
+        values, direction = decode_cursor(cursor, order_by)
+
+    key = tuple_(*order_by)
+    total_rows = count_rows(session, query) if count else None
+    # Walking forward on a descending key is walking backward on the
+    # ascending one
+    if (direction == "next") != descending:
+        if values is not None:
+            query = query.where(key > tuple(values))
+        query = query.order_by(*order_by)
+    else:
+        if values is not None:
+            query = query.where(key < tuple(values))
+        query = query.order_by(*[column.desc() for column in order_by])
+
+    objects = session.exec(query.limit(limit + 1)).all()
+    has_more = len(objects) > limit
+    objects = list(objects[:limit])
+
+    if direction == "next":
+        has_next, has_previous = has_more, values is not None
+    else:
+        objects.reverse()
+        has_next, has_previous = True, has_more
+
+    def row_key(obj):
+        return [getattr(obj, column.key) for column in order_by]
+
+    next_cursor = previous_cursor = None
+    if objects and has_next:
+        next_cursor = encode_cursor(row_key(objects[-1]), "next")
+    if objects and has_previous:
+        previous_cursor = encode_cursor(row_key(objects[0]), "previous")
+
+    return {
+        "objects": objects,
+        "limit": limit,
+        "total_rows": total_rows,
+        "cursor": cursor,
+        "next_cursor": next_cursor,
+        "previous_cursor": previous_cursor,
     }
+
+
+def upsert(
+    session: Session,
+    model,
+    rows: List[dict],
+    index_elements: Sequence[str],
+    update_columns: Sequence[str],
+):
+    """Inserts `rows` in a single INSERT ... ON CONFLICT statement, rows
+    clashing on `index_elements` get `update_columns` overwritten instead."""
+    if not rows:
+        return
+
+    dialect = session.get_bind().dialect.name
+    if dialect not in UPSERT_INSERTS:
+        raise NotImplementedError(f"Upsert is not supported on {dialect}")
+
+    statement = UPSERT_INSERTS[dialect](model).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: statement.excluded[column] for column in update_columns},
+    )
+    session.exec(statement)
@@ -0,0 +1,125 @@
+"""Read replica routing.
+
+Read-only dependencies ask the router for an engine: replicas are handed
+out round-robin, skipping any that failed their last health check, and
+the primary is used when none is healthy. A user who just committed a
+write keeps reading from the primary for a short window so replication
+lag never hides their own change. The window is kept in a `SharedCache`,
+so with the redis backend it holds whichever worker serves the next read.
+"""
+
+import asyncio
+import hashlib
+from itertools import count
+from time import monotonic
+from typing import List, Optional
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from api.utils.shared_cache import make_cache
+
+
+def read_your_writes_key(request: Request) -> Optional[str]:
+    """Identifies the caller across requests and token refreshes.
+
+    The token is not verified here, a forged one can only route its own
+    reads to the primary.
+    """
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return None
+    token = authorization.split(" ")[-1]
+    try:
+        subject = jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        subject = None
+    return subject or hashlib.sha256(token.encode()).hexdigest()
+
+
+class _Replica:
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.healthy = True
+        self.checked_at: Optional[float] = None
+        self._probe: Optional[asyncio.Task] = None
+
+    async def _ping(self):
+        async with self.engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def _check(self, timeout: float):
+        # The timeout covers connecting too, an unreachable host would
+        # otherwise hang for the driver's own connect timeout
+        try:
+            await asyncio.wait_for(self._ping(), timeout)
+            self.healthy = True
+        except Exception:
+            self.healthy = False
+
+    async def is_healthy(self, interval: float, timeout: float) -> bool:
+        """The last known health. Only the first check is waited for, later
+        ones run in the background so requests never wait on a probe."""
+        if self.checked_at is None:
+            self.checked_at = monotonic()
+            await self._check(timeout)
+            return self.healthy
+
+        loop = asyncio.get_running_loop()
+        probing = (
+            self._probe is not None
+            and not self._probe.done()
+            and self._probe.get_loop() is loop
+        )
+        if not probing and monotonic() - self.checked_at >= interval:
+            self.checked_at = monotonic()
+            self._probe = loop.create_task(self._check(timeout))
+        return self.healthy
+
+
+class ReplicaRouter:
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: List[AsyncEngine],
+        health_check_interval: float = 10,
+        health_check_timeout: float = 1,
+        read_your_writes_seconds: float = 5,
+    ):
+        self.primary = primary
+        self.replicas = [_Replica(engine) for engine in replicas]
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self._turn = count()
+        self._recent_writers = make_cache(
+            "writers", ttl=read_your_writes_seconds, maxsize=100_000
+        )
+
+    def record_write(self, key: Optional[str]):
+        if self.replicas and key is not None:
+            # Called from after_commit, possibly on the event loop
+            self._recent_writers.defer(self._recent_writers.set, key, True)
+
+    async def get_engine(self, key: Optional[str] = None) -> AsyncEngine:
+        """Engine to read from for the caller identified by `key`"""
+        if not self.replicas:
+            return self.primary
+        if key is not None and await self._recent_writers.aget(key):
+            return self.primary
+
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._turn) % len(self.replicas)]
+            if await replica.is_healthy(
+                self.health_check_interval, self.health_check_timeout
+            ):
+                return replica.engine
+        return self.primary
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy": sum(replica.healthy for replica in self.replicas),
+            "read_your_writes_window_users": len(self._recent_writers),
+        }
@@ -0,0 +1,152 @@
+"""Response cache for public GET endpoints.
+
+Routers opt in with `APIRouter(route_class=CachedRoute)`. Successful
+responses are stored under their path and normalized query string, served
+with a strong ETag, and answered with 304 when the client already holds
+that ETag. Commits touching Product or Category drop every entry. Entries
+live in a `SharedCache`, so with the redis backend every worker serves and
+drops the same ones, and concurrent misses of a key render it once. The
+generation guarding against storing a response rendered before the last
+invalidation lives in the backend too, so a commit in any worker counts.
+Responses are rendered from the primary: a lagging replica's page would
+otherwise be served for the whole TTL, long after the lag is gone.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+from api.config import settings
+from api.metrics import register_collector
+from api.models import Category, Product
+from api.utils.shared_cache import SharedCache, make_cache
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    media_type: Optional[str]
+    etag: str
+
+
+class ResponseCache:
+    def __init__(self, backend: SharedCache, max_age: int):
+        self.backend = backend
+        self.max_age = max_age
+
+    @staticmethod
+    def key(request: Request) -> str:
+        query = urlencode(sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{query}"
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return await self.backend.aget(key)
+
+    async def generation(self) -> int:
+        return await self.backend.ageneration()
+
+    async def set(self, key: str, value: CachedResponse, generation: int):
+        # Dropped if the catalog changed since `generation` was read
+        await self.backend.aset(key, value, generation=generation)
+
+    def invalidate(self):
+        # Called from after_commit, possibly on the event loop
+        self.backend.defer(self.backend.clear)
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison
+    return "*" in candidates or etag in [
+        tag.removeprefix("W/") for tag in candidates
+    ]
+
+
+response_cache = ResponseCache(
+    make_cache(
+        "responses",
+        maxsize=settings.response_cache.maxsize,  # pyright: ignore
+        ttl=settings.response_cache.ttl_seconds,  # pyright: ignore
+    ),
+    max_age=settings.response_cache.max_age_seconds,  # pyright: ignore
+)
+register_collector("response_cache", lambda: response_cache.backend.stats())
+
+
+class CachedRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not settings.response_cache.enabled:  # pyright: ignore
+            return handler
+
+        async def cached_route_handler(request: Request) -> Response:
+            if request.method != "GET":
+                return await handler(request)
+
+            key = response_cache.key(request)
+            cached = await response_cache.get(key)
+            if cached is None:
+                async with response_cache.backend.alock(key):
+                    # Rendered by the request we waited for, if any
+                    cached = await response_cache.get(key)
+                    if cached is None:
+                        generation = await response_cache.generation()
+                        request.state.read_primary = True
+                        response = await handler(request)
+                        body = getattr(response, "body", None)
+                        if response.status_code != 200 or body is None:
+                            return response
+                        cached = CachedResponse(
+                            body=body,
+                            media_type=response.media_type,
+                            etag=make_etag(body),
+                        )
+                        await response_cache.set(key, cached, generation)
+
+            headers = {
+                "ETag": cached.etag,
+                "Cache-Control": f"public, max-age={response_cache.max_age}",
+            }
+            if etag_matches(cached.etag, request.headers.get("if-none-match")):
+                return Response(status_code=304, headers=headers)
+            return Response(
+                content=cached.body,
+                media_type=cached.media_type,
+                headers=headers,
+            )
+
+        return cached_route_handler
+
+
+@event.listens_for(Product, "after_insert")
+@event.listens_for(Product, "after_update")
+@event.listens_for(Product, "after_delete")
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def _mark_catalog_changed(mapper, connection, target):
+    if (session := OrmSession.object_session(target)) is not None:
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_catalog_responses(session):
+    if session.info.pop("catalog_changed", False):
+        response_cache.invalidate()
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _forget_catalog_changes(session):
+    session.info.pop("catalog_changed", None)
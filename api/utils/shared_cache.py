@@ -0,0 +1,724 @@
+"""Caches whose entries and invalidations can be shared between workers.
+
+`make_cache(namespace, ttl, maxsize)` returns a `SharedCache` over the
+backend chosen in `[default.cache]`:
+
+- `memory` keeps entries in this process, needs no server and is what the
+  tests use.
+- `redis` stores them in any Redis protocol server, so every worker sees
+  the same entries and the same invalidations.
+
+Entries can carry tags such as `product:ABC` or `user:<id>`.
+`invalidate_tags` drops every entry holding one of them, and a tag with
+glob characters such as `category:*` matches every tag it fits.
+
+`get_or_set` and `alock` single-flight a miss: one caller loads the value
+while the others wait for it, instead of all of them hitting the database
+at once.
+
+A backend that can't be reached never fails the caller: reads miss, writes
+are dropped and locks are skipped until it comes back. Invalidations it
+missed are kept and replayed before the next call that reaches it, so
+entries it still holds aren't served stale until their TTL.
+
+The `a*` methods are for the event loop, they run calls to a network
+backend in a thread. Sync callers that may run on the loop, such as
+SQLAlchemy `after_commit` hooks of an AsyncSession, go through `defer`.
+"""
+
+import asyncio
+import logging
+import pickle
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from fnmatch import fnmatchcase
+from threading import Lock
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+    Protocol,
+    Sequence,
+    Set,
+    Tuple,
+)
+from uuid import uuid4
+
+from api.config import settings
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+# Past this many missed tags and keys the whole namespace is cleared instead
+MAX_MISSED_INVALIDATIONS = 1000
+# Generation of a namespace whose backend couldn't be reached, guarded
+# writes against it are dropped
+UNKNOWN_GENERATION = -1
+
+
+class CacheUnavailable(Exception):
+    """The backend couldn't be reached, SharedCache treats it as a miss"""
+
+
+def _is_pattern(tag: str) -> bool:
+    return any(char in tag for char in "*?[")
+
+
+class CacheBackend(Protocol):
+    # Whether calls wait on the network, and so belong off the event loop
+    blocking: bool
+
+    def get(self, key: str) -> Any:
+        """The value stored under `key`, or MISSING"""
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: float,
+        tags: Sequence[str],
+        guard: Optional[Tuple[str, int]] = None,
+    ) -> bool:
+        """Stores `value`, unless `guard` names a generation counter that
+        no longer holds the given value. Returns whether it was stored."""
+
+    def generation(self, name: str) -> int: ...
+
+    def bump_generation(self, name: str) -> int: ...
+
+    def delete(self, key: str): ...
+
+    def invalidate_tags(self, tags: Sequence[str]) -> int:
+        """Drops the entries holding any of `tags`, returns how many"""
+
+    def tag_size(self, tag: str) -> int: ...
+
+    def acquire_lock(self, key: str, token: str, ttl: float) -> bool: ...
+
+    def release_lock(self, key: str, token: str): ...
+
+    def stats(self) -> dict: ...
+
+
+class InMemoryCacheBackend:
+    """Bounded LRU store with per-entry TTL and a tag index, for a single
+    process. Safe to share between the event loop and the threadpool."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data: OrderedDict = OrderedDict()
+        self._tags: Dict[str, Set[str]] = defaultdict(set)
+        self._locks: Dict[str, Tuple[str, float]] = {}
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._lock = Lock()
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return MISSING
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: float,
+        tags: Sequence[str],
+        guard: Optional[Tuple[str, int]] = None,
+    ) -> bool:
+        if self.maxsize <= 0:
+            return False
+        with self._lock:
+            if guard is not None and self._generations[guard[0]] != guard[1]:
+                return False
+            self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+            return True
+
+    def generation(self, name: str) -> int:
+        return self._generations[name]
+
+    def bump_generation(self, name: str) -> int:
+        with self._lock:
+            self._generations[name] += 1
+            return self._generations[name]
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_tags(self, tags: Sequence[str]) -> int:
+        with self._lock:
+            matched = set()
+            for tag in tags:
+                if _is_pattern(tag):
+                    matched.update(
+                        t for t in self._tags if fnmatchcase(t, tag)
+                    )
+                elif tag in self._tags:
+                    matched.add(tag)
+            keys = {key for tag in matched for key in self._tags[tag]}
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def tag_size(self, tag: str) -> int:
+        return len(self._tags.get(tag, ()))
+
+    def acquire_lock(self, key: str, token: str, ttl: float) -> bool:
+        with self._lock:
+            held = self._locks.get(key)
+            if held is not None and held[1] > time.monotonic():
+                return False
+            self._locks[key] = (token, time.monotonic() + ttl)
+            return True
+
+    def release_lock(self, key: str, token: str):
+        with self._lock:
+            if self._locks.get(key, (None,))[0] == token:
+                del self._locks[key]
+
+    def stats(self) -> dict:
+        return {"evictions": self.evictions, "maxsize": self.maxsize}
+
+
+# KEYS: the guarding generation counter, the entry, then its tags. ARGV:
+# pickled value, ttl and current time in ms, the member the tags list, the
+# generation the counter must hold (empty for none). Each tag is a sorted
+# set of its keys scored by expiry: expired members are trimmed whenever
+# one is added and the set itself expires with its last member.
+_SET_SCRIPT = """
+if ARGV[5] ~= "" and (redis.call("get", KEYS[1]) or "0") ~= ARGV[5] then
+    return 0
+end
+redis.call("set", KEYS[2], ARGV[1], "px", ARGV[2])
+local expires_at = tonumber(ARGV[3]) + tonumber(ARGV[2])
+for i = 3, #KEYS do
+    redis.call("zremrangebyscore", KEYS[i], "-inf", ARGV[3])
+    redis.call("zadd", KEYS[i], expires_at, ARGV[4])
+    local last = redis.call("zrange", KEYS[i], -1, -1, "withscores")
+    redis.call("pexpireat", KEYS[i], last[2])
+end
+return 1
+"""
+
+# KEYS: tags. ARGV: prefix of the entry keys. Atomic so an entry can't be
+# tagged between reading a tag and deleting it.
+_INVALIDATE_SCRIPT = """
+local count = 0
+for i = 1, #KEYS do
+    for _, member in ipairs(redis.call("zrange", KEYS[i], 0, -1)) do
+        count = count + redis.call("del", ARGV[1] .. member)
+    end
+    redis.call("del", KEYS[i])
+end
+return count
+"""
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCacheBackend:
+    """Entries pickled under `<prefix>:e:<key>`, tags, single-flight locks
+    and generation counters under `<prefix>:t:`, `<prefix>:l:` and
+    `<prefix>:g:`. Only point it at a server this API trusts.
+
+    After a failed call the server is considered down for `retry_seconds`:
+    calls raise CacheUnavailable right away instead of each waiting out the
+    socket timeout."""
+
+    blocking = True
+
+    def __init__(self, client, prefix: str = "api", retry_seconds=5.0):
+        from redis.exceptions import RedisError
+
+        self.client = client
+        self.prefix = prefix
+        self.retry_seconds = retry_seconds
+        self.failures = 0
+        self._errors = RedisError
+        self._down_until = 0.0
+        self._set = client.register_script(_SET_SCRIPT)
+        self._invalidate = client.register_script(_INVALIDATE_SCRIPT)
+        self._release_lock = client.register_script(_RELEASE_LOCK_SCRIPT)
+
+    @classmethod
+    def from_url(
+        cls, url: str, prefix: str = "api", retry_seconds=5.0, **options
+    ):
+        import redis  # Optional dependency, only needed for this backend
+
+        return cls(redis.Redis.from_url(url, **options), prefix, retry_seconds)
+
+    def _run(self, call: Callable, *args, **kwargs) -> Any:
+        if time.monotonic() < self._down_until:
+            raise CacheUnavailable()
+        try:
+            return call(*args, **kwargs)
+        except self._errors as e:
+            self.failures += 1
+            self._down_until = time.monotonic() + self.retry_seconds
+            logger.warning(
+                "Redis cache unavailable, retrying in %ss: %s",
+                self.retry_seconds,
+                e,
+            )
+            raise CacheUnavailable() from e
+
+    def _entry(self, key: str) -> str:
+        return f"{self.prefix}:e:{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}:t:{tag}"
+
+    def _generation(self, name: str) -> str:
+        return f"{self.prefix}:g:{name}"
+
+    def get(self, key: str) -> Any:
+        raw = self._run(self.client.get, self._entry(key))
+        return MISSING if raw is None else pickle.loads(raw)
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: float,
+        tags: Sequence[str],
+        guard: Optional[Tuple[str, int]] = None,
+    ) -> bool:
+        name, generation = guard if guard is not None else ("", "")
+        stored = self._run(
+            self._set,
+            keys=[
+                self._generation(name),
+                self._entry(key),
+                *map(self._tag, tags),
+            ],
+            args=[
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                max(int(ttl * 1000), 1),
+                int(time.time() * 1000),
+                key,
+                generation,
+            ],
+        )
+        return bool(stored)
+
+    def generation(self, name: str) -> int:
+        return int(self._run(self.client.get, self._generation(name)) or 0)
+
+    def bump_generation(self, name: str) -> int:
+        return self._run(self.client.incr, self._generation(name))
+
+    def delete(self, key: str):
+        self._run(self.client.delete, self._entry(key))
+
+    def _scan(self, pattern: str) -> list:
+        return list(self.client.scan_iter(match=pattern))
+
+    def invalidate_tags(self, tags: Sequence[str]) -> int:
+        tag_keys = []
+        for tag in tags:
+            if _is_pattern(tag):
+                tag_keys.extend(self._run(self._scan, self._tag(tag)))
+            else:
+                tag_keys.append(self._tag(tag))
+        if not tag_keys:
+            return 0
+        return self._run(
+            self._invalidate, keys=tag_keys, args=[self._entry("")]
+        )
+
+    def tag_size(self, tag: str) -> int:
+        now = int(time.time() * 1000)
+        return self._run(self.client.zcount, self._tag(tag), now, "+inf")
+
+    def acquire_lock(self, key: str, token: str, ttl: float) -> bool:
+        return bool(
+            self._run(
+                self.client.set,
+                f"{self.prefix}:l:{key}",
+                token,
+                nx=True,
+                px=int(ttl * 1000),
+            )
+        )
+
+    def release_lock(self, key: str, token: str):
+        self._run(
+            self._release_lock, keys=[f"{self.prefix}:l:{key}"], args=[token]
+        )
+
+    def stats(self) -> dict:
+        return {
+            "failures": self.failures,
+            "available": time.monotonic() >= self._down_until,
+        }
+
+
+class SharedCache:
+    """TTLCache-like view of one namespace of a CacheBackend.
+
+    Keys may be strings or tuples of strings, UUIDs and numbers. Tags are
+    scoped to the namespace on every backend. Every entry is also tagged
+    with the namespace itself, which is how `clear` and `len` find them.
+
+    `clear` also bumps the namespace generation. A value rendered from data
+    read before a `clear` is dropped by `set(..., generation=...)` when
+    given the generation read beforehand, whichever worker cleared.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        namespace: str,
+        ttl: float,
+        lock_timeout: float = 5.0,
+        lock_poll_interval: float = 0.01,
+        lock_max_poll_interval: float = 0.1,
+    ):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.lock_poll_interval = lock_poll_interval
+        self.lock_max_poll_interval = lock_max_poll_interval
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.lock_waits = 0
+        self._namespace_tag = namespace
+        # Invalidations the backend couldn't take, replayed once it can
+        self._missed_lock = Lock()
+        self._missed_clear = False
+        self._missed_tags: Set[str] = set()
+        self._missed_keys: Set[str] = set()
+        self._has_missed = False
+        self._deferred: Set[asyncio.Future] = set()
+
+    def _key(self, key: Hashable) -> str:
+        parts = key if isinstance(key, tuple) else (key,)
+        return ":".join([self.namespace, *map(str, parts)])
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.namespace}#{tag}"
+
+    def _call(self, default: Any, method: Callable, *args) -> Any:
+        try:
+            if self._has_missed:
+                self._replay_missed()
+            return method(*args)
+        except CacheUnavailable:
+            return default
+
+    def _miss(self, tags: Sequence[str] = (), keys: Sequence[str] = ()):
+        with self._missed_lock:
+            self._missed_tags.update(tags)
+            self._missed_keys.update(keys)
+            missed = len(self._missed_tags) + len(self._missed_keys)
+            if missed > MAX_MISSED_INVALIDATIONS:
+                self._missed_clear = True
+            if self._missed_clear:
+                self._missed_tags.clear()
+                self._missed_keys.clear()
+            self._has_missed = True
+
+    def _clear(self):
+        self.backend.bump_generation(self.namespace)
+        self.backend.invalidate_tags([self._namespace_tag])
+
+    def _replay_missed(self):
+        """Raises CacheUnavailable, keeping what is left, while the backend
+        is still down"""
+        with self._missed_lock:
+            clear, tags, keys = (
+                self._missed_clear,
+                self._missed_tags,
+                self._missed_keys,
+            )
+            self._missed_clear = False
+            self._missed_tags, self._missed_keys = set(), set()
+            self._has_missed = False
+        try:
+            if clear:
+                self._clear()
+                return
+            if tags:
+                self.backend.invalidate_tags(list(tags))
+            for key in keys:
+                self.backend.delete(key)
+        except CacheUnavailable:
+            with self._missed_lock:
+                self._missed_clear = self._missed_clear or clear
+            self._miss(tags, keys)
+            raise
+
+    async def _acall(self, default: Any, method: Callable, *args) -> Any:
+        if not self.backend.blocking:
+            return self._call(default, method, *args)
+        return await asyncio.to_thread(self._call, default, method, *args)
+
+    def _count(self, value: Any, default: Any) -> Any:
+        if value is MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._call(MISSING, self.backend.get, self._key(key))
+        return self._count(value, default)
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        value = await self._acall(MISSING, self.backend.get, self._key(key))
+        return self._count(value, default)
+
+    def _set_args(self, key, value, ttl, tags, generation) -> Optional[tuple]:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return None
+        guard = None if generation is None else (self.namespace, generation)
+        return (
+            self._key(key),
+            value,
+            ttl,
+            (self._namespace_tag, *map(self._tag, tags)),
+            guard,
+        )
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float = None,
+        tags: Sequence[str] = (),
+        generation: Optional[int] = None,
+    ) -> bool:
+        """Stores `value`. With `generation`, only if the namespace hasn't
+        been cleared since that generation was read."""
+        args = self._set_args(key, value, ttl, tags, generation)
+        return bool(args) and self._call(False, self.backend.set, *args)
+
+    async def aset(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float = None,
+        tags: Sequence[str] = (),
+        generation: Optional[int] = None,
+    ) -> bool:
+        args = self._set_args(key, value, ttl, tags, generation)
+        return bool(args) and await self._acall(False, self.backend.set, *args)
+
+    def generation(self) -> int:
+        return self._call(
+            UNKNOWN_GENERATION, self.backend.generation, self.namespace
+        )
+
+    async def ageneration(self) -> int:
+        return await self._acall(
+            UNKNOWN_GENERATION, self.backend.generation, self.namespace
+        )
+
+    def delete(self, key: Hashable):
+        key = self._key(key)
+        if self._call(MISSING, self.backend.delete, key) is MISSING:
+            self._miss(keys=[key])
+
+    def invalidate_tags(self, *tags: str) -> int:
+        tags = [self._tag(tag) for tag in tags]
+        dropped = self._call(None, self.backend.invalidate_tags, tags)
+        if dropped is None:
+            self._miss(tags=tags)
+        return dropped or 0
+
+    def clear(self):
+        if self._call(False, self._clear) is False:
+            with self._missed_lock:
+                self._missed_clear = True
+            self._miss()
+
+    def defer(self, method: Callable, *args):
+        """Calls `method`, a sync call into this cache, without holding up
+        a running event loop: in a thread when the backend blocks, right
+        away otherwise. For sync hooks that may run on the loop."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or not self.backend.blocking:
+            method(*args)
+            return
+        future = loop.run_in_executor(None, method, *args)
+        self._deferred.add(future)
+        future.add_done_callback(self._deferred.discard)
+
+    def __len__(self) -> int:
+        return self._call(0, self.backend.tag_size, self._namespace_tag)
+
+    def _lock_args(self, key: Hashable) -> tuple:
+        return self._key(key), uuid4().hex, self.lock_timeout
+
+    def _next_poll(self, delay: float) -> float:
+        return min(delay * 2, self.lock_max_poll_interval)
+
+    @contextmanager
+    def lock(self, key: Hashable):
+        """Holds the single-flight lock of `key`. After `lock_timeout`
+        seconds of waiting, or right away if the backend is unavailable,
+        the caller goes ahead without it rather than failing."""
+        args = self._lock_args(key)
+        deadline = time.monotonic() + self.lock_timeout
+        # None when the backend couldn't be asked
+        acquired = self._call(None, self.backend.acquire_lock, *args)
+        if acquired is False:
+            self.lock_waits += 1
+        delay = self.lock_poll_interval
+        while acquired is False and time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = self._next_poll(delay)
+            acquired = self._call(None, self.backend.acquire_lock, *args)
+        try:
+            yield
+        finally:
+            if acquired:
+                self._call(None, self.backend.release_lock, *args[:2])
+
+    @asynccontextmanager
+    async def alock(self, key: Hashable):
+        """`lock` for the event loop, waiting with asyncio.sleep"""
+        args = self._lock_args(key)
+        deadline = time.monotonic() + self.lock_timeout
+        acquired = await self._acall(None, self.backend.acquire_lock, *args)
+        if acquired is False:
+            self.lock_waits += 1
+        delay = self.lock_poll_interval
+        while acquired is False and time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = self._next_poll(delay)
+            acquired = await self._acall(
+                None, self.backend.acquire_lock, *args
+            )
+        try:
+            yield
+        finally:
+            if acquired:
+                await self._acall(None, self.backend.release_lock, *args[:2])
+
+    def get_or_set(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        ttl: float = None,
+        tags: Sequence[str] = (),
+    ) -> Any:
+        """The cached value of `key`, loading and storing it on a miss.
+        Concurrent misses wait for the first loader instead of running
+        their own."""
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        with self.lock(key):
+            # Filled by the caller we waited for, if any
+            value = self.get(key, MISSING)
+            if value is MISSING:
+                value = loader()
+                self.loads += 1
+                self.set(key, value, ttl, tags)
+        return value
+
+    async def aget_or_set(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float = None,
+        tags: Sequence[str] = (),
+    ) -> Any:
+        """`get_or_set` with a coroutine loader"""
+        value = await self.aget(key, MISSING)
+        if value is not MISSING:
+            return value
+        async with self.alock(key):
+            value = await self.aget(key, MISSING)
+            if value is MISSING:
+                value = await loader()
+                self.loads += 1
+                await self.aset(key, value, ttl, tags)
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "lock_waits": self.lock_waits,
+            "size": len(self),
+            **self.backend.stats(),
+        }
+
+
+_redis_backend = None
+
+
+def _get_redis_backend() -> RedisCacheBackend:
+    # One client (and connection pool) per process for every namespace
+    global _redis_backend
+    if _redis_backend is None:
+        _redis_backend = RedisCacheBackend.from_url(
+            settings.cache.url,  # pyright: ignore
+            prefix=settings.cache.prefix,  # pyright: ignore
+            retry_seconds=settings.cache.retry_seconds,  # pyright: ignore
+            socket_timeout=settings.cache.socket_timeout_seconds,  # pyright: ignore
+            socket_connect_timeout=settings.cache.socket_timeout_seconds,  # pyright: ignore
+        )
+    return _redis_backend
+
+
+def make_cache(namespace: str, ttl: float, maxsize: int) -> SharedCache:
+    """A cache on the configured backend. `maxsize` bounds the in-memory
+    backend, Redis evicts by its own maxmemory policy."""
+    if settings.cache.backend == "redis":  # pyright: ignore
+        backend = _get_redis_backend()
+    else:
+        backend = InMemoryCacheBackend(maxsize=maxsize)
+    return SharedCache(
+        backend,
+        namespace,
+        ttl,
+        lock_timeout=settings.cache.lock_timeout_seconds,  # pyright: ignore
+        lock_poll_interval=settings.cache.lock_poll_seconds,  # pyright: ignore
+        lock_max_poll_interval=settings.cache.lock_max_poll_seconds,  # pyright: ignore
+    )
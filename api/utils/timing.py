@@ -0,0 +1,136 @@
+"""Request latency and database time per route.
+
+`RequestTimingMiddleware` starts a `RequestStats` in a context variable for
+every HTTP request. The cursor events `instrument_engine` attaches to each
+engine add the statements of that request to it, sync routes included since
+the threadpool runs them in a copy of the request context. When the
+response starts the middleware records the route's latency, statement count
+and DB time, and reports them to the client in a Server-Timing header.
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from api.metrics import Counter, Histogram
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response started, by route",
+    labels=("method", "route", "status"),
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per request, by route",
+    labels=("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_SECONDS = Counter(
+    "http_request_db_seconds_total",
+    "Time spent executing SQL statements, by route",
+    labels=("method", "route"),
+)
+
+# Label for requests no route matched, so random paths can't create series
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    conn.info.setdefault("query_started_at", []).append(perf_counter())
+
+
+def _after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    started_at = conn.info["query_started_at"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += perf_counter() - started_at
+
+
+def instrument_engine(engine: Engine):
+    """Adds the statements run on `engine` to the current request's stats.
+    Pass `sync_engine` for an AsyncEngine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_name(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class RequestTimingMiddleware:
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started_at = perf_counter()
+        recorded = False
+
+        async def send_with_timing(message):
+            nonlocal recorded
+            if message["type"] == "http.response.start":
+                seconds = perf_counter() - started_at
+                if self.server_timing:
+                    header = server_timing_header(seconds, stats)
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"server-timing", header.encode()),
+                    ]
+                _record(scope, stats, message["status"], seconds)
+                recorded = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except Exception:
+            if not recorded:
+                _record(scope, stats, 500, perf_counter() - started_at)
+            raise
+        finally:
+            _request_stats.reset(token)
+
+
+def _record(scope, stats: RequestStats, status: int, seconds: float):
+    method, route = scope["method"], _route_name(scope)
+    REQUEST_DURATION.observe(
+        seconds, method=method, route=route, status=str(status)
+    )
+    REQUEST_DB_QUERIES.observe(stats.queries, method=method, route=route)
+    REQUEST_DB_SECONDS.inc(stats.db_seconds, method=method, route=route)
+
+
+def server_timing_header(seconds: float, stats: RequestStats) -> str:
+    return (
+        f"app;dur={seconds * 1000:.1f}, "
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'
+    )
@@ -0,0 +1,398 @@
+"""Throughput and latency of the main user journeys.
+
+    python -m benchmarks.journeys --users 50 --products 2000 --iterations 200
+    python -m benchmarks.journeys --db-uri postgresql:///bench --reset
+    python -m benchmarks.journeys --compare benchmarks/results/1a2b3c4.json
+
+Drops and recreates every table on `--db-uri` (a throwaway SQLite file by
+default, any other database needs `--reset` to confirm it), seeds it with
+the test factories at the requested scale and drives login, product
+listing and search, cart updates, checkout and address CRUD through the
+app in process. Pass `--url` to drive a running server instead, seeded
+through the same `--db-uri`; `--concurrency` then spreads each journey over
+that many clients.
+
+Listing and search vary their page, sort and terms, and the in-process app
+runs without the response cache unless `--response-cache` is passed, so
+they time the queries rather than cache hits. Start a server driven with
+`--url` with SERVER_RESPONSE_CACHE__ENABLED=false for the same numbers.
+
+Results are written as JSON to `benchmarks/results/<commit>.json` so runs of
+different commits can be compared with `--compare`.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_URI = "sqlite:///benchmark.db"
+PASSWORD = "pass123"
+
+
+@dataclass
+class Fixtures:
+    """What the journeys pick their users, tokens and products from"""
+
+    usernames: List[str]
+    skus: List[str]
+    tokens: Dict[str, str] = field(default_factory=dict)
+
+
+def seed(session, users: int, products: int, categories: int) -> Fixtures:
+    """Creates `users` users, each with a cart and an address, and
+    `products` products spread over `categories` categories"""
+    from tests.factories import (
+        AddressFactory,
+        CartFactory,
+        CategoryFactory,
+        ProductFactory,
+        UserFactory,
+    )
+    from tests.providers import set_factories_session
+
+    set_factories_session(session)
+    category_rows = CategoryFactory.create_batch(categories)
+    product_rows = [
+        ProductFactory.build(category=random.choice(category_rows))
+        for _ in range(products)
+    ]
+    user_rows = [
+        UserFactory.build(
+            username=f"user{index}", email=f"user{index}@example.com"
+        )
+        for index in range(users)
+    ]
+    session.add_all([*product_rows, *user_rows])
+    session.commit()
+    session.add_all(
+        [CartFactory.build(user_id=user.id) for user in user_rows]
+        + [AddressFactory.build(user_id=user.id) for user in user_rows]
+    )
+    session.commit()
+
+    return Fixtures(
+        usernames=[user.username for user in user_rows],
+        skus=[product.sku for product in product_rows],
+    )
+
+
+def _login(client, username: str) -> str:
+    response = client.post(
+        "/auth/token",
+        data={"username": username, "password": PASSWORD},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def _auth(fixtures: Fixtures, username: str) -> dict:
+    return {"Authorization": f"Bearer {fixtures.tokens[username]}"}
+
+
+def login(client, fixtures: Fixtures, username: str):
+    return [
+        client.post(
+            "/auth/token",
+            data={"username": username, "password": PASSWORD},
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+    ]
+
+
+def list_products(client, fixtures: Fixtures, username: str):
+    pages = max(len(fixtures.skus) // 30, 1)
+    params = {"page": random.randint(1, pages)}
+    if sort := random.choice([None, "name", "price"]):
+        params["sort"] = sort
+    return [client.get("/v1/products/", params=params)]
+
+
+def search_products(client, fixtures: Fixtures, username: str):
+    # Seeded names are "product <n>", a number prefix matches a few of them
+    number = random.randrange(len(fixtures.skus))
+    return [client.get("/v1/products/", params={"name": f"product {number}"})]
+
+
+def _random_items(fixtures: Fixtures) -> list:
+    skus = random.sample(fixtures.skus, min(3, len(fixtures.skus)))
+    return [{"sku": sku, "quantity": random.randint(1, 5)} for sku in skus]
+
+
+def update_cart(client, fixtures: Fixtures, username: str):
+    return [
+        client.put(
+            "/v1/carts/items",
+            json=_random_items(fixtures),
+            headers=_auth(fixtures, username),
+        )
+    ]
+
+
+def checkout(client, fixtures: Fixtures, username: str):
+    headers = _auth(fixtures, username)
+    return [
+        client.put(
+            "/v1/carts/items", json=_random_items(fixtures), headers=headers
+        ),
+        client.post("/v1/orders/", json={}, headers=headers),
+    ]
+
+
+def address_crud(client, fixtures: Fixtures, username: str):
+    headers = _auth(fixtures, username)
+    created = client.post(
+        "/v1/users/addresses",
+        json={
+            "line_1": "1 Benchmark Street",
+            "city": "Campinas",
+            "state": "SP",
+            "country": "Brazil",
+            "zip_code": "13000-000",
+        },
+        headers=headers,
+    )
+    responses = [created]
+    if created.is_success:
+        address = created.json()["_meta"]["_links"]["self"]["href"]
+        address_id = address.rsplit("/", 1)[-1]
+        responses += [
+            client.get(f"/v1/users/addresses/{address_id}", headers=headers),
+            client.get("/v1/users/addresses", headers=headers),
+            client.patch(
+                f"/v1/users/addresses/{address_id}",
+                json={"line_2": "Apt 2"},
+                headers=headers,
+            ),
+        ]
+    return responses
+
+
+JOURNEYS: Dict[str, Callable] = {
+    "login": login,
+    "list_products": list_products,
+    "search_products": search_products,
+    "update_cart": update_cart,
+    "checkout": checkout,
+    "address_crud": address_crud,
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `values`"""
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(latencies: List[float], requests: int, errors: int, seconds):
+    return {
+        "iterations": len(latencies),
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(seconds, 4),
+        "requests_per_second": round(requests / seconds, 2),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p90": round(percentile(latencies, 90) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+    }
+
+
+def run_journey(
+    clients: list, fixtures: Fixtures, journey: Callable, iterations: int
+) -> dict:
+    """Runs `journey` `iterations` times spread over `clients`, one thread
+    per client, and summarizes the latency of each iteration"""
+
+    def worker(index: int):
+        client = clients[index]
+        latencies, requests, errors = [], 0, 0
+        for iteration in range(index, iterations, len(clients)):
+            username = fixtures.usernames[iteration % len(fixtures.usernames)]
+            started_at = time.perf_counter()
+            responses = journey(client, fixtures, username)
+            latencies.append(time.perf_counter() - started_at)
+            requests += len(responses)
+            errors += sum(not response.is_success for response in responses)
+        return latencies, requests, errors
+
+    started_at = time.perf_counter()
+    if len(clients) == 1:
+        results = [worker(0)]
+    else:
+        with ThreadPoolExecutor(len(clients)) as pool:
+            results = list(pool.map(worker, range(len(clients))))
+    seconds = time.perf_counter() - started_at
+
+    return summarize(
+        [latency for result in results for latency in result[0]],
+        sum(result[1] for result in results),
+        sum(result[2] for result in results),
+        seconds,
+    )
+
+
+def run(
+    clients: list,
+    fixtures: Fixtures,
+    iterations: int,
+    journeys: List[str],
+    warmup: int = 0,
+) -> Dict[str, dict]:
+    """Logs every seeded user in once, then times each journey"""
+    for username in fixtures.usernames:
+        fixtures.tokens[username] = _login(clients[0], username)
+
+    results = {}
+    for name in journeys:
+        if warmup:
+            run_journey(clients[:1], fixtures, JOURNEYS[name], warmup)
+        results[name] = run_journey(
+            clients, fixtures, JOURNEYS[name], iterations
+        )
+    return results
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline: dict, results: Dict[str, dict]):
+    print(f"\ncompared with {baseline['commit']}:")
+    for name, result in results.items():
+        before = baseline["journeys"].get(name)
+        if before is None:
+            continue
+        throughput = (
+            result["requests_per_second"] / before["requests_per_second"] - 1
+        )
+        p50 = result["latency_ms"]["p50"] / before["latency_ms"]["p50"] - 1
+        print(f"{name:>16}: {throughput:+8.1%} req/s {p50:+8.1%} p50")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-uri", default=DEFAULT_DB_URI)
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="confirms every table of --db-uri can be dropped",
+    )
+    parser.add_argument("--url", help="base url of a running server")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--response-cache",
+        action="store_true",
+        help="keep the in-process app's response cache on",
+    )
+    parser.add_argument(
+        "--journey", action="append", choices=JOURNEYS, dest="journeys"
+    )
+    parser.add_argument("--output", help="defaults to results/<commit>.json")
+    parser.add_argument("--compare", help="results of an earlier run")
+    args = parser.parse_args()
+    if args.db_uri != DEFAULT_DB_URI and not args.reset:
+        parser.error(f"{args.db_uri} is wiped before seeding, pass --reset")
+    if args.concurrency > 1 and not args.url:
+        parser.error("--concurrency needs --url, the app runs in process")
+
+    # Settings are read on first use, so these apply to the import below
+    os.environ.setdefault("SERVER_ENV", "testing")
+    os.environ["SERVER_DB__URI"] = args.db_uri
+    if not args.response_cache:
+        os.environ["SERVER_RESPONSE_CACHE__ENABLED"] = "false"
+    if not args.db_uri.startswith("sqlite"):
+        os.environ["SERVER_DB__CONNECT_ARGS"] = "@json {}"
+
+    from sqlmodel import Session, SQLModel
+
+    from api import models  # noqa: F401, registers the tables
+    from api.db import engine
+
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        fixtures = seed(session, args.users, args.products, args.categories)
+
+    if args.url:
+        import httpx
+
+        clients = [
+            httpx.Client(base_url=args.url, timeout=30)
+            for _ in range(args.concurrency)
+        ]
+    else:
+        from fastapi.testclient import TestClient
+
+        from api.app import app  # type: ignore
+
+        clients = [TestClient(app)]
+
+    journeys = args.journeys or list(JOURNEYS)
+    results = run(clients, fixtures, args.iterations, journeys, args.warmup)
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        print(
+            f"{name:>16}: {result['requests_per_second']:10.1f} req/s"
+            f" p50 {latency['p50']:8.2f} ms p99 {latency['p99']:8.2f} ms"
+            f" errors {result['errors']}"
+        )
+
+    commit = current_commit()
+    output = args.output or os.path.join(HERE, "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as results_file:
+        json.dump(
+            {
+                "commit": commit,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "database": engine.url.get_backend_name(),
+                "target": args.url or "in-process",
+                "python": sys.version.split()[0],
+                "scale": {
+                    "users": args.users,
+                    "products": args.products,
+                    "categories": args.categories,
+                    "iterations": args.iterations,
+                    "concurrency": args.concurrency,
+                },
+                "journeys": results,
+            },
+            results_file,
+            indent=2,
+        )
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(json.load(baseline_file), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""HS256 access token decode throughput.
+
+    python -m benchmarks.jwt_decode --rounds 20000
+
+Times python-jose, PyJWT (when installed) and decode_token answering from
+its claims cache, all on the same token.
+"""
+
+import argparse
+from datetime import timedelta
+from timeit import timeit
+
+from api.auth import (
+    _jose_decode,
+    create_jwt_token,
+    decode_token,
+    pyjwt,
+    _pyjwt_decode,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_jwt_token({"sub": "benchmark"}, timedelta(minutes=30))
+    runs = {"python-jose": lambda: _jose_decode(token)}
+    if pyjwt is not None:
+        runs["pyjwt"] = lambda: _pyjwt_decode(token)
+    runs["cached"] = lambda: decode_token(token)
+
+    for name, run in runs.items():
+        seconds = timeit(run, number=args.rounds)
+        print(f"{name:>12}: {args.rounds / seconds:12,.0f} decodes/s")
+
+
+if __name__ == "__main__":
+    main()
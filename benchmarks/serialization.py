@@ -0,0 +1,71 @@
+"""Per-item cost of serializing a product listing page.
+
+    python -m benchmarks.serialization --items 100 --rounds 200
+
+Compares the response model path (BaseMultipleProductsResponse) with the
+precompiled fast path (dump_products_page) over in-memory products, so no
+database is needed.
+"""
+
+import argparse
+from timeit import repeat
+
+from api.models import Category, Product
+from api.models.product import discounted_price
+from api.serializers.product import (
+    BaseMultipleProductsResponse,
+    dump_products_page,
+)
+
+
+def make_page(items: int) -> dict:
+    category = Category(id=1, name="Shoes")
+    products = [
+        Product(
+            sku=f"SKU-{index:05d}",
+            name=f"Product {index}",
+            header="Short header",
+            description="A longer product description " * 4,
+            unit_price=1000 + index,
+            discount_percentage=10.0,
+            # Computed by the database for stored rows
+            discounted_price=discounted_price(1000 + index, 10.0),
+            category_id=category.id,
+            category=category,
+        )
+        for index in range(items)
+    ]
+    return {
+        "objects": products,
+        "page": 1,
+        "limit": items,
+        "total_rows": items * 10,
+        "has_next": True,
+        "filters": {"name": "product"},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    page = make_page(args.items)
+    runs = {
+        "response model": lambda: BaseMultipleProductsResponse(
+            **page
+        ).model_dump_json(),
+        "fast path": lambda: dump_products_page(**page),
+    }
+    per_item = {}
+    for name, run in runs.items():
+        best = min(repeat(run, number=args.rounds, repeat=5))
+        per_item[name] = best / args.rounds / args.items * 1e6
+        print(f"{name:>15}: {per_item[name]:8.2f} us/item")
+    speedup = per_item["response model"] / per_item["fast path"]
+    print(f"{'speedup':>15}: {speedup:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
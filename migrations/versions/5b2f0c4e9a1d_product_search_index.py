@@ -0,0 +1,46 @@
+"""product search index
+
+Revision ID: 5b2f0c4e9a1d
+Revises: 0d50cb7d4f3e
+Create Date: 2026-10-18 18:20:41.512204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2f0c4e9a1d'
+down_revision: Union[str, None] = '0d50cb7d4f3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match PostgresSearchBackend.document in api/services/search.py
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(header, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Other databases search through the in-process index
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_search '
+            f'ON product USING GIN (({SEARCH_DOCUMENT}))'
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_product_search')
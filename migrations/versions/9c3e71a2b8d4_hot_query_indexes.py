@@ -0,0 +1,54 @@
+"""hot query indexes
+
+Revision ID: 9c3e71a2b8d4
+Revises: 5b2f0c4e9a1d
+Create Date: 2026-10-18 18:35:12.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e71a2b8d4'
+down_revision: Union[str, None] = '5b2f0c4e9a1d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# cartitem.cart_id is the leading column of its primary key already
+INDEXES = [
+    ('ix_cart_user_id', 'cart', ['user_id']),
+    ('ix_cart_origin_ip', 'cart', ['origin_ip']),
+    ('ix_address_user_id', 'address', ['user_id']),
+    ('ix_orderitem_order_id', 'orderitem', ['order_id']),
+    ('ix_product_category_id', 'product', ['category_id']),
+    ('ix_orders_user_id_created_at', 'orders', ['user_id', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently on PostgreSQL so live tables aren't locked
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                if_exists=True,
+                postgresql_concurrently=True,
+            )
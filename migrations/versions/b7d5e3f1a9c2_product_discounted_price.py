@@ -0,0 +1,60 @@
+"""product discounted price
+
+Revision ID: b7d5e3f1a9c2
+Revises: 4e8a2d6c1f07
+Create Date: 2026-10-18 18:55:03.118420
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d5e3f1a9c2'
+down_revision: Union[str, None] = '4e8a2d6c1f07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match DISCOUNTED_PRICE_SQL in api/models/product.py
+DISCOUNTED_PRICE = (
+    'CAST(ROUND(CAST(unit_price AS NUMERIC)'
+    ' * (100 - CAST(discount_percentage AS NUMERIC)) / 100) AS INTEGER)'
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rewrites the table under an exclusive lock, every row is computed
+    op.add_column(
+        'product',
+        sa.Column(
+            'discounted_price',
+            sa.Integer(),
+            sa.Computed(DISCOUNTED_PRICE, persisted=True),
+        ),
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_product_discounted_price_sku',
+            'product',
+            ['discounted_price', 'sku'],
+            unique=False,
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_product_discounted_price_sku',
+            table_name='product',
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+
+    op.drop_column('product', 'discounted_price')
@@ -40,5 +40,9 @@ setup(
     entry_points={
         "console_scripts": ["api = api.__main__:main"]
     },
-    extras_require={"dev": read_requirements("requirements-dev.txt")},
+    extras_require={
+        "dev": read_requirements("requirements-dev.txt"),
+        "pyjwt": ["PyJWT>=2.8"],
+        "redis": ["redis>=5"],
+    },
 )
@@ -1,13 +1,18 @@
 import os
+from contextlib import contextmanager
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlmodel import SQLModel, Session, text
 
 os.environ["FORCE_ENV_FOR_DYNACONF"] = "testing"  # noqa
 
-from api.db import engine, get_session
+from api.db import async_engine, engine, get_session
 from api.app import app  # type: ignore
+from api.auth import token_cache, user_cache
+from api.services.search import search_backend
+from api.utils.response_cache import response_cache
 from api.security import get_password_hash
 
 from .factories import UserFactory
@@ -37,6 +42,10 @@ def session(db_engine):
             session.exec(text(f"DELETE FROM {table.name};"))
             session.commit()
         session.close()
+        user_cache.clear()
+        token_cache.clear()
+        search_backend.clear()
+        response_cache.invalidate()
 
 
 @pytest.fixture(scope="function")
@@ -60,6 +69,38 @@ def auth_client():
     return client
 
 
+@pytest.fixture(scope="function")
+def max_queries(db_engine):
+    """Fails the test if the wrapped block runs more than `n` statements
+
+    with max_queries(2):
+        client.get("/v1/products")
+    """
+
+    @contextmanager
+    def _max_queries(n: int):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engines = (db_engine, async_engine.sync_engine)
+        for _engine in engines:
+            event.listen(_engine, "before_cursor_execute", count)
+        try:
+            yield statements
+        finally:
+            for _engine in engines:
+                event.remove(_engine, "before_cursor_execute", count)
+
+        assert len(statements) <= n, (
+            f"{len(statements)} queries executed, expected at most {n}:\n"
+            + "\n".join(statements)
+        )
+
+    return _max_queries
+
+
 def remove_db():
     try:
         os.remove("testing.db")
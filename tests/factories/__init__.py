@@ -1,6 +1,7 @@
 from .user import UserFactory, AddressFactory
 from .product import CategoryFactory, ProductFactory
 from .cart import CartFactory, CartItemFactory
+from .order import OrderFactory, OrderItemFactory
 
 __all__ = [
     "UserFactory",
@@ -9,4 +10,6 @@ __all__ = [
     "ProductFactory",
     "CartFactory",
     "CartItemFactory",
+    "OrderFactory",
+    "OrderItemFactory",
 ]
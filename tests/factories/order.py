@@ -0,0 +1,28 @@
+import factory
+
+from api import models
+
+
+class OrderFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = models.Orders
+        sqlalchemy_session_persistence = "commit"
+
+    total_amount = 1000
+    total_discounted_amount = 1000
+    user_id = None
+
+
+class OrderItemFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = models.OrderItem
+        sqlalchemy_session_persistence = "commit"
+
+    sku = factory.Sequence(lambda n: "SKU{}".format(n))
+    order_id = None
+    name = factory.Sequence(lambda n: "product {}".format(n))
+    header = factory.Faker("name")
+    description = factory.Faker("text")
+    unit_price = 500
+    quantity = 2
+    category_name = factory.Faker("first_name")
@@ -16,7 +16,7 @@ class ProductFactory(factory.alchemy.SQLAlchemyModelFactory):
         model = models.Product
         sqlalchemy_session_persistence = "commit"
 
-    sku = factory.Sequence(lambda n: "sku{}".format(n))
+    sku = factory.Sequence(lambda n: "SKU{}".format(n))
     name = factory.Sequence(lambda n: "product {}".format(n))
     header = factory.Faker("name")
     description = factory.Faker("text")
@@ -9,5 +9,7 @@ def set_factories_session(db):
         ProductFactory,
         CartFactory,
         CartItemFactory,
+        OrderFactory,
+        OrderItemFactory,
     ):
         factory._meta.sqlalchemy_session = db
@@ -1,7 +1,19 @@
+from datetime import timedelta
+
+import pytest
 from fastapi.testclient import TestClient
+from jose import JWTError
 
 from api.security import get_password_hash
-from api.auth import create_reset_password_token
+from api.auth import (
+    _jose_decode,
+    _pyjwt_decode,
+    create_jwt_token,
+    create_reset_password_token,
+    decode_token,
+    token_cache,
+    user_cache,
+)
 from tests.factories import UserFactory
 
 
@@ -39,3 +51,48 @@ def test_change_password(client: TestClient):
     )
 
     assert response.status_code == 204
+
+
+def test_change_password_invalidates_cached_user(client: TestClient):
+    user = UserFactory.create(password=get_password_hash("old_pass123"))
+    login_data = {"username": user.username, "password": "old_pass123"}
+    assert client.post("/auth/token", data=login_data).status_code == 200
+
+    token = create_reset_password_token({"sub": user.username})
+    client.post(
+        "/auth/change-password",
+        json={"token": token, "password": "new_pass123"},
+    )
+
+    login_data["password"] = "new_pass123"
+    assert client.post("/auth/token", data=login_data).status_code == 200
+    assert user_cache.stats()["hits"] > 0
+
+
+def test_decoded_token_is_cached_until_expiry():
+    token = create_jwt_token({"sub": "cached"}, timedelta(minutes=5))
+    expired = create_jwt_token({"sub": "expired"}, timedelta(minutes=-1))
+
+    assert decode_token(token)["sub"] == "cached"
+    assert decode_token(token)["sub"] == "cached"
+    assert token_cache.stats()["hits"] == 1
+    with pytest.raises(JWTError):
+        decode_token(expired)
+    assert len(token_cache) == 1
+
+
+def test_tampered_token_is_not_served_from_cache():
+    token = create_jwt_token({"sub": "cached"}, timedelta(minutes=5))
+    decode_token(token)
+
+    with pytest.raises(JWTError):
+        decode_token(token[:-2] + ("A" if token[-2] != "A" else "B") + "A")
+
+
+def test_pyjwt_backend_matches_jose():
+    pytest.importorskip("jwt")
+    token = create_jwt_token({"sub": "user"}, timedelta(minutes=5))
+
+    assert _pyjwt_decode(token) == _jose_decode(token)
+    with pytest.raises(JWTError):
+        _pyjwt_decode(token + "x")
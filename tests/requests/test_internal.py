@@ -0,0 +1,66 @@
+from fastapi.testclient import TestClient
+
+from api.routes import internal
+
+METRICS_HEADERS = {"Authorization": "Bearer TEST_METRICS_TOKEN"}
+
+
+def test_get_metrics(auth_client: TestClient):
+    auth_client.get("/v1/users/addresses")
+
+    response = auth_client.get("/internal/metrics", headers=METRICS_HEADERS)
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["user_cache"]["size"] > 0
+    assert data["user_cache"]["hits"] + data["user_cache"]["misses"] > 0
+
+
+def test_get_pool_metrics(client: TestClient):
+    client.get("/v1/products")
+
+    data = client.get("/internal/metrics", headers=METRICS_HEADERS).json()
+
+    assert data["db_async_pool"]["checkouts"] > 0
+    assert data["db_async_pool"]["checked_out"] == 0
+    assert "overflow" in data["db_pool"]
+
+
+def test_server_timing_counts_request_queries(client: TestClient):
+    response = client.get("/v1/products")
+
+    header = response.headers["server-timing"]
+    assert header.startswith("app;dur=")
+    assert ";desc=" in header and " 0 queries" not in header
+
+
+def test_get_prometheus_metrics(client: TestClient):
+    client.get("/v1/products")
+    client.get("/not-a-route")
+
+    response = client.get(
+        "/internal/metrics/prometheus", headers=METRICS_HEADERS
+    )
+    body = response.text
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/v1/products/",status="200"}'
+    ) in body
+    assert (
+        'http_request_db_queries_count{method="GET",route="<unmatched>"}'
+    ) in body
+    assert "api_db_async_pool_checkouts " in body
+
+
+def test_metrics_need_the_token(auth_client: TestClient, monkeypatch):
+    # A user's access token isn't the metrics token
+    assert auth_client.get("/internal/metrics").status_code == 401
+
+    monkeypatch.setattr(internal, "METRICS_TOKEN", "")
+    response = auth_client.get("/internal/metrics", headers=METRICS_HEADERS)
+
+    assert response.status_code == 404
@@ -2,8 +2,17 @@ from fastapi.testclient import TestClient
 from sqlmodel import select, Session
 from uuid import UUID
 
-from tests.providers import CartFactory, CartItemFactory, ProductFactory
-from api.models import User
+from tests.providers import (
+    CartFactory,
+    CartItemFactory,
+    ProductFactory,
+    UserFactory,
+)
+from api.app import app
+from api.models import CartItem, User
+from api.routes.v1 import cart as cart_routes
+from api.serializers.cart import MAX_CART_ITEMS_PER_UPDATE
+from api.services.carts import create_cart_token, read_cart_token
 
 
 def test_get_cart(auth_client: TestClient, session: Session):
@@ -35,7 +44,10 @@ def test_sync_cart(
     cart_id = res.json()["data"]["id"]
     for _ in range(3):
         CartItemFactory.create(cart_id=UUID(cart_id))
-    response = auth_client.post("/v1/carts/sync_ip_to_user")
+    response = auth_client.post(
+        "/v1/carts/sync_ip_to_user",
+        headers={"X-Cart-Token": res.headers["X-Cart-Token"]},
+    )
     assert response.status_code == 204
 
 
@@ -48,3 +60,204 @@ def test_add_cart_item(client: TestClient):
     )
 
     assert response.status_code == 200
+
+
+def test_add_cart_item_needs_the_product(client: TestClient):
+    product = ProductFactory.create()
+    client.post("/v1/carts", json={})
+
+    missing = client.put("/v1/carts/items/NOSUCH1", json={"quantity": 1})
+    lowercase = client.put(
+        f"/v1/carts/items/{product.sku.lower()}", json={"quantity": 1}
+    )
+
+    assert missing.status_code == 404
+    assert lowercase.status_code == 200
+    assert lowercase.json()["_meta"]["_links"]["product"]["href"].endswith(
+        product.sku
+    )
+
+
+def test_add_cart_item_rejects_negative_quantities(client: TestClient):
+    product = ProductFactory.create()
+    client.post("/v1/carts", json={})
+
+    response = client.put(
+        f"/v1/carts/items/{product.sku}", json={"quantity": -1}
+    )
+
+    assert response.status_code == 422
+
+
+def test_get_cart_query_count(
+    auth_client: TestClient, session: Session, max_queries
+):
+    user = session.exec(
+        select(User).where(User.username == "auth_user")
+    ).first()
+    cart = CartFactory.create(user_id=user.id)
+    for _ in range(10):
+        CartItemFactory.create(cart_id=cart.id)
+
+    with max_queries(2):
+        response = auth_client.get("/v1/carts/current")
+
+    assert len(response.json()["data"]["items"]) == 10
+
+
+def test_update_cart_items(client: TestClient, session: Session):
+    cart_id = UUID(client.post("/v1/carts", json={}).json()["data"]["id"])
+    kept = CartItemFactory.create(cart_id=cart_id, quantity=1)
+    removed = CartItemFactory.create(cart_id=cart_id, quantity=1)
+    added = ProductFactory.create()
+
+    response = client.put(
+        "/v1/carts/items",
+        json=[
+            {"sku": kept.product_id, "quantity": 4},
+            {"sku": removed.product_id, "quantity": 0},
+            {"sku": added.sku, "quantity": 2},
+        ],
+    )
+    data = response.json()
+
+    assert response.status_code == 200
+    quantities = {
+        item["_meta"]["_links"]["product"]["href"].split("/")[-1]: item[
+            "quantity"
+        ]
+        for item in data["data"]["items"]
+    }
+    assert quantities == {kept.product_id: 4, added.sku: 2}
+
+
+def test_update_cart_items_limits_the_batch(client: TestClient):
+    client.post("/v1/carts", json={})
+    items = [
+        {"sku": f"SKU{index}", "quantity": 1}
+        for index in range(MAX_CART_ITEMS_PER_UPDATE + 1)
+    ]
+
+    response = client.put("/v1/carts/items", json=items)
+
+    assert response.status_code == 422
+
+
+def test_update_cart_items_unknown_sku(client: TestClient, session: Session):
+    cart_id = UUID(client.post("/v1/carts", json={}).json()["data"]["id"])
+    product = ProductFactory.create()
+
+    response = client.put(
+        "/v1/carts/items",
+        json=[
+            {"sku": product.sku, "quantity": 1},
+            {"sku": "MISSING1", "quantity": 1},
+        ],
+    )
+
+    assert response.status_code == 404
+    assert "MISSING1" in response.json()["detail"]
+    assert not session.exec(
+        select(CartItem).where(CartItem.cart_id == cart_id)
+    ).all()
+
+
+def test_update_cart_items_query_count(client: TestClient, max_queries):
+    client.post("/v1/carts", json={})
+    items = [
+        {"sku": ProductFactory.create().sku, "quantity": 1} for _ in range(10)
+    ]
+
+    with max_queries(5):
+        response = client.put("/v1/carts/items", json=items)
+
+    assert len(response.json()["data"]["items"]) == 10
+
+
+def test_cart_found_by_token(client: TestClient, monkeypatch, max_queries):
+    monkeypatch.setattr(cart_routes, "IP_FALLBACK", False)
+    response = client.post("/v1/carts", json={})
+    token = response.headers["X-Cart-Token"]
+    assert client.cookies["cart_token"] == token
+
+    with max_queries(2):
+        by_cookie = client.get("/v1/carts/current")
+    by_header = TestClient(app).get(
+        "/v1/carts/current", headers={"X-Cart-Token": token}
+    )
+
+    cart_id = response.json()["data"]["id"]
+    assert by_cookie.json()["data"]["id"] == cart_id
+    assert by_header.json()["data"]["id"] == cart_id
+
+
+def test_cart_tampered_token(client: TestClient, monkeypatch):
+    monkeypatch.setattr(cart_routes, "IP_FALLBACK", False)
+    cart = CartFactory.create(user_id=None)
+    token = create_cart_token(cart.id)
+
+    response = client.get(
+        "/v1/carts/current", headers={"X-Cart-Token": token[:-2] + "xx"}
+    )
+
+    assert response.status_code == 404
+
+
+def test_ip_cart_gets_a_token(client: TestClient):
+    cart = CartFactory.create(user_id=None, origin_ip="testclient")
+
+    response = client.get("/v1/carts/current")
+
+    assert response.json()["data"]["id"] == str(cart.id)
+    assert read_cart_token(response.headers["X-Cart-Token"]) == cart.id
+
+
+def test_synced_cart_not_reachable_by_token(
+    client: TestClient, auth_client: TestClient, monkeypatch
+):
+    monkeypatch.setattr(cart_routes, "IP_FALLBACK", False)
+    token = client.post("/v1/carts", json={}).headers["X-Cart-Token"]
+
+    synced = auth_client.post(
+        "/v1/carts/sync_ip_to_user", headers={"X-Cart-Token": token}
+    )
+    response = client.get("/v1/carts/current")
+
+    assert synced.status_code == 204
+    assert auth_client.get("/v1/carts/current").status_code == 200
+    assert response.status_code == 404
+
+
+def test_update_cart_items_normalizes_skus(client: TestClient):
+    client.post("/v1/carts", json={})
+    product = ProductFactory.create(sku="ABC123")
+
+    response = client.put(
+        "/v1/carts/items", json=[{"sku": "abc123", "quantity": 2}]
+    )
+
+    assert response.status_code == 200
+    assert response.json()["data"]["items"][0]["quantity"] == 2
+    assert product.sku in str(response.json()["data"]["items"][0]["_meta"])
+
+
+def test_clients_sharing_an_ip_get_separate_carts(client: TestClient):
+    client.post("/v1/carts", json={})
+    neighbour = TestClient(app)
+
+    response = neighbour.get("/v1/carts/current")
+
+    assert response.status_code == 404
+    assert "X-Cart-Token" not in response.headers
+
+
+def test_legacy_ip_cart_is_claimed_once(client: TestClient):
+    cart = CartFactory.create(user_id=None, origin_ip="testclient")
+    CartFactory.create(user_id=UserFactory.create().id, origin_ip="testclient")
+
+    claimed = client.get("/v1/carts/current")
+    neighbour = TestClient(app).get("/v1/carts/current")
+
+    assert claimed.json()["data"]["id"] == str(cart.id)
+    assert client.get("/v1/carts/current").status_code == 200
+    assert neighbour.status_code == 404
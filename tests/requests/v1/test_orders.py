@@ -1,8 +1,23 @@
+import json
+from datetime import datetime, timedelta
+
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from api.models import User
-from tests.factories import CartFactory, CartItemFactory
+from api.app import app  # type: ignore
+from api.db import get_async_read_session, get_async_uri
+from api.models import Coupon, User
+from api.routes.v1 import orders as order_routes
+from tests.factories import (
+    CartFactory,
+    CartItemFactory,
+    OrderFactory,
+    OrderItemFactory,
+    ProductFactory,
+    UserFactory,
+)
 
 
 def test_create_order(auth_client: TestClient, session: Session):
@@ -16,3 +31,148 @@ def test_create_order(auth_client: TestClient, session: Session):
     response = auth_client.post("v1/orders", json={})
 
     assert response.status_code == 201
+
+
+def test_create_order_query_count(
+    auth_client: TestClient, session: Session, max_queries
+):
+    user = session.exec(
+        select(User).where(User.username == "auth_user")
+    ).first()
+    cart = CartFactory.create(user_id=user.id)
+    for _ in range(10):
+        CartItemFactory.create(cart_id=cart.id)
+
+    with max_queries(5):
+        response = auth_client.post("v1/orders", json={})
+
+    assert response.status_code == 201
+    assert len(response.json()["data"]["items"]) == 10
+
+
+def test_create_order_totals_and_items(
+    auth_client: TestClient, session: Session
+):
+    user = session.exec(
+        select(User).where(User.username == "auth_user")
+    ).first()
+    cart = CartFactory.create(user_id=user.id)
+    discounted = ProductFactory.create(unit_price=1000, discount_percentage=25)
+    CartItemFactory.create(cart_id=cart.id, product=discounted, quantity=2)
+    CartItemFactory.create(
+        cart_id=cart.id, product=ProductFactory.create(unit_price=300)
+    )
+    session.add(
+        Coupon(
+            code="TENOFF",
+            discount_percentage=10,
+            expiration=datetime.now() + timedelta(days=1),
+        )
+    )
+    session.commit()
+
+    response = auth_client.post("v1/orders", json={"coupon_code": "TENOFF"})
+    data = response.json()["data"]
+
+    assert response.status_code == 201
+    assert data["total_amount"] == 1800
+    assert data["total_discounted_amount"] == 1620
+    assert data["coupon_code"] == "TENOFF"
+    items = {item["sku"]: item for item in data["items"]}
+    assert items[discounted.sku]["quantity"] == 2
+    assert items[discounted.sku]["unit_price"] == 1000
+    assert items[discounted.sku]["discount_percentage"] == 25
+    assert items[discounted.sku]["category_name"] == discounted.category.name
+
+
+def _create_orders(session: Session, username: str, count: int) -> list:
+    user = session.exec(select(User).where(User.username == username)).one()
+    started_at = datetime(2024, 1, 1)
+    orders = []
+    for index in range(count):
+        order = OrderFactory.create(
+            user_id=user.id, created_at=started_at + timedelta(days=index)
+        )
+        OrderItemFactory.create_batch(2, order_id=order.id)
+        orders.append(str(order.id))
+    # Newest first
+    return orders[::-1]
+
+
+def test_list_orders_by_cursor(
+    auth_client: TestClient, session: Session, max_queries
+):
+    orders = _create_orders(session, "auth_user", 5)
+    OrderFactory.create(user_id=UserFactory.create().id)
+
+    with max_queries(2):
+        first = auth_client.get("/v1/orders", params={"limit": 2}).json()
+    second = auth_client.get(
+        "/v1/orders",
+        params={"cursor": first["_meta"]["next_cursor"], "limit": 2},
+    ).json()
+    last = auth_client.get(
+        "/v1/orders",
+        params={"cursor": second["_meta"]["next_cursor"], "limit": 2},
+    ).json()
+    back = auth_client.get(
+        "/v1/orders",
+        params={"cursor": second["_meta"]["previous_cursor"], "limit": 2},
+    ).json()
+
+    def ids(page):
+        return [order["data"]["id"] for order in page["data"]]
+
+    assert ids(first) == orders[:2]
+    assert ids(second) == orders[2:4]
+    assert ids(last) == orders[4:]
+    assert ids(back) == orders[:2]
+    assert last["_meta"]["next_cursor"] is None
+    assert len(first["data"][0]["data"]["items"]) == 2
+
+
+def test_get_order(auth_client: TestClient, session: Session):
+    order_id = _create_orders(session, "auth_user", 1)[0]
+    other = OrderFactory.create(user_id=UserFactory.create().id)
+
+    response = auth_client.get(f"/v1/orders/{order_id}")
+
+    assert response.status_code == 200
+    assert response.json()["data"]["id"] == order_id
+    assert len(response.json()["data"]["items"]) == 2
+    assert auth_client.get(f"/v1/orders/{other.id}").status_code == 404
+
+
+def test_get_order_missing_on_the_replica(
+    auth_client: TestClient, session: Session, tmp_path
+):
+    # An empty database standing in for a replica lagging behind
+    replica_uri = f"sqlite:///{tmp_path / 'replica.db'}"
+    SQLModel.metadata.create_all(create_engine(replica_uri))
+    replica = create_async_engine(get_async_uri(replica_uri))
+
+    async def lagging_read_session():
+        async with AsyncSession(replica) as replica_session:
+            yield replica_session
+
+    order_id = _create_orders(session, "auth_user", 1)[0]
+    app.dependency_overrides[get_async_read_session] = lagging_read_session
+    try:
+        response = auth_client.get(f"/v1/orders/{order_id}")
+    finally:
+        del app.dependency_overrides[get_async_read_session]
+
+    assert response.status_code == 200
+    assert response.json()["data"]["id"] == order_id
+
+
+def test_export_orders(auth_client: TestClient, session: Session, monkeypatch):
+    monkeypatch.setattr(order_routes, "EXPORT_BATCH_SIZE", 2)
+    orders = _create_orders(session, "auth_user", 5)
+
+    response = auth_client.get("/v1/orders/export")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [line["data"]["id"] for line in lines] == orders
+    assert all(len(line["data"]["items"]) == 2 for line in lines)
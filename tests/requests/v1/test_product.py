@@ -1,6 +1,21 @@
+import json
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine, select
 
-from tests.providers import ProductFactory
+from api.db import get_async_uri, get_engines
+from api.models import Category, Product
+from api.models.loaders import PRODUCT_LISTING
+from api.models.product import discounted_price
+from api.serializers.product import (
+    BaseMultipleProductsResponse,
+    dump_products_page,
+)
+from api.services.search import InMemorySearchBackend, search_backend
+from api.utils.replicas import _Replica
+from tests.providers import CategoryFactory, ProductFactory
 
 
 def test_get_product(client: TestClient):
@@ -27,3 +42,205 @@ def test_list_products(client: TestClient):
 
     assert response.status_code == 200
     assert len(data["data"]) == 5
+
+
+def test_list_products_with_cursor(client: TestClient):
+    skus = sorted(ProductFactory.create().sku for _ in range(5))
+
+    response = client.get("/v1/products", params={"cursor": "", "limit": 2})
+    data = response.json()
+
+    assert response.status_code == 200
+    assert [p["data"]["sku"] for p in data["data"]] == skus[:2]
+    assert data["_meta"]["total_rows"] is None
+    assert data["_meta"]["previous_cursor"] is None
+
+    next_page = client.get(
+        "/v1/products",
+        params={"cursor": data["_meta"]["next_cursor"], "limit": 2},
+    ).json()
+    assert [p["data"]["sku"] for p in next_page["data"]] == skus[2:4]
+
+    previous_page = client.get(
+        "/v1/products",
+        params={"cursor": next_page["_meta"]["previous_cursor"], "limit": 2},
+    ).json()
+    assert [p["data"]["sku"] for p in previous_page["data"]] == skus[:2]
+
+
+def test_list_products_with_invalid_cursor(client: TestClient):
+    response = client.get("/v1/products", params={"cursor": "invalid"})
+
+    assert response.status_code == 400
+
+
+def test_list_products_query_count(client: TestClient, max_queries):
+    for _ in range(10):
+        ProductFactory.create()
+
+    with max_queries(2):
+        response = client.get("/v1/products")
+
+    assert len(response.json()["data"]) == 10
+
+
+def test_search_products(client: TestClient):
+    ProductFactory.create(name="Blue shirt", header="Cotton")
+    best = ProductFactory.create(name="Red shirt", header="Red cotton")
+    hat = ProductFactory.create(name="Red hat", header="Wool")
+
+    response = client.get("/v1/products", params={"name": "red shi"})
+    data = response.json()
+
+    assert response.status_code == 200
+    assert [p["data"]["sku"] for p in data["data"]] == [best.sku]
+
+    response = client.get("/v1/products", params={"name": "red"})
+    data = response.json()
+
+    assert [p["data"]["sku"] for p in data["data"]] == [best.sku, hat.sku]
+    assert len(client.get("/v1/products?name=cott").json()["data"]) == 2
+
+
+def test_too_broad_search_is_rejected(client: TestClient, monkeypatch):
+    if not isinstance(search_backend, InMemorySearchBackend):
+        pytest.skip("only the in-memory backend caps matches")
+    monkeypatch.setattr(search_backend, "max_results", 2)
+    for _ in range(3):
+        ProductFactory.create(name="Striped sock")
+
+    response = client.get("/v1/products", params={"name": "sock"})
+
+    assert response.status_code == 400
+    assert "more than 2" in response.json()["detail"]
+
+
+def test_search_sees_new_products(client: TestClient):
+    ProductFactory.create(name="Green shirt")
+    assert len(client.get("/v1/products?name=gre").json()["data"]) == 1
+
+    ProductFactory.create(name="Green hat")
+    assert len(client.get("/v1/products?name=gre").json()["data"]) == 2
+
+
+def test_list_categories(client: TestClient):
+    CategoryFactory.create(name="Shoes")
+    CategoryFactory.create(name="Hats")
+
+    response = client.get("/v1/products/categories")
+
+    assert response.status_code == 200
+    assert response.json() == [{"name": "Hats"}, {"name": "Shoes"}]
+
+
+def test_get_product_not_modified(client: TestClient):
+    product = ProductFactory.create()
+    response = client.get(f"/v1/products/{product.sku}")
+    etag = response.headers["etag"]
+
+    response = client.get(
+        f"/v1/products/{product.sku}", headers={"If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_product_change_invalidates_cached_response(
+    client: TestClient, session: Session
+):
+    product = ProductFactory.create(name="Old name")
+    first = client.get(f"/v1/products/{product.sku}")
+
+    product = session.get(Product, product.sku)
+    product.name = "New name"
+    session.commit()
+
+    second = client.get(
+        f"/v1/products/{product.sku}",
+        headers={"If-None-Match": first.headers["etag"]},
+    )
+
+    assert second.status_code == 200
+    assert second.json()["data"]["name"] == "New name"
+
+
+def test_cached_responses_are_rendered_from_the_primary(
+    client: TestClient, monkeypatch, tmp_path
+):
+    # An empty database standing in for a replica lagging behind
+    replica_uri = f"sqlite:///{tmp_path / 'replica.db'}"
+    SQLModel.metadata.create_all(create_engine(replica_uri))
+    replica = _Replica(create_async_engine(get_async_uri(replica_uri)))
+    monkeypatch.setattr(get_engines().replica_router, "replicas", [replica])
+    product = ProductFactory.create()
+
+    response = client.get(f"/v1/products/{product.sku}")
+
+    assert response.status_code == 200
+    assert response.json()["data"]["sku"] == product.sku
+
+
+def test_fast_listing_matches_response_model(session: Session):
+    for _ in range(3):
+        ProductFactory.create(cover_image_key=None)
+    products = session.exec(
+        select(Product).join(Category).options(*PRODUCT_LISTING)
+    ).all()
+    paginated_result = {
+        "objects": products,
+        "page": 2,
+        "limit": 3,
+        "total_rows": 9,
+        "has_next": True,
+        "filters": {"name": "shirt"},
+    }
+
+    fast = dump_products_page(**paginated_result)
+    slow = BaseMultipleProductsResponse(**paginated_result).model_dump_json()
+
+    assert json.loads(fast) == json.loads(slow)
+
+
+def test_discounted_price_in_cents(client: TestClient):
+    product = ProductFactory.create(unit_price=999, discount_percentage=12.5)
+    halfway = ProductFactory.create(unit_price=1999, discount_percentage=50)
+
+    response = client.get(f"/v1/products/{product.sku}")
+
+    assert response.json()["data"]["discounted_price"] == 874
+    assert halfway.discounted_price == 1000
+    # The in-Python twin rounds the same way
+    assert discounted_price(999, 12.5) == 874
+    assert discounted_price(1999, 50) == 1000
+
+
+def test_list_products_by_price(client: TestClient):
+    for sku, unit_price, discount in [
+        ("PRICE1", 1000, 0),
+        ("PRICE2", 2000, 50),
+        ("PRICE3", 500, 0),
+        ("PRICE4", 3000, 10),
+        ("PRICE5", 800, 0),
+    ]:
+        ProductFactory.create(
+            sku=sku, unit_price=unit_price, discount_percentage=discount
+        )
+    params = {"min_price": 800, "max_price": 2700, "sort": "price"}
+
+    page = client.get("/v1/products", params=params).json()
+    first = client.get(
+        "/v1/products", params={**params, "cursor": "", "limit": 2}
+    ).json()
+    second = client.get(
+        "/v1/products",
+        params={**params, "cursor": first["_meta"]["next_cursor"]},
+    ).json()
+
+    def skus(data):
+        return [p["data"]["sku"] for p in data["data"]]
+
+    assert skus(page) == ["PRICE5", "PRICE1", "PRICE2", "PRICE4"]
+    assert skus(first) == ["PRICE5", "PRICE1"]
+    assert skus(second) == ["PRICE2", "PRICE4"]
+    assert "min_price=800" in first["_meta"]["_links"][-1]["next"]
@@ -3,6 +3,7 @@ from fastapi.testclient import TestClient
 from sqlmodel import select, Session
 from tests.factories import AddressFactory
 from api.models import User
+from api.security import verify_password
 
 
 def test_create_user(client: TestClient):
@@ -83,3 +84,20 @@ def test_get_address(auth_client: TestClient, session: Session):
     assert res_json["state"] == address.state
     assert res_json["country"] == address.country
     assert res_json["zip_code"] == address.zip_code
+
+
+def test_create_user_hashes_password(client: TestClient, session: Session):
+    client.post(
+        "/v1/users",
+        json={
+            "email": "hashed@email.com",
+            "username": "hashed_user",
+            "password": "pass123",
+        },
+    )
+
+    user = session.exec(
+        select(User).where(User.username == "hashed_user")
+    ).first()
+    assert user.password != "pass123"
+    assert verify_password("pass123", user.password)
@@ -0,0 +1,161 @@
+import os
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from api.app import app  # type: ignore
+from api.models import CartItem, OrderItem, User
+from api.services import carts
+from api.services.carts import (
+    InMemoryCartStore,
+    RedisCartStore,
+    create_cart_token,
+    read_cart_token,
+)
+from tests.factories import CartFactory, CartItemFactory, ProductFactory
+
+STORES = ["memory"]
+if os.environ.get("TEST_REDIS_URL"):
+    STORES.append("redis")
+
+
+@pytest.fixture(params=STORES)
+def cart_store(request, monkeypatch):
+    if request.param == "memory":
+        store = InMemoryCartStore(maxsize=100)
+    else:
+        store = RedisCartStore.from_url(
+            os.environ["TEST_REDIS_URL"], prefix=f"test-{uuid4().hex}"
+        )
+    monkeypatch.setattr(carts, "_cart_store", store)
+    return store
+
+
+def cart_rows(session: Session, cart_id: UUID) -> dict:
+    session.expire_all()
+    return dict(
+        session.exec(
+            select(CartItem.product_id, CartItem.quantity).where(
+                CartItem.cart_id == cart_id
+            )
+        ).all()
+    )
+
+
+def test_changes_are_written_behind(
+    client: TestClient, session: Session, cart_store, db_engine, max_queries
+):
+    cart_id = UUID(client.post("/v1/carts", json={}).json()["data"]["id"])
+    kept = CartItemFactory.create(cart_id=cart_id, quantity=1).product_id
+    removed = CartItemFactory.create(cart_id=cart_id, quantity=1).product_id
+    added = ProductFactory.create().sku
+    client.get("/v1/carts/current")
+
+    with max_queries(2) as statements:
+        response = client.put(
+            "/v1/carts/items",
+            json=[
+                {"sku": kept, "quantity": 4},
+                {"sku": removed, "quantity": 0},
+                {"sku": added, "quantity": 2},
+            ],
+        )
+
+    expected = {kept: 4, added: 2}
+    assert response.status_code == 200
+    assert all(s.lstrip().startswith("SELECT") for s in statements)
+    assert len(response.json()["data"]["items"]) == 2
+    assert cart_rows(session, cart_id) == {kept: 1, removed: 1}
+
+    assert cart_store.flush_dirty(db_engine) == 1
+    assert cart_rows(session, cart_id) == expected
+    assert cart_store.flush_dirty(db_engine) == 0
+
+
+def test_checkout_flushes_the_cart(
+    auth_client: TestClient, session: Session, cart_store
+):
+    user = session.exec(select(User).where(User.username == "auth_user")).one()
+    cart = CartFactory.create(user_id=user.id)
+    product = ProductFactory.create(unit_price=500)
+    auth_client.put(f"/v1/carts/items/{product.sku}", json={"quantity": 3})
+
+    response = auth_client.post("/v1/orders", json={})
+
+    assert response.status_code == 201
+    assert response.json()["data"]["total_amount"] == 1500
+    assert cart_rows(session, cart.id) == {product.sku: 3}
+    assert len(session.exec(select(OrderItem)).all()) == 1
+
+
+def test_sync_ip_cart_merges_items(
+    client: TestClient,
+    auth_client: TestClient,
+    session: Session,
+    cart_store,
+    db_engine,
+):
+    user = session.exec(select(User).where(User.username == "auth_user")).one()
+    user_cart = CartFactory.create(user_id=user.id)
+    shared = ProductFactory.create()
+    CartItemFactory.create(cart_id=user_cart.id, product=shared, quantity=1)
+    ip_cart_id = UUID(client.post("/v1/carts", json={}).json()["data"]["id"])
+    other = ProductFactory.create()
+    client.put(
+        "/v1/carts/items",
+        json=[
+            {"sku": shared.sku, "quantity": 2},
+            {"sku": other.sku, "quantity": 1},
+        ],
+    )
+
+    response = auth_client.post(
+        "/v1/carts/sync_ip_to_user",
+        headers={"X-Cart-Token": client.cookies["cart_token"]},
+    )
+    cart_store.flush_dirty(db_engine)
+
+    assert response.status_code == 204
+    assert cart_rows(session, user_cart.id) == {shared.sku: 3, other.sku: 1}
+    assert cart_rows(session, ip_cart_id) == {}
+
+
+def test_shutdown_writes_back_dirty_carts(
+    session: Session, db_engine, monkeypatch
+):
+    store = InMemoryCartStore(maxsize=100)
+    monkeypatch.setattr(carts, "_cart_store", store)
+    flusher = carts.CartFlusher(store, db_engine, interval=3600)
+    flusher.start()
+    monkeypatch.setattr(carts, "_cart_flusher", flusher)
+    cart_id = CartFactory.create().id
+    sku = ProductFactory.create().sku
+
+    with TestClient(app):
+        store.set_quantities(session, cart_id, {sku: 2})
+        assert cart_rows(session, cart_id) == {}
+
+    assert cart_rows(session, cart_id) == {sku: 2}
+    assert carts._cart_flusher is None
+
+
+def test_memory_store_forgets_only_clean_carts():
+    store = InMemoryCartStore(maxsize=1)
+    dirty, clean = uuid4(), uuid4()
+    store._apply(dirty, {"SKU1": 1})
+    store._hydrate(clean, {"SKU2": 1})
+
+    assert store._load(dirty) == {"SKU1": 1}
+    assert store._load(clean) is None
+
+
+def test_cart_token_round_trip():
+    cart_id = uuid4()
+    token = create_cart_token(cart_id)
+
+    assert read_cart_token(token) == cart_id
+    assert read_cart_token(f"{uuid4().hex}.{token.split('.')[1]}") is None
+    assert read_cart_token("not-a-token") is None
+    assert read_cart_token("çà.ü") is None
@@ -0,0 +1,182 @@
+import io
+import json
+import os
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, col, create_engine, delete, select
+
+from api.models import Category, Product
+from api.services.catalog import (
+    detect_format,
+    export_products,
+    import_products,
+)
+from tests.factories import CategoryFactory, ProductFactory
+
+CSV_HEADER = (
+    "sku,name,header,description,cover_image_key,unit_price,"
+    "discount_percentage,category_id\n"
+)
+
+
+def test_import_csv_upserts_in_chunks(session: Session, db_engine):
+    category = CategoryFactory.create()
+    ProductFactory.create(sku="OLD1", name="old name", category=category)
+    rows = "".join(
+        f"sku{index},Product {index},h,d,,{100 + index},0,{category.id}\n"
+        for index in range(5)
+    )
+    file = io.StringIO(
+        CSV_HEADER
+        + rows
+        + f"old1,new name,h,d,cover.png,50,10,{category.id}\n"
+    )
+    progress = []
+
+    report = import_products(
+        db_engine, file, "csv", chunk_size=2, on_progress=progress.append
+    )
+
+    assert (report.rows, report.imported, report.rejected) == (6, 6, 0)
+    assert len(progress) == 3
+    products = {p.sku: p for p in session.exec(select(Product)).all()}
+    assert set(products) == {"SKU0", "SKU1", "SKU2", "SKU3", "SKU4", "OLD1"}
+    session.refresh(products["OLD1"])
+    assert products["OLD1"].name == "new name"
+    assert products["OLD1"].cover_image_key == "cover.png"
+    assert products["SKU0"].cover_image_key is None
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"),
+    reason="COPY needs Postgres, set TEST_DATABASE_URL",
+)
+def test_import_copies_into_postgres():
+    engine = create_engine(os.environ["TEST_DATABASE_URL"])
+    SQLModel.metadata.create_all(engine)
+    prefix = f"CP{uuid4().hex[:8].upper()}"
+    skus = [f"{prefix}{index}" for index in range(3)]
+    with Session(engine) as pg_session:
+        category = Category(name=prefix)
+        pg_session.add(category)
+        pg_session.commit()
+        pg_session.add(
+            Product(
+                sku=skus[0],
+                name="old name",
+                header="h",
+                description="d",
+                unit_price=1,
+                discount_percentage=0,
+                category_id=category.id,
+            )
+        )
+        pg_session.commit()
+        category_id = category.id
+    rows = "".join(
+        f'{sku},"Product, {sku}",h,"say ""hi""",,{100 + index},0,'
+        f"{category_id}\n"
+        for index, sku in enumerate(skus)
+    )
+
+    try:
+        report = import_products(
+            engine, io.StringIO(CSV_HEADER + rows), "csv", chunk_size=2
+        )
+
+        assert (report.imported, report.rejected) == (3, 0)
+        with Session(engine) as pg_session:
+            products = pg_session.exec(
+                select(Product)
+                .where(col(Product.sku).in_(skus))
+                .order_by(Product.sku)
+            ).all()
+        assert [p.name for p in products] == [f"Product, {s}" for s in skus]
+        assert products[0].description == 'say "hi"'
+        assert all(p.cover_image_key is None for p in products)
+    finally:
+        with Session(engine) as pg_session:
+            pg_session.exec(delete(Product).where(col(Product.sku).in_(skus)))
+            pg_session.exec(delete(Category).where(Category.id == category_id))
+            pg_session.commit()
+
+
+def test_import_rejects_invalid_rows(session: Session, db_engine):
+    category = CategoryFactory.create()
+    file = io.StringIO(
+        "\n".join(
+            [
+                json.dumps(
+                    {
+                        "sku": "GOOD1",
+                        "name": "n",
+                        "header": "h",
+                        "description": "d",
+                        "unit_price": 10,
+                        "category_id": category.id,
+                    }
+                ),
+                json.dumps({"sku": "no-dashes", "name": "n"}),
+                json.dumps(
+                    {
+                        "sku": "GOOD2",
+                        "name": "n",
+                        "header": "h",
+                        "description": "d",
+                        "unit_price": 10,
+                        "category_id": category.id + 1,
+                    }
+                ),
+                "{not json",
+            ]
+        )
+    )
+    rejected = []
+
+    report = import_products(
+        db_engine,
+        file,
+        "jsonl",
+        on_reject=lambda number, reason: rejected.append(number),
+    )
+
+    assert (report.imported, report.rejected) == (1, 3)
+    assert rejected == [2, 3, 4]
+    assert session.exec(select(Product.sku)).all() == ["GOOD1"]
+
+
+def test_import_refreshes_product_search(client: TestClient, db_engine):
+    category = CategoryFactory.create()
+    ProductFactory.create(sku="SHOE1", name="Running shoe", category=category)
+    assert len(client.get("/v1/products?name=boot").json()["data"]) == 0
+
+    import_products(
+        db_engine,
+        io.StringIO(CSV_HEADER + f"BOOT1,Hiking boot,h,d,,10,0,{category.id}"),
+        "csv",
+    )
+
+    data = client.get("/v1/products?name=boot").json()["data"]
+    assert [product["data"]["sku"] for product in data] == ["BOOT1"]
+
+
+def test_export_round_trips(session: Session, db_engine):
+    category = CategoryFactory.create()
+    for sku in ("A001", "A002", "A003"):
+        ProductFactory.create(sku=sku, category=category)
+    for format in ("csv", "jsonl"):
+        file = io.StringIO()
+
+        assert export_products(db_engine, file, format, chunk_size=2) == 3
+
+        file.seek(0)
+        report = import_products(db_engine, file, format)
+        assert (report.imported, report.rejected) == (3, 0)
+
+
+def test_detect_format():
+    assert detect_format("catalog.CSV") == "csv"
+    assert detect_format("catalog.ndjson") == "jsonl"
+    assert detect_format("catalog.txt", "csv") == "csv"
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from api.enums import EMAIL_STATUS
+from api.models import EmailOutbox
+from api.services.email import EmailWorker, FakeTransport
+from tests.factories import UserFactory
+
+
+def make_worker(db_engine, transport, **kwargs) -> EmailWorker:
+    return EmailWorker(db_engine, transport, backoff_seconds=60, **kwargs)
+
+
+def test_forgot_password_queues_email(
+    client: TestClient, session: Session, db_engine
+):
+    user = UserFactory.create()
+    transport = FakeTransport()
+
+    response = client.post(
+        "/auth/forgot-password", json={"username": user.username}
+    )
+
+    assert response.status_code == 204
+    assert make_worker(db_engine, transport).run_once() == 1
+    assert [email["to"] for email in transport.sent] == [user.email]
+    email = session.exec(select(EmailOutbox)).one()
+    assert email.status == EMAIL_STATUS.SENT
+    # The reset token only went to the provider
+    assert email.html_body == ""
+
+
+def test_worker_sends_in_batches(session: Session, db_engine):
+    for index in range(5):
+        session.add(
+            EmailOutbox(to=f"{index}@x.com", subject="s", html_body="b")
+        )
+    session.commit()
+    transport = FakeTransport()
+    worker = make_worker(db_engine, transport, batch_size=2)
+
+    assert [worker.run_once() for _ in range(4)] == [2, 2, 1, 0]
+    assert len(transport.sent) == 5
+
+
+def test_failed_email_is_retried_with_backoff(session: Session, db_engine):
+    session.add(EmailOutbox(to="bounce@x.com", subject="s", html_body="b"))
+    session.commit()
+    transport = FakeTransport()
+    transport.failing["bounce@x.com"] = "Inactive recipient"
+    worker = make_worker(db_engine, transport, max_attempts=2)
+
+    assert worker.run_once() == 1
+    assert worker.run_once() == 0
+
+    email = session.exec(select(EmailOutbox)).one()
+    assert email.status == EMAIL_STATUS.PENDING
+    assert email.attempts == 1
+    assert email.html_body == "b"
+    assert email.last_error == "Inactive recipient"
+    assert email.next_attempt_at > datetime.utcnow() + timedelta(seconds=50)
+
+    email.next_attempt_at = datetime.utcnow()
+    session.commit()
+    assert worker.run_once() == 1
+
+    session.refresh(email)
+    assert email.status == EMAIL_STATUS.FAILED
+    assert email.attempts == 2
+    assert email.html_body == ""
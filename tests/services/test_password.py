@@ -0,0 +1,31 @@
+import asyncio
+from threading import Event
+
+import pytest
+
+from api.services.password import PasswordHasher, PasswordHasherBusy
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    hashed = asyncio.run(hasher.hash("pass123"))
+
+    assert asyncio.run(hasher.verify("pass123", hashed)) is True
+    assert asyncio.run(hasher.verify("wrong", hashed)) is False
+    assert hasher.stats()["completed"] == 3
+
+
+def test_rejects_when_queue_is_full():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    release = Event()
+    running = hasher.submit(release.wait)
+    queued = hasher.submit(release.wait)
+
+    with pytest.raises(PasswordHasherBusy):
+        hasher.submit(release.wait)
+
+    release.set()
+    running.result()
+    queued.result()
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.stats()["in_flight"] == 0
@@ -0,0 +1,38 @@
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks import serialization
+from benchmarks.journeys import JOURNEYS, main, run, seed
+
+
+def test_journeys_run_without_errors(session, client: TestClient):
+    fixtures = seed(session, users=2, products=5, categories=2)
+
+    results = run([client], fixtures, iterations=2, journeys=list(JOURNEYS))
+
+    assert set(results) == set(JOURNEYS)
+    for name, result in results.items():
+        assert result["errors"] == 0, name
+        assert result["iterations"] == 2
+        assert result["latency_ms"]["p50"] <= result["latency_ms"]["max"]
+
+
+def test_other_databases_need_reset(monkeypatch):
+    monkeypatch.setattr(
+        sys, "argv", ["journeys", "--db-uri", "postgresql:///shop"]
+    )
+
+    with pytest.raises(SystemExit):
+        main()
+
+
+def test_serialization_benchmark_runs(monkeypatch, capsys):
+    monkeypatch.setattr(
+        sys, "argv", ["serialization", "--items", "3", "--rounds", "2"]
+    )
+
+    serialization.main()
+
+    assert "speedup" in capsys.readouterr().out
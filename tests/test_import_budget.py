@@ -0,0 +1,58 @@
+import subprocess
+import sys
+
+from api.utils.importtime import (
+    parse_importtime,
+    profile_import,
+    total_seconds,
+)
+
+# Generous for slow CI machines, about 1s is typical
+IMPORT_BUDGET_SECONDS = 2.5
+
+
+def test_app_import_stays_within_budget():
+    timings = profile_import("from api.app import app")
+    modules = {timing.module for timing in timings}
+
+    assert total_seconds(timings) < IMPORT_BUDGET_SECONDS
+    # Only the email worker talks to Postmark
+    assert "postmarker" not in modules
+
+
+def test_app_import_creates_no_engine():
+    statement = (
+        "from api.app import app; import api.db; "
+        "assert api.db._engines is None"
+    )
+
+    subprocess.run([sys.executable, "-c", statement], check=True)
+
+
+def test_engines_read_settings_on_first_use():
+    statement = (
+        "from api.app import app; import api.db; "
+        "from api.config import settings; "
+        "settings.set('db.pool.size', 3); "
+        "settings.set('db.async_uri', 'sqlite+aiosqlite:///late.db'); "
+        "assert api.db.get_engines().engine.pool.size() == 3; "
+        "assert api.db.async_uri == 'sqlite+aiosqlite:///late.db'"
+    )
+
+    subprocess.run([sys.executable, "-c", statement], check=True)
+
+
+def test_parse_importtime():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   api.enums\n"
+        "import time:      1000 |       1120 | api\n"
+    )
+
+    timings = parse_importtime(output)
+
+    assert [(t.module, t.depth) for t in timings] == [
+        ("api.enums", 1),
+        ("api", 0),
+    ]
+    assert total_seconds(timings) == 0.00112
@@ -0,0 +1,67 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_workers_need_shared_state():
+    result = subprocess.run(
+        [sys.executable, "-m", "api", "run", "--workers", "2"],
+        capture_output=True,
+        text=True,
+        timeout=30,
+    )
+
+    assert result.returncode != 0
+    assert 'cache.backend = "memory"' in result.stderr
+
+
+def test_prefork_workers_serve_and_stop_gracefully():
+    pytest.importorskip("redis")
+    port = free_port()
+    # Nothing has to listen there, the cache degrades to misses
+    redis_url = os.environ.get("TEST_REDIS_URL", "redis://127.0.0.1:1/0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "api", "run", "--port", str(port)]
+        + ["--workers", "2", "--graceful-timeout", "5"],
+        env={
+            **os.environ,
+            "PYTHONUNBUFFERED": "1",
+            "SERVER_CACHE__BACKEND": "redis",
+            "SERVER_CACHE__URL": redis_url,
+            "SERVER_SEARCH__BACKEND": "postgres",
+        },
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                response = httpx.get(
+                    f"http://127.0.0.1:{port}/internal/metrics",
+                    headers={"Authorization": "Bearer TEST_METRICS_TOKEN"},
+                )
+                break
+            except httpx.TransportError:
+                assert time.monotonic() < deadline, "server didn't start"
+                time.sleep(0.2)
+
+        assert response.status_code == 200
+    finally:
+        server.send_signal(signal.SIGTERM)
+        _, logs = server.communicate(timeout=30)
+
+    assert server.returncode == 0
+    assert logs.count("Started server process") == 2
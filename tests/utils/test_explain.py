@@ -0,0 +1,16 @@
+import pytest
+from sqlmodel import Session, select
+
+from api.models import Product
+from api.utils.explain import HOT_QUERIES, explain
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_queries_use_indexes(session: Session, name: str):
+    assert explain(session, HOT_QUERIES[name]()) == []
+
+
+def test_unindexed_predicate_is_flagged(session: Session):
+    query = select(Product).where(Product.header == "header")
+
+    assert explain(session, query) == ["product"]
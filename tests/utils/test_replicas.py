@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from api.db import async_engine, async_uri
+from api.utils.replicas import ReplicaRouter, _Replica
+
+
+def test_round_robin_over_healthy_replicas():
+    replicas = [create_async_engine(async_uri) for _ in range(2)]
+    router = ReplicaRouter(async_engine, replicas)
+
+    picked = [asyncio.run(router.get_engine()) for _ in range(4)]
+
+    assert picked == replicas * 2
+
+
+def test_unhealthy_replica_falls_back_to_primary():
+    replica = create_async_engine("sqlite+aiosqlite:////missing/dir/db.sqlite")
+    router = ReplicaRouter(async_engine, [replica])
+
+    assert asyncio.run(router.get_engine()) is async_engine
+    assert router.stats()["healthy"] == 0
+
+
+def test_recent_writer_reads_from_primary():
+    replica = create_async_engine(async_uri)
+    router = ReplicaRouter(async_engine, [replica])
+
+    router.record_write("auth_user")
+
+    assert asyncio.run(router.get_engine("auth_user")) is async_engine
+    assert asyncio.run(router.get_engine("other_user")) is replica
+
+
+def test_health_check_does_not_wait_on_a_hanging_replica(monkeypatch):
+    replica = create_async_engine(async_uri)
+    router = ReplicaRouter(
+        async_engine,
+        [replica],
+        health_check_interval=0,
+        health_check_timeout=0.05,
+    )
+
+    async def hang(self):
+        await asyncio.sleep(10)
+
+    async def pick_twice():
+        first = await router.get_engine()
+        monkeypatch.setattr(_Replica, "_ping", hang)
+        started_at = time.perf_counter()
+        second = await router.get_engine()
+        waited = time.perf_counter() - started_at
+        await asyncio.sleep(0.1)
+        return first, second, waited, await router.get_engine()
+
+    first, second, waited, third = asyncio.run(pick_twice())
+
+    assert first is replica and second is replica
+    assert waited < 0.05
+    # The background probe timed out and marked it down
+    assert third is async_engine
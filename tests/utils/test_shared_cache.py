@@ -0,0 +1,260 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.auth import user_cache
+from api.models import User
+from api.utils.shared_cache import (
+    UNKNOWN_GENERATION,
+    CacheUnavailable,
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+    SharedCache,
+)
+from tests.factories import UserFactory
+
+BACKENDS = ["memory"]
+if os.environ.get("TEST_REDIS_URL"):
+    BACKENDS.append("redis")
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    if request.param == "memory":
+        return InMemoryCacheBackend(maxsize=100)
+    return RedisCacheBackend.from_url(
+        os.environ["TEST_REDIS_URL"], prefix=f"test-{uuid4().hex}"
+    )
+
+
+def test_entries_expire(backend):
+    cache = SharedCache(backend, "ns", ttl=0.05)
+    cache.set("a", {"value": 1})
+    cache.set(("b", 2), "long", ttl=10)
+
+    assert cache.get("a") == {"value": 1}
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.get(("b", 2)) == "long"
+
+
+def test_invalidate_tags(backend):
+    cache = SharedCache(backend, "ns", ttl=10)
+    other = SharedCache(backend, "other", ttl=10)
+    cache.set("shoe", 1, tags=["product:SHOE", "category:1"])
+    cache.set("boot", 2, tags=["product:BOOT", "category:2"])
+    cache.set("listing", 3, tags=["catalog"])
+    other.set("shoe", 4, tags=["product:SHOE"])
+
+    assert cache.invalidate_tags("product:SHOE") == 1
+    assert cache.get("shoe") is None
+    assert cache.get("boot") == 2
+    assert other.get("shoe") == 4
+
+    assert cache.invalidate_tags("category:*") == 1
+    assert cache.get("boot") is None
+    assert cache.get("listing") == 3
+
+
+def test_clear_drops_only_the_namespace(backend):
+    cache = SharedCache(backend, "ns", ttl=10)
+    other = SharedCache(backend, "other", ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    other.set("a", 3)
+
+    assert len(cache) == 2
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.get("a") is None
+    assert other.get("a") == 3
+
+
+def test_set_after_clear_is_dropped(backend):
+    cache = SharedCache(backend, "ns", ttl=10)
+    # Another worker's view of the same namespace
+    other = SharedCache(backend, "ns", ttl=10)
+    generation = cache.generation()
+
+    other.clear()
+
+    assert not cache.set("a", "stale", generation=generation)
+    assert cache.get("a") is None
+    assert cache.set("a", "fresh", generation=cache.generation())
+    assert other.get("a") == "fresh"
+
+
+FLAKY_METHODS = {
+    "get",
+    "set",
+    "delete",
+    "invalidate_tags",
+    "generation",
+    "bump_generation",
+}
+
+
+class FlakyBackend(InMemoryCacheBackend):
+    """Blocking backend that can be taken down"""
+
+    blocking = True
+
+    def __init__(self, maxsize: int, delay: float = 0):
+        super().__init__(maxsize)
+        self.down = False
+        self.delay = delay
+
+    def __getattribute__(self, name):
+        method = super().__getattribute__(name)
+        if name not in FLAKY_METHODS:
+            return method
+
+        def call(*args):
+            if self.down:
+                raise CacheUnavailable()
+            time.sleep(self.delay)
+            return method(*args)
+
+        return call
+
+
+def test_missed_invalidations_are_replayed():
+    backend = FlakyBackend(maxsize=100)
+    cache = SharedCache(backend, "ns", ttl=10)
+    cache.set("a", 1, tags=["x"])
+    cache.set("b", 2)
+    cache.delete("b")
+    cache.set("b", 2)
+    cache.set("c", 3)
+
+    backend.down = True
+    assert cache.invalidate_tags("x") == 0
+    cache.delete("b")
+    backend.down = False
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    generation = cache.generation()
+    backend.down = True
+    cache.clear()
+    backend.down = False
+
+    assert cache.get("c") is None
+    assert cache.generation() > generation
+
+
+def test_defer_keeps_a_blocking_backend_off_the_loop():
+    cache = SharedCache(FlakyBackend(maxsize=100, delay=0.2), "ns", ttl=10)
+    cache.backend.delay = 0
+    cache.set("a", 1, tags=["x"])
+    cache.backend.delay = 0.2
+
+    async def main():
+        started_at = time.monotonic()
+        cache.defer(cache.invalidate_tags, "x")
+        waited = time.monotonic() - started_at
+        await asyncio.gather(*cache._deferred)
+        return waited
+
+    assert asyncio.run(main()) < 0.1
+    cache.backend.delay = 0
+    assert cache.get("a") is None
+
+
+def test_get_or_set_single_flight(backend):
+    cache = SharedCache(backend, "ns", ttl=10, lock_poll_interval=0.005)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(
+            pool.map(lambda _: cache.get_or_set("key", loader), range(8))
+        )
+
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert cache.stats()["lock_waits"] > 0
+
+
+def test_aget_or_set_single_flight(backend):
+    cache = SharedCache(backend, "ns", ttl=10, lock_poll_interval=0.005)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.aget_or_set("key", loader) for _ in range(8))
+        )
+
+    assert asyncio.run(main()) == ["value"] * 8
+    assert len(calls) == 1
+
+
+def test_lock_gives_up_after_timeout():
+    cache = SharedCache(InMemoryCacheBackend(10), "ns", 10, lock_timeout=0.05)
+
+    with cache.lock("key"):
+        started_at = time.monotonic()
+        with cache.lock("key"):
+            waited = time.monotonic() - started_at
+
+    assert 0.05 <= waited < 1
+
+
+def test_unreachable_redis_degrades_to_misses():
+    pytest.importorskip("redis")
+    # Nothing listens on port 1
+    backend = RedisCacheBackend.from_url(
+        "redis://127.0.0.1:1/0", socket_connect_timeout=0.2
+    )
+    cache = SharedCache(backend, "ns", ttl=10, lock_timeout=1)
+
+    assert cache.get("a") is None
+    assert cache.get_or_set("a", lambda: "loaded") == "loaded"
+    assert asyncio.run(cache.aget("a")) is None
+    assert not cache.set("a", 1)
+    assert cache.generation() == UNKNOWN_GENERATION
+    cache.clear()
+    assert len(cache) == 0
+
+    # Skipped without waiting on the socket until retry_seconds pass
+    started_at = time.monotonic()
+    assert cache.get_or_set("b", lambda: "loaded") == "loaded"
+    assert time.monotonic() - started_at < 0.1
+    assert backend.stats() == {"failures": 1, "available": False}
+
+
+def test_user_change_invalidates_both_cached_keys(client: TestClient, session):
+    user_id = UserFactory.create(username="cached").id
+    client.post(
+        "/auth/token",
+        data={"username": "cached", "password": "pass123"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    snapshot = user_cache.get(("username", "cached"))
+    assert snapshot is not None
+    assert "password" not in snapshot
+
+    user = session.get(User, user_id)
+    user.username = "renamed"
+    session.add(user)
+    session.commit()
+
+    assert user_cache.get(("username", "cached")) is None
+    assert user_cache.get(("id", user_id)) is None